@@ -71,6 +71,8 @@ flags.DEFINE_enum("bot_build", "random", sc2_env.BotBuild._member_names_,  # pyl
 
 flags.DEFINE_bool("profile", False, "Whether to turn on code profiling.")
 flags.DEFINE_bool("trace", False, "Whether to trace the code execution.")
+flags.DEFINE_string("timeline", None,
+                    "Where to write a Chrome trace of the latest calls.")
 flags.DEFINE_integer("parallel", 1, "How many instances to run in parallel.")
 
 flags.DEFINE_bool("save_replay", True, "Whether to save a replay at the end.")
@@ -109,6 +111,8 @@ def main(unused_argv):
   """Run an agent."""
   if FLAGS.trace:
     stopwatch.sw.trace()
+  elif FLAGS.timeline:
+    stopwatch.sw.timeline()
   elif FLAGS.profile:
     stopwatch.sw.enable()
 
@@ -149,6 +153,8 @@ def main(unused_argv):
 
   if FLAGS.profile:
     print(stopwatch.sw)
+  if FLAGS.timeline:
+    stopwatch.sw.dump_timeline(FLAGS.timeline)
 
 
 def entry_point():  # Needed so setup.py scripts work.
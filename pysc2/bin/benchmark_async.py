@@ -0,0 +1,85 @@
+#!/usr/bin/python
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark threaded vs asyncio controllers against fake SC2 servers."""
+
+import asyncio
+import time
+
+from absl import app
+from absl import flags
+
+from pysc2.lib import async_remote_controller
+from pysc2.lib import fake_sc2_server
+from pysc2.lib import remote_controller
+from pysc2.lib import run_parallel
+
+
+flags.DEFINE_list("games", ["1", "4", "16", "64"],
+                  "How many games to drive at once.")
+flags.DEFINE_integer("count", 200, "How many steps to run per game.")
+flags.DEFINE_integer("step_mul", 8, "How many game steps per step.")
+flags.DEFINE_float("step_latency", 0.0001,
+                   "Simulated seconds per game loop of a step.")
+flags.DEFINE_float("observation_latency", 0.001,
+                   "Simulated seconds per observation.")
+FLAGS = flags.FLAGS
+
+
+def run_threaded(server, num_games):
+  """Drive the games with one thread per controller, like SC2Env does."""
+  controllers = [remote_controller.RemoteController(server.host, server.port)
+                 for _ in range(num_games)]
+  parallel = run_parallel.RunParallel()
+  start = time.time()
+  for _ in range(FLAGS.count):
+    parallel.run((c.step, FLAGS.step_mul) for c in controllers)
+    parallel.run(c.observe for c in controllers)
+  elapsed = time.time() - start
+  parallel.run(c.quit for c in controllers)
+  parallel.shutdown()
+  return elapsed
+
+
+def run_async(server, num_games):
+  """Drive the games with a single event loop."""
+  async def run():
+    controllers = await asyncio.gather(*[
+        async_remote_controller.AsyncRemoteController.connect(
+            server.host, server.port) for _ in range(num_games)])
+    start = time.time()
+    for _ in range(FLAGS.count):
+      await asyncio.gather(*[c.step(FLAGS.step_mul) for c in controllers])
+      await asyncio.gather(*[c.observe() for c in controllers])
+    elapsed = time.time() - start
+    await asyncio.gather(*[c.quit() for c in controllers])
+    return elapsed
+  return asyncio.run(run())
+
+
+def main(unused_argv):
+  print("%8s %16s %16s" % ("games", "threaded steps/s", "asyncio steps/s"))
+  with fake_sc2_server.FakeSC2Server(
+      step_latency=FLAGS.step_latency,
+      observation_latency=FLAGS.observation_latency) as server:
+    for num_games in map(int, FLAGS.games):
+      total_steps = num_games * FLAGS.count
+      threaded = run_threaded(server, num_games)
+      async_ = run_async(server, num_games)
+      print("%8d %16.1f %16.1f" % (
+          num_games, total_steps / threaded, total_steps / async_))
+
+
+if __name__ == "__main__":
+  app.run(main)
@@ -15,6 +15,7 @@
 """Dump out stats about all the actions that are in use in a set of replays."""
 
 import collections
+import functools
 import multiprocessing
 import os
 import queue
@@ -33,15 +34,20 @@ from pysc2.lib import protocol
 from pysc2.lib import remote_controller
 from pysc2.lib import replay
 from pysc2.lib import static_data
+from pysc2.lib.replay import replay_index
 
 from pysc2.lib import gfile
 from s2clientprotocol import common_pb2 as sc_common
 from s2clientprotocol import sc2api_pb2 as sc_pb
+from s2protocol import decoders as s2decoders
 
 FLAGS = flags.FLAGS
 flags.DEFINE_integer("parallel", 1, "How many instances to run in parallel.")
 flags.DEFINE_integer("step_mul", 8, "How many game steps per observation.")
 flags.DEFINE_string("replays", None, "Path to a directory of replays.")
+flags.DEFINE_string("replay_index", None,
+                    "Optional path to a replay index, which is created or "
+                    "updated, and then used instead of reading the replays.")
 flags.mark_flag_as_required("replays")
 
 
@@ -179,66 +185,130 @@ def valid_replay(info, ping):
   return True
 
 
+class ReplayScheduler(object):
+  """Decides which replay each worker should process next.
+
+  Replays are bucketed by build, so each worker can keep running the binary
+  that matches. Within a bucket the longest replays go first, so the short ones
+  fill in the gaps at the end rather than one long replay leaving the other
+  workers idle. Workers whose bucket is empty move to the bucket with the most
+  game loops left per worker.
+  """
+
+  def __init__(self, replays):
+    """Create the scheduler.
+
+    Args:
+      replays: A list of `(build, game_duration_loops, replay_path)` tuples.
+    """
+    self._lock = threading.Lock()
+    self._buckets = collections.defaultdict(list)
+    self._loops_left = collections.defaultdict(int)
+    self._workers = collections.defaultdict(set)  # build -> proc_ids.
+    for build, loops, replay_path in sorted(replays, key=lambda r: r[1]):
+      self._buckets[build].append((loops, replay_path))  # Longest is last.
+      self._loops_left[build] += loops
+
+  def next_replay(self, proc_id, build):
+    """Returns the `(build, replay_path)` to process next, or None if done."""
+    with self._lock:
+      if not self._buckets.get(build):
+        self._workers[build].discard(proc_id)
+        build = self._busiest_build()
+        if build is None:
+          return None
+        self._workers[build].add(proc_id)
+      loops, replay_path = self._buckets[build].pop()
+      self._loops_left[build] -= loops
+      if not self._buckets[build]:
+        del self._buckets[build]
+      return build, replay_path
+
+  def _busiest_build(self):
+    if not self._buckets:
+      return None
+    return max(self._buckets, key=lambda b: (  # Break ties deterministically.
+        self._loops_left[b] / (len(self._workers[b]) + 1), b))
+
+
 class ReplayProcessor(multiprocessing.Process):
   """A Process that pulls replays and processes them."""
 
-  def __init__(self, proc_id, run_config, replay_queue, stats_queue):
+  def __init__(self, proc_id, run_configs_by_build, request_queue,
+               replay_queue, stats_queue):
     super(ReplayProcessor, self).__init__()
     self.stats = ProcessStats(proc_id)
-    self.run_config = run_config
+    self.run_configs_by_build = run_configs_by_build
+    self.request_queue = request_queue
     self.replay_queue = replay_queue
     self.stats_queue = stats_queue
 
+  def _next_replay(self, build):
+    """Ask the scheduler for a replay, preferring one from `build`."""
+    self.request_queue.put((self.stats.proc_id, build))
+    return self.replay_queue.get()
+
   def run(self):
     signal.signal(signal.SIGTERM, lambda a, b: sys.exit())  # Exit quietly.
     self._update_stage("spawn")
     replay_name = "none"
+    build = None
+    next_replay = None  # A `(build, replay_path)` that hasn't been started.
     while True:
-      self._print("Starting up a new SC2 instance.")
+      if next_replay is None:
+        next_replay = self._next_replay(build)
+        if next_replay is None:
+          self._update_stage("done")
+          self._print("No replays left, returning")
+          return
+      build = next_replay[0]
+      run_config = self.run_configs_by_build[build]
+      self._print("Starting up a new SC2 instance for build %s." % build)
       self._update_stage("launch")
       try:
-        with self.run_config.start(
+        with run_config.start(
             want_rgb=interface.HasField("render")) as controller:
           self._print("SC2 Started successfully.")
           ping = controller.ping()
           for _ in range(300):
-            try:
-              replay_path = self.replay_queue.get()
-            except queue.Empty:
-              self._update_stage("done")
-              self._print("Empty queue, returning")
-              return
-            try:
-              replay_name = os.path.basename(replay_path)[:10]
-              self.stats.replay = replay_name
-              self._print("Got replay: %s" % replay_path)
-              self._update_stage("open replay file")
-              replay_data = self.run_config.replay_data(replay_path)
-              self._update_stage("replay_info")
-              info = controller.replay_info(replay_data)
-              self._print((" Replay Info %s " % replay_name).center(60, "-"))
-              self._print(info)
-              self._print("-" * 60)
-              if valid_replay(info, ping):
-                self.stats.replay_stats.maps[info.map_name] += 1
-                for player_info in info.player_info:
-                  race_name = sc_common.Race.Name(
-                      player_info.player_info.race_actual)
-                  self.stats.replay_stats.races[race_name] += 1
-                map_data = None
-                if info.local_map_path:
-                  self._update_stage("open map file")
-                  map_data = self.run_config.map_data(info.local_map_path)
-                for player_id in [1, 2]:
-                  self._print("Starting %s from player %s's perspective" % (
-                      replay_name, player_id))
-                  self.process_replay(controller, replay_data, map_data,
-                                      player_id)
-              else:
-                self._print("Replay is invalid.")
-                self.stats.replay_stats.invalid_replays.add(replay_name)
-            finally:
-              self.replay_queue.task_done()
+            if next_replay is None:
+              next_replay = self._next_replay(build)
+              if next_replay is None:
+                self._update_stage("done")
+                self._print("No replays left, returning")
+                return
+            if next_replay[0] != build:
+              break  # Needs a different binary.
+            replay_path = next_replay[1]
+            next_replay = None
+            replay_name = os.path.basename(replay_path)[:10]
+            self.stats.replay = replay_name
+            self._print("Got replay: %s" % replay_path)
+            self._update_stage("open replay file")
+            replay_data = run_config.replay_data(replay_path)
+            self._update_stage("replay_info")
+            info = controller.replay_info(replay_data)
+            self._print((" Replay Info %s " % replay_name).center(60, "-"))
+            self._print(info)
+            self._print("-" * 60)
+            if valid_replay(info, ping):
+              self.stats.replay_stats.maps[info.map_name] += 1
+              for player_info in info.player_info:
+                race_name = sc_common.Race.Name(
+                    player_info.player_info.race_actual)
+                self.stats.replay_stats.races[race_name] += 1
+              map_data = None
+              if info.local_map_path:
+                self._update_stage("open map file")
+                map_data = run_config.map_data(info.local_map_path)
+              for player_id in [1, 2]:
+                self._print("Starting %s from player %s's perspective" % (
+                    replay_name, player_id))
+                self.process_replay(controller, replay_data, map_data,
+                                    player_id)
+            else:
+              self._print("Replay is invalid.")
+              self.stats.replay_stats.invalid_replays.add(replay_name)
           self._update_stage("shutdown")
       except (protocol.ConnectionError, protocol.ProtocolError,
               remote_controller.RequestError):
@@ -348,10 +418,26 @@ def stats_printer(stats_queue):
     print("=" * width)
 
 
-def replay_queue_filler(replay_queue, replay_list):
-  """A thread that fills the replay_queue with replay filenames."""
-  for replay_path in replay_list:
-    replay_queue.put(replay_path)
+def replay_header(run_config, replay_path):
+  """Returns `(replay_path, version, game_duration_loops)` for a replay."""
+  try:
+    version, loops = replay.get_replay_header(
+        run_config.replay_data(replay_path))
+  except (IOError, KeyError, ValueError, s2decoders.CorruptedError,
+          s2decoders.TruncatedError):
+    return replay_path, None, 0  # Probably corrupt.
+  return replay_path, version, loops
+
+
+def replay_scheduler(scheduler, request_queue, replay_queues):
+  """A thread that answers the workers' requests for replays."""
+  remaining = len(replay_queues)
+  while remaining:
+    proc_id, build = request_queue.get()
+    next_replay = scheduler.next_replay(proc_id, build)
+    replay_queues[proc_id].put(next_replay)
+    if next_replay is None:
+      remaining -= 1
 
 
 def main(unused_argv):
@@ -364,39 +450,73 @@ def main(unused_argv):
   stats_queue = multiprocessing.Queue()
   stats_thread = threading.Thread(target=stats_printer, args=(stats_queue,))
   try:
-    # For some reason buffering everything into a JoinableQueue makes the
-    # program not exit, so save it into a list then slowly fill it into the
-    # queue in a separate thread. Grab the list synchronously so we know there
-    # is work in the queue before the SC2 processes actually run, otherwise
-    # The replay_queue.join below succeeds without doing any work, and exits.
     print("Getting replay list:", FLAGS.replays)
     replay_list = sorted(run_config.replay_paths(FLAGS.replays))
     print(len(replay_list), "replays found.")
     if not replay_list:
       return
 
-    if not FLAGS["sc2_version"].present:  # ie not set explicitly.
-      version = replay.get_replay_version(
-          run_config.replay_data(replay_list[0]))
-      run_config = run_configs.get(version=version)
-      print("Assuming version:", version.game_version)
+    # Read the replay headers in parallel, which is much faster than asking SC2
+    # for the replay info, and lets us launch the right binary for each one.
+    if FLAGS.replay_index:
+      print("Updating the replay index:", FLAGS.replay_index)
+      with replay_index.ReplayIndex(FLAGS.replay_index) as index:
+        index.update(replay_list, parallel=FLAGS.parallel)
+        headers = []
+        for replay_path in replay_list:
+          entry = index.get(replay_path)
+          headers.append((replay_path,
+                          None if entry.error else entry.version,
+                          entry.game_duration_loops))
+    else:
+      print("Reading replay headers.")
+      with multiprocessing.Pool(FLAGS.parallel) as pool:
+        headers = pool.map(functools.partial(replay_header, run_config),
+                           replay_list, chunksize=16)
+
+    replays = []
+    run_configs_by_build = {}
+    for replay_path, version, loops in headers:
+      if version is None:
+        print("Failed to read the header of:", replay_path)
+        continue
+      if FLAGS["sc2_version"].present:  # ie set explicitly.
+        # Use the requested binary for everything. Replays from other builds
+        # are then rejected by `valid_replay`.
+        build = run_config.version.build_version
+        run_configs_by_build[build] = run_config
+      else:
+        build = version.build_version
+        if build not in run_configs_by_build:
+          run_configs_by_build[build] = run_configs.get(version=version)
+      replays.append((build, loops, replay_path))
+    print(len(replays), "replays across builds:", sorted(run_configs_by_build))
+    if not replays:
+      return
 
     print()
 
     stats_thread.start()
-    replay_queue = multiprocessing.JoinableQueue(FLAGS.parallel * 10)
-    replay_queue_thread = threading.Thread(target=replay_queue_filler,
-                                           args=(replay_queue, replay_list))
-    replay_queue_thread.daemon = True
-    replay_queue_thread.start()
-
-    for i in range(min(len(replay_list), FLAGS.parallel)):
-      p = ReplayProcessor(i, run_config, replay_queue, stats_queue)
+    num_procs = min(len(replays), FLAGS.parallel)
+    request_queue = multiprocessing.Queue()
+    replay_queues = [multiprocessing.Queue() for _ in range(num_procs)]
+    scheduler_thread = threading.Thread(
+        target=replay_scheduler,
+        args=(ReplayScheduler(replays), request_queue, replay_queues))
+    scheduler_thread.daemon = True
+    scheduler_thread.start()
+
+    procs = []
+    for i in range(num_procs):
+      p = ReplayProcessor(i, run_configs_by_build, request_queue,
+                          replay_queues[i], stats_queue)
       p.daemon = True
       p.start()
+      procs.append(p)
       time.sleep(1)  # Stagger startups, otherwise they seem to conflict somehow
 
-    replay_queue.join()  # Wait for the queue to empty.
+    for p in procs:
+      p.join()  # Wait for the replays to run out.
   except KeyboardInterrupt:
     print("Caught KeyboardInterrupt, exiting.")
   finally:
@@ -14,17 +14,125 @@
 
 #include "pysc2/env/converter/cc/converter.h"
 
+#include <algorithm>
+#include <cstdint>
 #include <memory>
 #include <stdexcept>
+#include <string>
+#include <utility>
+#include <vector>
 
 #include "absl/status/statusor.h"
 #include "absl/strings/string_view.h"
 #include "dm_env_rpc/v1/dm_env_rpc.pb.h"
 #include "pysc2/env/converter/proto/converter.pb.h"
+#include "pybind11/numpy.h"
 #include "pybind11/pybind11.h"
 #include "pybind11/stl.h"
 
 namespace {
+
+// Views the bytes without copying them into a std::string.
+absl::string_view BytesView(const pybind11::bytes& bytes) {
+  char* data;
+  Py_ssize_t size;
+  if (PyBytes_AsStringAndSize(bytes.ptr(), &data, &size) != 0) {
+    throw pybind11::error_already_set();
+  }
+  return absl::string_view(data, size);
+}
+
+// Wraps the payload of `tensor` in a numpy array without copying it. The
+// array takes ownership of the tensor, which is freed with the array. Shapes
+// follow dm_env_rpc's reshape_array: a tensor without a shape must hold a
+// single value, returned as a 0-d array, and a single value fills the whole
+// shape, which needs a copy.
+template <typename T>
+pybind11::array ArrayFromPayload(std::unique_ptr<dm_env_rpc::v1::Tensor> tensor,
+                                 const T* data, int64_t size) {
+  std::vector<pybind11::ssize_t> shape(tensor->shape().begin(),
+                                       tensor->shape().end());
+  if (shape.empty()) {
+    if (size != 1) {
+      throw std::runtime_error(
+          "Scalar tensors must have exactly 1 element but had " +
+          std::to_string(size) + " elements.");
+    }
+  } else if (size == 1) {
+    for (auto& dim : shape) {
+      dim = std::max<pybind11::ssize_t>(dim, 1);
+    }
+    pybind11::array_t<T> array(shape);
+    std::fill(array.mutable_data(), array.mutable_data() + array.size(),
+              data[0]);
+    return array;
+  } else {
+    int64_t known_size = 1;
+    int64_t unknown_dim = -1;
+    for (size_t i = 0; i < shape.size(); ++i) {
+      if (shape[i] < 0) {
+        unknown_dim = static_cast<int64_t>(i);
+      } else {
+        known_size *= shape[i];
+      }
+    }
+    if (unknown_dim >= 0 && known_size > 0) {
+      shape[unknown_dim] = size / known_size;
+      known_size *= shape[unknown_dim];
+    }
+    if (known_size != size) {
+      throw std::runtime_error("Tensor payload of " + std::to_string(size) +
+                               " elements doesn't match its shape.");
+    }
+  }
+  pybind11::capsule owner(tensor.release(), [](void* t) {
+    delete static_cast<dm_env_rpc::v1::Tensor*>(t);
+  });
+  return pybind11::array_t<T>(shape, data, owner);
+}
+
+pybind11::array TensorToArray(dm_env_rpc::v1::Tensor&& tensor) {
+  auto owned = std::make_unique<dm_env_rpc::v1::Tensor>(std::move(tensor));
+  const dm_env_rpc::v1::Tensor& t = *owned;
+  switch (t.payload_case()) {
+    case dm_env_rpc::v1::Tensor::kFloats:
+      return ArrayFromPayload(std::move(owned), t.floats().array().data(),
+                              t.floats().array_size());
+    case dm_env_rpc::v1::Tensor::kDoubles:
+      return ArrayFromPayload(std::move(owned), t.doubles().array().data(),
+                              t.doubles().array_size());
+    case dm_env_rpc::v1::Tensor::kInt8S:
+      return ArrayFromPayload(
+          std::move(owned),
+          reinterpret_cast<const int8_t*>(t.int8s().array().data()),
+          t.int8s().array().size());
+    case dm_env_rpc::v1::Tensor::kInt32S:
+      return ArrayFromPayload(std::move(owned), t.int32s().array().data(),
+                              t.int32s().array_size());
+    case dm_env_rpc::v1::Tensor::kInt64S:
+      return ArrayFromPayload(std::move(owned), t.int64s().array().data(),
+                              t.int64s().array_size());
+    case dm_env_rpc::v1::Tensor::kUint8S:
+      return ArrayFromPayload(
+          std::move(owned),
+          reinterpret_cast<const uint8_t*>(t.uint8s().array().data()),
+          t.uint8s().array().size());
+    case dm_env_rpc::v1::Tensor::kUint32S:
+      return ArrayFromPayload(std::move(owned), t.uint32s().array().data(),
+                              t.uint32s().array_size());
+    case dm_env_rpc::v1::Tensor::kUint64S:
+      return ArrayFromPayload(std::move(owned), t.uint64s().array().data(),
+                              t.uint64s().array_size());
+    case dm_env_rpc::v1::Tensor::kBools:
+      return ArrayFromPayload(std::move(owned), t.bools().array().data(),
+                              t.bools().array_size());
+    default:
+      throw std::runtime_error(
+          "Unhandled payload case when converting tensor to an array: " +
+          std::to_string(t.payload_case()));
+  }
+}
+
 class ConverterWrapper {
   // The wrapper serializes and deserializes protos at the
   // pybind11 boundaries since proto formats are inconsistent downstream
@@ -73,6 +181,30 @@ class ConverterWrapper {
     }
     return serialized_obs;
   }
+  // Like ConvertObservation, but returns numpy arrays that share memory with
+  // the converted tensors, rather than serialized tensors.
+  std::map<std::string, pybind11::array> ConvertObservationArrays(
+      const pybind11::bytes& observation) {
+    pysc2::Observation deserialized_obs;
+    absl::string_view view = BytesView(observation);
+    if (!deserialized_obs.ParseFromArray(view.data(), view.size())) {
+      throw std::runtime_error("Failed to parse the observation.");
+    }
+    absl::StatusOr<absl::flat_hash_map<std::string, dm_env_rpc::v1::Tensor>>
+        converted_obs_or;
+    {
+      pybind11::gil_scoped_release release;
+      converted_obs_or = converter_.ConvertObservation(deserialized_obs);
+    }
+    if (!converted_obs_or.ok()) {
+      throw std::runtime_error(converted_obs_or.status().ToString());
+    }
+    std::map<std::string, pybind11::array> arrays;
+    for (auto& p : *converted_obs_or) {
+      arrays.emplace(p.first, TensorToArray(std::move(p.second)));
+    }
+    return arrays;
+  }
   pybind11::bytes ConvertAction(
       const std::map<std::string, pybind11::bytes>& action) {
     absl::flat_hash_map<std::string, dm_env_rpc::v1::Tensor>
@@ -117,6 +249,9 @@ PYBIND11_MODULE(converter, m) {
       .def("ActionSpec", &ConverterWrapper::ActionSpec)
       .def("ConvertObservation", &ConverterWrapper::ConvertObservation,
            pybind11::arg("observation"))
+      .def("ConvertObservationArrays",
+           &ConverterWrapper::ConvertObservationArrays,
+           pybind11::arg("observation"))
       .def("ConvertAction", &ConverterWrapper::ConvertAction,
            pybind11::arg("action"));
 
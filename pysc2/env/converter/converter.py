@@ -18,7 +18,7 @@ and numpy arrays in place of dm_env_rpc protos; also supports documentation
 more naturally.
 """
 
-from typing import Any, Mapping
+from typing import Any, Mapping, Optional
 
 from dm_env import specs
 from pysc2.env.converter.cc.python import converter
@@ -30,6 +30,45 @@ from dm_env_rpc.v1 import tensor_utils
 from s2clientprotocol import sc2api_pb2
 
 
+def _varint(value: int) -> bytes:
+  value &= (1 << 64) - 1  # Negative numbers are sent as 64 bit two's complement.
+  out = bytearray()
+  while value > 0x7f:
+    out.append((value & 0x7f) | 0x80)
+    value >>= 7
+  out.append(value)
+  return bytes(out)
+
+
+def _length_delimited(tag: int, value: bytes) -> bytes:
+  return _varint(tag << 3 | 2) + _varint(len(value)) + value
+
+
+def serialize_observation(player: bytes,
+                          opponent: Optional[bytes] = None,
+                          force_action: Optional[bytes] = None,
+                          force_action_delay: Optional[int] = None) -> bytes:
+  """Returns a serialized `converter_pb2.Observation` from its serialized parts.
+
+  The sub-messages are embedded as is, which is valid protobuf wire format, so
+  this is much cheaper than parsing them and building the proto.
+
+  Args:
+    player: A serialized `sc2api_pb2.ResponseObservation`.
+    opponent: Optionally a serialized `sc2api_pb2.ResponseObservation`.
+    force_action: Optionally a serialized `sc2api_pb2.RequestAction`.
+    force_action_delay: Optionally the delay until the next observation.
+  """
+  parts = [_length_delimited(1, player)]
+  if opponent is not None:
+    parts.append(_length_delimited(2, opponent))
+  if force_action is not None:
+    parts.append(_length_delimited(3, force_action))
+  if force_action_delay is not None:
+    parts.append(_varint(4 << 3) + _varint(force_action_delay))
+  return b''.join(parts)
+
+
 class Converter:
   """PySC2 environment converter.
 
@@ -49,10 +88,22 @@ class Converter:
   """
 
   def __init__(self, settings: converter_pb2.ConverterSettings,
-               environment_info: converter_pb2.EnvironmentInfo):
+               environment_info: converter_pb2.EnvironmentInfo,
+               array_observations: bool = False):
+    """Constructs the converter.
+
+    Args:
+      settings: The converter settings.
+      environment_info: The environment info.
+      array_observations: Experimental. If True, converted observations are
+        numpy arrays that share memory with the C++ tensors, rather than
+        serialized tensors that are unpacked in python. This saves a copy per
+        observation, but doesn't support string tensors.
+    """
     self._converter = converter.MakeConverter(
         settings=settings.SerializeToString(),
         environment_info=environment_info.SerializeToString())
+    self._array_observations = array_observations
 
   def observation_spec(self) -> Mapping[str, specs.Array]:
     """Returns the observation spec.
@@ -94,8 +145,46 @@ class Converter:
       A flat mapping of string labels to numpy arrays / or scalars, as
       appropriate.
     """
-    serialized_converted_obs = self._converter.ConvertObservation(
-        observation.SerializeToString())
+    return self._convert_serialized_observation(observation.SerializeToString())
+
+  def convert_observation_from_bytes(
+      self,
+      player: bytes,
+      opponent: Optional[bytes] = None,
+      force_action: Optional[bytes] = None,
+      force_action_delay: Optional[int] = None) -> Mapping[str, Any]:
+    """Converts serialized SC2 API observations, enriching them.
+
+    This is equivalent to `convert_observation`, but takes the serialized
+    `ResponseObservation` protos, for example as read from the SC2 websocket,
+    and so avoids parsing and re-serializing them in python.
+
+    Args:
+      player: The serialized `ResponseObservation` for the player.
+      opponent: Optionally the serialized `ResponseObservation` for the
+        opponent.
+      force_action: Optionally the serialized `RequestAction` taken by the
+        player in response to this observation, for supervised mode.
+      force_action_delay: Optionally the delay until the next observation, for
+        supervised mode.
+
+    Returns:
+      A flat mapping of string labels to numpy arrays / or scalars, as
+      appropriate.
+    """
+    return self._convert_serialized_observation(
+        serialize_observation(player, opponent, force_action,
+                              force_action_delay))
+
+  def _convert_serialized_observation(
+      self, observation: bytes) -> Mapping[str, Any]:
+    """Converts a serialized `converter_pb2.Observation`."""
+    if self._array_observations:
+      converted_obs = self._converter.ConvertObservationArrays(observation)
+      # Tensors without a shape are scalars, as from `unpack_tensor`.
+      return {k: v[()] if v.ndim == 0 else v for k, v in converted_obs.items()}
+
+    serialized_converted_obs = self._converter.ConvertObservation(observation)
 
     deserialized_converted_obs = {}
     for k, v in serialized_converted_obs.items():
@@ -380,6 +380,68 @@ class ConverterTest(parameterized.TestCase):
     for k in converted:
       self.assertIn(k, obs_spec)
 
+  def test_convert_observation_from_bytes(self, mode):
+    observation = _make_observation()
+    converted = converter.Converter(
+        settings=_make_converter_settings(mode),
+        environment_info=_make_dummy_env_info()).convert_observation(
+            observation)
+    converted_from_bytes = converter.Converter(
+        settings=_make_converter_settings(mode),
+        environment_info=_make_dummy_env_info(
+        )).convert_observation_from_bytes(
+            observation.player.SerializeToString())
+
+    self.assertCountEqual(converted, converted_from_bytes)
+    for k, v in converted.items():
+      np.testing.assert_array_equal(v, converted_from_bytes[k], err_msg=k)
+
+  def test_array_observations(self, mode):
+    observation = _make_observation()
+    converted = converter.Converter(
+        settings=_make_converter_settings(mode),
+        environment_info=_make_dummy_env_info()).convert_observation(
+            observation)
+    converted_arrays = converter.Converter(
+        settings=_make_converter_settings(mode),
+        environment_info=_make_dummy_env_info(),
+        array_observations=True).convert_observation(observation)
+
+    self.assertCountEqual(converted, converted_arrays)
+    for k, v in converted.items():
+      # Scalars are still scalars, rather than 0-d arrays.
+      self.assertEqual(
+          isinstance(v, np.ndarray), isinstance(converted_arrays[k],
+                                                np.ndarray), k)
+      self.assertEqual(np.asarray(v).dtype,
+                       np.asarray(converted_arrays[k]).dtype, k)
+      self.assertEqual(np.shape(v), np.shape(converted_arrays[k]), k)
+      np.testing.assert_array_equal(v, converted_arrays[k], err_msg=k)
+
+
+class SerializeObservationTest(absltest.TestCase):
+
+  def test_matches_proto(self):
+    observation = _make_observation()
+    observation.opponent.observation.game_loop = 300
+    observation.force_action.actions.add().action_chat.message = 'gg'
+    observation.force_action_delay = 7
+
+    serialized = converter.serialize_observation(
+        observation.player.SerializeToString(),
+        observation.opponent.SerializeToString(),
+        observation.force_action.SerializeToString(),
+        observation.force_action_delay)
+
+    self.assertEqual(converter_pb2.Observation.FromString(serialized),
+                     observation)
+
+  def test_player_only(self):
+    observation = _make_observation()
+    serialized = converter.serialize_observation(
+        observation.player.SerializeToString())
+    self.assertEqual(serialized, observation.SerializeToString())
+
 
 if __name__ == '__main__':
   absltest.main()
@@ -283,6 +283,7 @@ class LanSC2Env(sc2_env.SC2Env):
     self._score_multiplier = 1
     self._episode_length = sc2_env.MAX_STEP_COUNT
     self._ensure_available_actions = False
+    self._pipelined_step = False
     self._discount_zero_after_timeout = False
     self._parallel = run_parallel.RunParallel()  # Needed for multiplayer.
     self._game_info = None
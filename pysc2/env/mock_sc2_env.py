@@ -173,6 +173,8 @@ class SC2TestEnv(_TestEnvironment):
                random_seed=None,
                disable_fog=False,
                ensure_available_actions=True,
+               pipelined_step=False,
+               process_pool=None,
                version=None):
     """Initializes an SC2TestEnv.
 
@@ -202,6 +204,8 @@ class SC2TestEnv(_TestEnvironment):
       disable_fog: Unused.
       ensure_available_actions: Whether to throw an exception when an
         unavailable action is passed to step().
+      pipelined_step: Unused.
+      process_pool: Unused.
       version: Unused.
     Raises:
       ValueError: if args are passed.
@@ -219,6 +223,8 @@ class SC2TestEnv(_TestEnvironment):
     del random_seed  # Unused.
     del disable_fog  # Unused.
     del ensure_available_actions  # Unused.
+    del pipelined_step  # Unused.
+    del process_pool  # Unused.
     del version  # Unused.
 
     if realtime:
@@ -130,6 +130,7 @@ class RemoteSC2Env(sc2_env.SC2Env):
     self._score_multiplier = 1
     self._episode_length = sc2_env.MAX_STEP_COUNT
     self._ensure_available_actions = False
+    self._pipelined_step = False
     self._discount_zero_after_timeout = False
 
     self._run_config = run_configs.get()
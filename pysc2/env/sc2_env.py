@@ -15,7 +15,9 @@
 # pylint: disable=g-complex-comprehension
 
 import collections
+import contextlib
 import copy
+import functools
 import random
 import time
 
@@ -114,6 +116,8 @@ class SC2Env(environment.Base):
                random_seed=None,
                disable_fog=False,
                ensure_available_actions=True,
+               pipelined_step=False,
+               process_pool=None,
                version=None):
     """Create a SC2 Env.
 
@@ -171,6 +175,15 @@ class SC2Env(environment.Base):
       disable_fog: Whether to disable fog of war.
       ensure_available_actions: Whether to throw an exception when an
           unavailable action is passed to step().
+      pipelined_step: Whether step() should chain the action transform,
+          action, step and observation for each agent in a single worker
+          thread, rather than waiting for all agents between each phase. The
+          requests to SC2 are also pipelined into a single round trip. This
+          only applies when not in realtime mode and no action delays are
+          configured, otherwise the regular step is used.
+      process_pool: An optional `sc_process_pool.ProcessPool` to get the SC2
+          processes from, and to return them to on close, rather than
+          launching and killing them.
       version: The version of SC2 to use, defaults to the latest.
 
     Raises:
@@ -225,6 +238,8 @@ class SC2Env(environment.Base):
     self._random_seed = random_seed
     self._disable_fog = disable_fog
     self._ensure_available_actions = ensure_available_actions
+    self._pipelined_step = pipelined_step
+    self._process_pool = process_pool
     self._discount = discount
     self._discount_zero_after_timeout = discount_zero_after_timeout
     self._default_step_mul = step_mul
@@ -334,10 +349,20 @@ class SC2Env(environment.Base):
       self._ports = []
 
     # Actually launch the game processes.
-    self._sc2_procs = [
-        self._run_config.start(extra_ports=self._ports,
-                               want_rgb=interface.HasField("render"))
-        for interface in self._interface_options]
+    if self._process_pool:
+      # Multiplayer games save the map on every process, which only works
+      # before a game, and a single player game can't be left to get back
+      # there. A single player game can be created from within a game though.
+      self._sc2_procs = [
+          self._process_pool.start(self._run_config, extra_ports=self._ports,
+                                   want_rgb=interface.HasField("render"),
+                                   need_launched=self._num_agents > 1)
+          for interface in self._interface_options]
+    else:
+      self._sc2_procs = [
+          self._run_config.start(extra_ports=self._ports,
+                                 want_rgb=interface.HasField("render"))
+          for interface in self._interface_options]
     self._controllers = [p.controller for p in self._sc2_procs]
 
     if self._battle_net_map:
@@ -520,6 +545,10 @@ class SC2Env(environment.Base):
     if self._state == environment.StepType.LAST:
       return self.reset()
 
+    if (self._pipelined_step and not self._realtime and
+        not any(self._action_delay_fns)):
+      return self._step_pipelined(actions, step_mul)
+
     skip = not self._ensure_available_actions
     actions = [[f.transform_action(o.observation, a, skip_available=skip)
                 for a in to_list(acts)]
@@ -551,6 +580,44 @@ class SC2Env(environment.Base):
 
     return self._observe(target_game_loop=target_game_loop)
 
+  def _step_pipelined(self, actions, step_mul=None):
+    """Like `step`, but with one worker per agent running all the phases."""
+    step_mul = step_mul or self._step_mul
+    if step_mul <= 0:
+      raise ValueError("step_mul should be positive, got {}".format(step_mul))
+
+    target_game_loop = self._episode_steps + step_mul
+    # Transform every agent's actions before sending any, so an invalid action
+    # raises here rather than leaving the other agents stepped, waiting for it.
+    skip = not self._ensure_available_actions
+    actions = [[f.transform_action(o.observation, a, skip_available=skip)
+                for a in to_list(acts)]
+               for f, o, acts in zip(self._features, self._obs, actions)]
+    ended = self._controllers[0].status_ended  # May already have ended.
+
+    # Each worker only talks to its own controller, so the only barrier left is
+    # the one inside the game itself, which won't step until all have stepped.
+    # The agents move in lockstep, so only the first one's worker is timed.
+    def parallel_step(c, f, req_action, timed):
+      if not ended:
+        with (self._metrics.measure_step_time(step_mul) if timed
+              else contextlib.nullcontext()):
+          c.actions_step(req_action, count=step_mul)
+      with (self._metrics.measure_observation_time() if timed
+            else contextlib.nullcontext()):
+        obs = c.observe(target_game_loop=target_game_loop)
+        agent_obs = f.transform_obs(obs)
+      return obs, agent_obs
+
+    self._state = environment.StepType.MID
+    return self._observe(
+        target_game_loop=target_game_loop,
+        observe_fns=[
+            functools.partial(parallel_step, c, f,
+                              sc_pb.RequestAction(actions=a), i == 0)
+            for i, (c, f, a) in enumerate(zip(
+                self._controllers, self._features, actions))])
+
   def _apply_action_delays(self, actions):
     """Apply action delays to the requested actions, if configured to."""
     assert not self._realtime
@@ -612,17 +679,28 @@ class SC2Env(environment.Base):
         if not self._controllers[0].status_ended:  # May already have ended.
           self._parallel.run((c.step, step_mul) for c in self._controllers)
 
-  def _get_observations(self, target_game_loop):
+  def _get_observations(self, target_game_loop, observe_fns=None):
+    """Fetch and transform the observations, one per agent.
+
+    Args:
+      target_game_loop: The game loop the observations are expected to be from.
+      observe_fns: Optional functions, one per agent, that each return an
+          `(obs, agent_obs)` tuple, and record their own metrics. Defaults to
+          observing and transforming.
+    """
     # Transform in the thread so it runs while waiting for other observations.
     def parallel_observe(c, f):
       obs = c.observe(target_game_loop=target_game_loop)
       agent_obs = f.transform_obs(obs)
       return obs, agent_obs
 
-    with self._metrics.measure_observation_time():
-      self._obs, self._agent_obs = zip(*self._parallel.run(
-          (parallel_observe, c, f)
-          for c, f in zip(self._controllers, self._features)))
+    if observe_fns is None:
+      with self._metrics.measure_observation_time():
+        self._obs, self._agent_obs = zip(*self._parallel.run(
+            (parallel_observe, c, f)
+            for c, f in zip(self._controllers, self._features)))
+    else:
+      self._obs, self._agent_obs = zip(*self._parallel.run(observe_fns))
 
     game_loop = _get_game_loop(self._agent_obs[0])
     if (game_loop < target_game_loop and
@@ -654,8 +732,8 @@ class SC2Env(environment.Base):
                 break
       self._last_obs_game_loop = game_loop
 
-  def _observe(self, target_game_loop):
-    self._get_observations(target_game_loop)
+  def _observe(self, target_game_loop, observe_fns=None):
+    self._get_observations(target_game_loop, observe_fns)
 
     # TODO(tewalds): How should we handle more than 2 agents and the case where
     # the episode can end early for some agents?
@@ -746,6 +824,12 @@ class SC2Env(environment.Base):
       self._renderer_human = None
 
     # Don't use parallel since it might be broken by an exception.
+    if getattr(self, "_process_pool", None) and getattr(
+        self, "_sc2_procs", None):
+      for p in self._sc2_procs:
+        self._process_pool.release(p)
+      self._sc2_procs = None
+      self._controllers = None
     if hasattr(self, "_controllers") and self._controllers:
       for c in self._controllers:
         c.quit()
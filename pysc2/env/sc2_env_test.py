@@ -14,11 +14,15 @@
 # limitations under the License.
 """Test for sc2_env."""
 
+from unittest import mock
+
 from absl.testing import absltest
 from absl.testing import parameterized
 
 from pysc2.env import sc2_env
 
+from s2clientprotocol import sc2api_pb2 as sc_pb
+
 
 class TestNameCroppingAndDeduplication(parameterized.TestCase):
 
@@ -49,5 +53,44 @@ class TestNameCroppingAndDeduplication(parameterized.TestCase):
     self.assertEqual(sc2_env.crop_and_deduplicate_names(names), expected_output)
 
 
+class PipelinedStepTest(absltest.TestCase):
+
+  def testInvalidActionIsRaisedBeforeAnyAgentSteps(self):
+    env = sc2_env.SC2Env.__new__(sc2_env.SC2Env)
+    env._step_mul = 8
+    env._episode_steps = 0
+    env._ensure_available_actions = True
+    env._obs = [mock.Mock(), mock.Mock()]
+    env._controllers = [mock.Mock(), mock.Mock()]
+    env._features = [mock.Mock(), mock.Mock()]
+    env._features[1].transform_action.side_effect = ValueError("Bad action")
+
+    with self.assertRaisesRegex(ValueError, "Bad action"):
+      env._step_pipelined([[0], [0]])
+    for c in env._controllers:
+      c.actions_step.assert_not_called()
+
+
+class ProcessPoolTest(parameterized.TestCase):
+
+  @parameterized.parameters((1, False), (2, True))
+  @mock.patch.object(sc2_env.portspicker, "pick_unused_ports",
+                     lambda num_ports: list(range(num_ports)))
+  def testNeedLaunched(self, num_agents, need_launched):
+    env = sc2_env.SC2Env.__new__(sc2_env.SC2Env)
+    env._num_agents = num_agents
+    env._process_pool = mock.Mock()
+    env._run_config = mock.Mock()
+    env._interface_options = [sc_pb.InterfaceOptions()] * num_agents
+    env._battle_net_map = False
+
+    env._launch_game()
+    calls = env._process_pool.start.call_args_list
+    self.assertLen(calls, num_agents)
+    # Every process in a multiplayer game saves the map, even the host.
+    for call in calls:
+      self.assertEqual(call.kwargs["need_launched"], need_launched)
+
+
 if __name__ == "__main__":
   absltest.main()
@@ -0,0 +1,460 @@
+# Copyright 2021 DeepMind Technologies Ltd. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Run many `SC2Env`s in worker processes, and step them as a batch.
+
+The observations and actions are exchanged through shared memory numpy arrays,
+laid out from the observation and action specs, so only short commands go
+through the pipes to the workers:
+
+  env = VectorSC2Env([functools.partial(sc2_env.SC2Env, map_name=...)] * 8)
+  timesteps = env.reset()
+  while True:
+    function_ids, arguments = policy(timesteps[0].observation)
+    env.step_async(function_ids, arguments)
+    ...  # Do something else while the games step.
+    timesteps = env.step_wait()
+
+Each `TimeStep` is batched over the envs: `step_type`, `reward` and `discount`
+are arrays of shape [num_envs], and each observation is an array of shape
+[num_envs, ...]. Observations with a variable number of rows, like `raw_units`,
+are padded with zeros up to a maximum number of rows, and their actual lengths
+are in `observation.lengths`.
+
+An env that returned `StepType.LAST` is reset by the next `step_async`, with its
+actions ignored, so the batch keeps going without waiting for the others.
+
+If an env fails a step or reset, for example on an invalid or unavailable
+action, `step_wait` or `reset` raises a `RuntimeError` with the traceback of
+each env that failed, once all the envs have finished. The workers keep
+running. A failed env didn't step, so the next `step_async` steps it on from
+its previous observation, or resets it if that's what failed. The other envs
+did step. Call `reset` to start them all over, eg if an env's game is broken.
+"""
+
+import multiprocessing
+from multiprocessing import resource_tracker
+from multiprocessing import shared_memory
+import traceback
+
+from absl import logging
+import numpy as np
+from pysc2.env import environment
+from pysc2.lib import actions as actions_lib
+from pysc2.lib import named_array
+
+# How many rows to keep of variable length observations, unless overridden.
+_DEFAULT_MAX_ROWS = 512
+_TAG_ARGUMENTS = ("unit_tags", "target_unit_tag")
+
+
+class _SharedArrays(object):
+  """Numpy arrays in shared memory, created by the parent, used by workers."""
+
+  def __init__(self, buffers):
+    self._buffers = buffers  # key -> (SharedMemory, array)
+
+  @classmethod
+  def create(cls, specs):
+    """Create zeroed arrays for a dict of key -> (shape, dtype)."""
+    buffers = {}
+    for key, (shape, dtype) in specs.items():
+      dtype = np.dtype(dtype)
+      size = max(1, int(np.prod(shape)) * dtype.itemsize)
+      shm = shared_memory.SharedMemory(create=True, size=size)
+      array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+      array.fill(0)
+      buffers[key] = (shm, array)
+    return cls(buffers)
+
+  @classmethod
+  def attach(cls, layout):
+    """Attach to the arrays described by `layout` of another process."""
+    buffers = {}
+    for key, (name, shape, dtype) in layout.items():
+      shm = shared_memory.SharedMemory(name=name)
+      buffers[key] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+    return cls(buffers)
+
+  @property
+  def layout(self):
+    return {key: (shm.name, array.shape, array.dtype.str)
+            for key, (shm, array) in self._buffers.items()}
+
+  def __getitem__(self, key):
+    return self._buffers[key][1]
+
+  def close(self, unlink=False):
+    for shm, _ in self._buffers.values():
+      shm.close()
+      if unlink:
+        shm.unlink()
+    self._buffers = {}
+
+
+def _argument_width(arg_type):
+  """How many values an argument type takes in the action arrays."""
+  if arg_type.name in _TAG_ARGUMENTS:
+    return getattr(actions_lib.RAW_TYPES, arg_type.name).count
+  return len(arg_type.sizes)
+
+
+def _read_actions(arrays, index, action_specs):
+  """Read the `FunctionCall`s for env `index` from the shared arrays."""
+  func_calls = []
+  for agent, action_spec in enumerate(action_specs):
+    function_id = int(arrays["function", agent][index])
+    if not 0 <= function_id < len(action_spec.functions):
+      raise ValueError("Invalid function id: %s." % function_id)
+    arguments = []
+    for arg_type in action_spec.functions[function_id].args:
+      arg = arrays["argument", agent, arg_type.name][index]
+      if arg_type.name in _TAG_ARGUMENTS:
+        arg = arg[arg >= 0]
+      arguments.append(arg.tolist())
+    func_calls.append(actions_lib.FunctionCall(function_id, arguments))
+  return func_calls
+
+
+def _write_timesteps(arrays, index, timesteps, observation_layouts):
+  """Write the `TimeStep`s of env `index` to the shared arrays."""
+  arrays["step_type"][index] = timesteps[0].step_type
+  arrays["discount"][index] = timesteps[0].discount
+  for agent, (timestep, layout) in enumerate(
+      zip(timesteps, observation_layouts)):
+    arrays["reward"][index, agent] = timestep.reward
+    for name, max_rows in layout.items():
+      value = timestep.observation[name]
+      out = arrays["observation", agent, name][index]
+      if max_rows is None:
+        out[...] = value
+        continue
+      rows = len(value)
+      if rows > max_rows:
+        logging.warning("Truncating %s from %s to %s rows.", name, rows,
+                        max_rows)
+        rows = max_rows
+      if rows:
+        out[:rows] = value[:rows]
+      out[rows:] = 0
+      arrays["length", agent, name][index] = rows
+
+
+def _worker(env_fn, conn, max_rows):
+  """Run an env in a worker process, stepping it when asked."""
+  env = None
+  arrays = None
+  try:
+    env = env_fn()
+    features = env._features  # pylint: disable=protected-access
+    observation_layouts = [
+        _observation_layout(f.observation_spec(), f.observation_dtypes(),
+                            max_rows) for f in features]
+    action_specs = env.action_spec()
+    conn.send(("ok", (env.observation_spec(), action_specs,
+                      [f.observation_dtypes() for f in features])))
+    message = conn.recv()
+    if message == "close":  # Another env failed to start.
+      return
+    index, layout = message
+    arrays = _SharedArrays.attach(layout)
+    last = True  # Reset on the first step.
+    while True:
+      command = conn.recv()
+      if command == "close":
+        break
+      try:
+        if command == "reset" or last:
+          timesteps = env.reset()
+        else:
+          timesteps = env.step(_read_actions(arrays, index, action_specs))
+        last = timesteps[0].last()
+        _write_timesteps(arrays, index, timesteps, observation_layouts)
+      except Exception:  # pylint: disable=broad-except
+        # Report it, but keep serving, so one bad action doesn't end the env.
+        conn.send(("error", traceback.format_exc()))
+      else:
+        conn.send(("ok", None))
+  except (KeyboardInterrupt, EOFError):
+    pass
+  except Exception:  # pylint: disable=broad-except
+    # Exceptions may not pickle, so send the traceback instead.
+    try:
+      conn.send(("error", traceback.format_exc()))
+    except (BrokenPipeError, OSError):
+      pass
+  finally:
+    if arrays:
+      arrays.close()
+    if env:
+      env.close()
+    conn.close()
+
+
+def _observation_layout(obs_spec, obs_dtypes, max_rows):
+  """Returns name -> max rows, or None for fixed size observations.
+
+  Observations that aren't numeric, like `_response_observation`, are left out.
+
+  Args:
+    obs_spec: The observation spec of an agent.
+    obs_dtypes: The observation dtypes of that agent.
+    max_rows: Overrides for the max rows of variable length observations.
+  """
+  layout = {}
+  for name, shape in obs_spec.items():
+    dtype = np.dtype(obs_dtypes[name])
+    if dtype.kind not in "biuf":
+      continue
+    if shape and shape[0] == 0:
+      default = (len(actions_lib.FUNCTIONS) if name == "available_actions"
+                 else _DEFAULT_MAX_ROWS)
+      layout[name] = max_rows.get(name, default)
+    else:
+      layout[name] = None
+  return layout
+
+
+class VectorSC2Env(object):
+  """Steps a batch of `SC2Env`s, each in its own worker process."""
+
+  def __init__(self, env_fns, max_rows=None, copy_observations=True,
+               context=None):
+    """Start the workers and their envs.
+
+    Args:
+      env_fns: A list of functions, one per env, that create the env in its
+          worker, eg `functools.partial(sc2_env.SC2Env, map_name="Simple64",
+          ...)`. The envs must have the same observation and action specs, and
+          use `AgentInterfaceFormat` rather than raw `InterfaceOptions`.
+      max_rows: A dict of observation name to how many rows to keep, for the
+          observations with a variable number of rows, like `raw_units`.
+          Defaults to all of them for `available_actions`, and 512 otherwise.
+      copy_observations: Whether to return copies of the observations. If
+          False they're views of the shared memory, which are overwritten by
+          the next `step_wait` or `reset`.
+      context: A multiprocessing context, or the name of a start method.
+          Defaults to the multiprocessing default.
+
+    Raises:
+      RuntimeError: if an env couldn't be created.
+    """
+    if isinstance(context, str) or context is None:
+      context = multiprocessing.get_context(context)
+    self._num_envs = len(env_fns)
+    self._copy = copy_observations
+    self._arrays = None
+    self._waiting = False
+    self._conns = []
+    self._processes = []
+    max_rows = dict(max_rows or {})
+    # Start it before the workers, so they share it rather than each starting
+    # their own, which would complain about the shared memory we unlink.
+    resource_tracker.ensure_running()
+    for env_fn in env_fns:
+      parent_conn, child_conn = context.Pipe()
+      process = context.Process(
+          target=_worker, args=(env_fn, child_conn, max_rows), daemon=True)
+      process.start()
+      child_conn.close()
+      self._conns.append(parent_conn)
+      self._processes.append(process)
+
+    try:
+      specs = self._receive()
+      self._observation_spec, self._action_spec, obs_dtypes = specs[0]
+      self._num_agents = len(self._action_spec)
+      self._observation_layouts = [
+          _observation_layout(spec, dtypes, max_rows)
+          for spec, dtypes in zip(self._observation_spec, obs_dtypes)]
+      self._arrays = _SharedArrays.create(self._array_specs(obs_dtypes))
+      for index, conn in enumerate(self._conns):
+        conn.send((index, self._arrays.layout))
+    except Exception:
+      self.close()
+      raise
+
+  def _array_specs(self, obs_dtypes):
+    """The shape and dtype of each shared array."""
+    n = self._num_envs
+    specs = {
+        "step_type": ((n,), np.int32),
+        "discount": ((n,), np.float32),
+        "reward": ((n, self._num_agents), np.float32),
+    }
+    for agent, (obs_spec, dtypes, layout) in enumerate(zip(
+        self._observation_spec, obs_dtypes, self._observation_layouts)):
+      for name, rows in layout.items():
+        shape = tuple(obs_spec[name])
+        if rows is not None:
+          shape = (rows,) + shape[1:]
+          specs["length", agent, name] = ((n,), np.int32)
+        specs["observation", agent, name] = ((n,) + shape, dtypes[name])
+      action_spec = self._action_spec[agent]
+      specs["function", agent] = ((n,), np.int32)
+      for arg_type in action_spec.types:
+        specs["argument", agent, arg_type.name] = (
+            (n, _argument_width(arg_type)), np.int64)
+    return specs
+
+  @property
+  def num_envs(self):
+    return self._num_envs
+
+  def observation_spec(self):
+    """The observation spec of each agent, of a single env."""
+    return self._observation_spec
+
+  def action_spec(self):
+    """The action spec of each agent, of a single env."""
+    return self._action_spec
+
+  def reset(self):
+    """Reset all the envs, returning a batched `TimeStep` per agent."""
+    self._check_not_waiting()
+    self._send("reset")
+    return self._wait()
+
+  def step_async(self, function_ids, arguments):
+    """Start stepping all the envs, without waiting for them.
+
+    Envs whose last `TimeStep` was `StepType.LAST` are reset instead, ignoring
+    their actions.
+
+    Args:
+      function_ids: An int array of shape [num_envs, num_agents] of function
+          ids. With a single agent it may be of shape [num_envs].
+      arguments: A dict of argument type name to an int array of shape
+          [num_envs, num_agents, len(sizes)], or with a single agent
+          [num_envs, len(sizes)], or [num_envs] for single values. `unit_tags`
+          may have fewer than the max number of tags, padded with -1. Only the
+          arguments of each function are read. Arguments not given are 0, or
+          no tags for `unit_tags` and `target_unit_tag`.
+
+    Raises:
+      ValueError: if an argument isn't in the action spec.
+    """
+    self._check_not_waiting()
+    n, num_agents = self._num_envs, self._num_agents
+    function_ids = np.asarray(function_ids).reshape(n, num_agents)
+    arguments = {name: np.asarray(value).reshape(n, num_agents, -1)
+                 for name, value in arguments.items()}
+    for agent in range(num_agents):
+      arg_types = self._action_spec[agent].types
+      unknown = set(arguments) - {t.name for t in arg_types}
+      if unknown:
+        raise ValueError("Unknown arguments: %s." % ", ".join(sorted(unknown)))
+      self._arrays["function", agent][:] = function_ids[:, agent]
+      for arg_type in arg_types:
+        out = self._arrays["argument", agent, arg_type.name]
+        value = arguments.get(arg_type.name)
+        if value is None:
+          # Rather than leaving the previous step's values in shared memory.
+          out[:] = -1 if arg_type.name in _TAG_ARGUMENTS else 0
+          continue
+        width = value.shape[2]
+        out[:, :width] = value[:, agent]
+        out[:, width:] = -1
+    self._send("step")
+
+  def step_wait(self):
+    """Wait for `step_async` to finish, returning a `TimeStep` per agent."""
+    if not self._waiting:
+      raise RuntimeError("step_wait called without step_async.")
+    return self._wait()
+
+  def step(self, function_ids, arguments):
+    """Step all the envs. See `step_async`."""
+    self.step_async(function_ids, arguments)
+    return self.step_wait()
+
+  def _check_not_waiting(self):
+    if self._waiting:
+      raise RuntimeError("Already waiting for step_async to finish.")
+
+  def _send(self, command):
+    for conn in self._conns:
+      conn.send(command)
+    self._waiting = True
+
+  def _receive(self):
+    """Wait for every worker, raising if any of them failed."""
+    results = []
+    errors = []
+    for index, conn in enumerate(self._conns):
+      try:
+        status, result = conn.recv()
+      except EOFError:
+        status, result = "error", "The worker process died."
+      if status == "error":
+        errors.append("Env %s failed:\n%s" % (index, result))
+      results.append(result)
+    if errors:
+      raise RuntimeError("\n".join(errors))
+    return results
+
+  def _wait(self):
+    try:
+      self._receive()
+    finally:
+      self._waiting = False
+    copy = np.copy if self._copy else lambda a: a
+    step_type = self._arrays["step_type"].copy()
+    discount = self._arrays["discount"].copy()
+    reward = self._arrays["reward"].copy()
+    timesteps = []
+    for agent, layout in enumerate(self._observation_layouts):
+      observation = named_array.NamedDict(
+          (name, copy(self._arrays["observation", agent, name]))
+          for name in layout)
+      observation["lengths"] = named_array.NamedDict(
+          (name, self._arrays["length", agent, name].copy())
+          for name, rows in layout.items() if rows is not None)
+      timesteps.append(environment.TimeStep(
+          step_type=step_type,
+          reward=reward[:, agent],
+          discount=discount,
+          observation=observation))
+    return tuple(timesteps)
+
+  def close(self):
+    """Stop the workers, and free the shared memory."""
+    for conn in self._conns:
+      try:
+        if self._waiting:
+          conn.recv()
+        conn.send("close")
+      except (BrokenPipeError, EOFError, OSError):
+        pass
+    for process in self._processes:
+      process.join(timeout=30)
+      if process.is_alive():
+        process.terminate()
+    for conn in self._conns:
+      conn.close()
+    self._conns = []
+    self._processes = []
+    if self._arrays:
+      self._arrays.close(unlink=True)
+      self._arrays = None
+    self._waiting = False
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exception_type, exception_value, traceback_):
+    self.close()
+
+  def __del__(self):
+    if getattr(self, "_processes", None):
+      self.close()
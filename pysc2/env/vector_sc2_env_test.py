@@ -0,0 +1,151 @@
+# Copyright 2021 DeepMind Technologies Ltd. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for vector_sc2_env.py."""
+
+import functools
+
+from absl.testing import absltest
+import numpy as np
+
+from pysc2.env import environment
+from pysc2.env import mock_sc2_env
+from pysc2.env import sc2_env
+from pysc2.env import vector_sc2_env
+from pysc2.lib import actions
+from pysc2.lib import features
+
+_AIF = sc2_env.AgentInterfaceFormat(
+    feature_dimensions=sc2_env.Dimensions(screen=(64, 60), minimap=32),
+    use_feature_units=True)
+_MOVE_CAMERA = actions.FUNCTIONS.move_camera.id
+
+
+class _EchoEnv(mock_sc2_env.SC2TestEnv):
+  """Rewards each step with a checksum of the action, to test the plumbing."""
+
+  def __init__(self, episode_length=10, **kwargs):
+    super(_EchoEnv, self).__init__(**kwargs)
+    self.episode_length = episode_length
+
+  def step(self, agent_actions, step_mul=None):
+    timesteps = super(_EchoEnv, self).step(agent_actions, step_mul)
+    action = agent_actions[0]
+    if action is None or timesteps[0].first():
+      return timesteps
+    checksum = action.function * 1000 + sum(sum(a) for a in action.arguments)
+    return [t._replace(reward=float(checksum)) for t in timesteps]
+
+
+def _env_fns(episode_lengths):
+  return [functools.partial(_EchoEnv, agent_interface_format=_AIF,
+                            episode_length=length)
+          for length in episode_lengths]
+
+
+class VectorSC2EnvTest(absltest.TestCase):
+
+  def testResetAndStep(self):
+    with vector_sc2_env.VectorSC2Env(_env_fns([10] * 3)) as env:
+      self.assertEqual(env.num_envs, 3)
+      (timestep,) = env.reset()
+      np.testing.assert_array_equal(timestep.step_type,
+                                    [environment.StepType.FIRST] * 3)
+      obs = timestep.observation
+      self.assertEqual(obs.feature_screen.shape,
+                       (3, len(features.SCREEN_FEATURES), 60, 64))
+      self.assertEqual(obs.feature_units.shape,
+                       (3, 512, len(features.FeatureUnit)))
+      np.testing.assert_array_equal(obs.lengths.feature_units, [1, 1, 1])
+      self.assertTrue(obs.feature_units[:, 0].any())
+      self.assertFalse(obs.feature_units[:, 1:].any())
+      self.assertEqual(obs.available_actions.shape,
+                       (3, len(actions.FUNCTIONS)))
+      self.assertNotIn("map_name", obs)
+
+      (timestep,) = env.step([_MOVE_CAMERA, 0, _MOVE_CAMERA],
+                             {"minimap": [[1, 2], [3, 4], [5, 6]]})
+      np.testing.assert_array_equal(timestep.step_type,
+                                    [environment.StepType.MID] * 3)
+      np.testing.assert_array_equal(
+          timestep.reward,
+          [_MOVE_CAMERA * 1000 + 3, 0, _MOVE_CAMERA * 1000 + 11])
+
+  def testAutoReset(self):
+    with vector_sc2_env.VectorSC2Env(_env_fns([2, 3])) as env:
+      env.reset()
+      step_types = []
+      for _ in range(5):
+        (timestep,) = env.step([0, 0], {})
+        step_types.append(timestep.step_type.tolist())
+    first, mid, last = (environment.StepType.FIRST, environment.StepType.MID,
+                        environment.StepType.LAST)
+    self.assertEqual(step_types, [
+        [mid, mid],
+        [last, mid],
+        [first, last],
+        [mid, first],
+        [last, mid],
+    ])
+
+  def testStepAsync(self):
+    with vector_sc2_env.VectorSC2Env(_env_fns([10] * 2)) as env:
+      with self.assertRaises(RuntimeError):
+        env.step_wait()
+      env.reset()
+      env.step_async([_MOVE_CAMERA] * 2, {"minimap": [[1, 1], [2, 2]]})
+      with self.assertRaises(RuntimeError):
+        env.step_async([0, 0], {})
+      (timestep,) = env.step_wait()
+      np.testing.assert_array_equal(
+          timestep.reward, [_MOVE_CAMERA * 1000 + 2, _MOVE_CAMERA * 1000 + 4])
+
+  def testNoCopy(self):
+    with vector_sc2_env.VectorSC2Env(
+        _env_fns([10]), copy_observations=False) as env:
+      (first,) = env.reset()
+      (second,) = env.step([0], {})
+      self.assertTrue(np.shares_memory(first.observation.feature_screen,
+                                       second.observation.feature_screen))
+
+  def testMaxRows(self):
+    with vector_sc2_env.VectorSC2Env(
+        _env_fns([10]), max_rows={"feature_units": 4}) as env:
+      (timestep,) = env.reset()
+    self.assertEqual(timestep.observation.feature_units.shape[:2], (1, 4))
+
+  def testOmittedArgumentsAreReset(self):
+    with vector_sc2_env.VectorSC2Env(_env_fns([10])) as env:
+      env.reset()
+      (timestep,) = env.step([_MOVE_CAMERA], {"minimap": [[5, 6]]})
+      np.testing.assert_array_equal(timestep.reward, [_MOVE_CAMERA * 1000 + 11])
+      (timestep,) = env.step([_MOVE_CAMERA], {})
+      np.testing.assert_array_equal(timestep.reward, [_MOVE_CAMERA * 1000])
+      with self.assertRaisesRegex(ValueError, "Unknown arguments: bogus"):
+        env.step_async([0], {"bogus": [1]})
+
+  def testWorkerErrors(self):
+    with vector_sc2_env.VectorSC2Env(_env_fns([10] * 2)) as env:
+      env.reset()
+      with self.assertRaisesRegex(RuntimeError, "Env 1 failed"):
+        env.step([0, 100000], {})
+      # The workers are still there, and the failed env carries on.
+      (timestep,) = env.step([_MOVE_CAMERA] * 2, {"minimap": [[1, 1], [2, 2]]})
+      np.testing.assert_array_equal(
+          timestep.reward, [_MOVE_CAMERA * 1000 + 2, _MOVE_CAMERA * 1000 + 4])
+      np.testing.assert_array_equal(timestep.step_type,
+                                    [environment.StepType.MID] * 2)
+
+
+if __name__ == "__main__":
+  absltest.main()
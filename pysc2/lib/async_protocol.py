@@ -0,0 +1,364 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""An asyncio version of the protocol library.
+
+`protocol.StarcraftProtocol` blocks on the websocket, so driving several games
+needs a thread per game. This speaks the same protocol over asyncio streams so
+a single event loop can drive many games at once. It implements just enough of
+the websocket protocol (RFC 6455) to talk to SC2: binary messages,
+fragmentation, pings and close frames.
+"""
+
+import asyncio
+import base64
+import contextlib
+import hashlib
+import itertools
+import os
+import struct
+import time
+
+from pysc2.lib import protocol
+from pysc2.lib import stopwatch
+
+from s2clientprotocol import sc2api_pb2 as sc_pb
+
+
+sw = stopwatch.sw
+
+Status = protocol.Status  # pylint: disable=invalid-name
+
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+_WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class HandshakeError(protocol.ConnectionError):
+  """The server didn't accept the websocket upgrade."""
+
+  def __init__(self, description, status_code=None):
+    super(HandshakeError, self).__init__(description)
+    self.status_code = status_code
+
+
+@contextlib.contextmanager
+def catch_connection_errors():
+  """A context manager that translates socket errors into ConnectionError."""
+  try:
+    yield
+  except asyncio.TimeoutError as e:
+    raise protocol.ConnectionError("Websocket timed out.") from e
+  except asyncio.IncompleteReadError as e:
+    raise protocol.ConnectionError(
+        "Connection already closed. SC2 probably crashed. "
+        "Check the error log.") from e
+  except OSError as e:
+    raise protocol.ConnectionError("Socket error: %s" % e) from e
+
+
+def accept_key(key):
+  """Return the Sec-WebSocket-Accept value for a Sec-WebSocket-Key."""
+  return base64.b64encode(hashlib.sha1(key + _WEBSOCKET_GUID).digest())
+
+
+def _apply_mask(payload, mask):
+  """XOR the payload with the repeated 4 byte mask."""
+  n = len(payload)
+  if not n:
+    return payload
+  key = int.from_bytes((mask * (n // 4 + 1))[:n], "little")
+  return (int.from_bytes(payload, "little") ^ key).to_bytes(n, "little")
+
+
+def encode_frame(opcode, payload, mask):
+  """Encode a single, final frame. Clients must mask, servers must not."""
+  mask_bit = 0x80 if mask else 0
+  length = len(payload)
+  if length < 126:
+    header = struct.pack("!BB", 0x80 | opcode, mask_bit | length)
+  elif length < 2**16:
+    header = struct.pack("!BBH", 0x80 | opcode, mask_bit | 126, length)
+  else:
+    header = struct.pack("!BBQ", 0x80 | opcode, mask_bit | 127, length)
+  if mask:
+    key = os.urandom(4)
+    return header + key + _apply_mask(payload, key)
+  return header + payload
+
+
+async def read_frame(reader):
+  """Read a single frame, returning a `(fin, opcode, payload)` tuple."""
+  b0, b1 = await reader.readexactly(2)
+  length = b1 & 0x7F
+  if length == 126:
+    length, = struct.unpack("!H", await reader.readexactly(2))
+  elif length == 127:
+    length, = struct.unpack("!Q", await reader.readexactly(8))
+  mask = await reader.readexactly(4) if b1 & 0x80 else None
+  payload = await reader.readexactly(length)
+  if mask:
+    payload = _apply_mask(payload, mask)
+  return bool(b0 & 0x80), b0 & 0x0F, payload
+
+
+async def read_message(reader, writer, mask):
+  """Read a full message, answering pings. Returns None on a close frame."""
+  chunks = []
+  while True:
+    fin, opcode, payload = await read_frame(reader)
+    if opcode == OPCODE_PING:
+      writer.write(encode_frame(OPCODE_PONG, payload, mask))
+    elif opcode == OPCODE_CLOSE:
+      return None
+    elif opcode != OPCODE_PONG:
+      chunks.append(payload)
+      if fin:
+        return b"".join(chunks)
+
+
+class WebSocket(object):
+  """A minimal asyncio websocket client connection."""
+
+  def __init__(self, reader, writer, timeout=None):
+    self._reader = reader
+    self._writer = writer
+    self._timeout = timeout
+
+  @classmethod
+  async def connect(cls, host, port, path="/sc2api", timeout=None):
+    """Open a connection and do the websocket handshake."""
+    with catch_connection_errors():
+      reader, writer = await asyncio.wait_for(
+          asyncio.open_connection(host, port), timeout)
+      key = base64.b64encode(os.urandom(16))
+      writer.write((
+          "GET %s HTTP/1.1\r\n"
+          "Host: %s:%s\r\n"
+          "Upgrade: websocket\r\n"
+          "Connection: Upgrade\r\n"
+          "Sec-WebSocket-Key: %s\r\n"
+          "Sec-WebSocket-Version: 13\r\n\r\n" % (
+              path, host, port, key.decode())).encode())
+      header = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+
+    lines = header.decode("latin-1").split("\r\n")
+    status_code = int(lines[0].split()[1])
+    if status_code != 101:
+      writer.close()
+      raise HandshakeError("Handshake status %s" % status_code, status_code)
+    headers = dict(line.split(":", 1) for line in lines[1:] if ":" in line)
+    headers = {k.strip().lower(): v.strip() for k, v in headers.items()}
+    if headers.get("sec-websocket-accept") != accept_key(key).decode():
+      writer.close()
+      raise HandshakeError("Invalid Sec-WebSocket-Accept header.")
+    return cls(reader, writer, timeout)
+
+  @property
+  def port(self):
+    return self._writer.get_extra_info("peername")[1]
+
+  async def recv(self):
+    """Read a message, raising ConnectionError if the socket was closed."""
+    if self._writer is None:
+      raise protocol.ConnectionError("Connection already closed.")
+    with catch_connection_errors():
+      message = await asyncio.wait_for(
+          read_message(self._reader, self._writer, mask=True), self._timeout)
+    if message is None:
+      self.close()
+      raise protocol.ConnectionError(
+          "Connection already closed. SC2 probably crashed. "
+          "Check the error log.")
+    return message
+
+  async def send(self, data):
+    """Write a binary message."""
+    if self._writer is None:
+      raise protocol.ConnectionError("Connection already closed.")
+    with catch_connection_errors():
+      self._writer.write(encode_frame(OPCODE_BINARY, data, mask=True))
+      await self._writer.drain()
+
+  def close(self):
+    if self._writer is not None:
+      with contextlib.suppress(OSError):
+        self._writer.write(encode_frame(OPCODE_CLOSE, b"", mask=True))
+      self._writer.close()
+      self._writer = None
+
+
+class AsyncStarcraftProtocol(protocol.StarcraftProtocol):
+  """Like `StarcraftProtocol`, but reads and writes are coroutines.
+
+  Only one request may be in flight at a time on a single connection, so don't
+  run several coroutines against the same protocol concurrently.
+  """
+
+  def __init__(self, sock):  # pylint: disable=super-init-not-called
+    self._status = Status.launched
+    self._sock = sock
+    self._port = sock.port
+    self._count = itertools.count(1)
+
+  async def read(self):
+    """Read a Response, do some validation, and return it."""
+    if protocol.FLAGS.sc2_verbose_protocol:
+      self._log("-------------- [%s] Reading response --------------",
+                self._port)
+      start = time.time()
+    response = await self._read()
+    if protocol.FLAGS.sc2_verbose_protocol:
+      self._log("-------------- [%s] Read %s in %0.1f msec --------------\n%s",
+                self._port, response.WhichOneof("response"),
+                1000 * (time.time() - start), self._packet_str(response))
+    return self._check_response(response)
+
+  async def read_raw(self):
+    """Read a Response, validate its header, and return it as a RawResponse."""
+    if protocol.FLAGS.sc2_verbose_protocol:
+      self._log("-------------- [%s] Reading raw response --------------",
+                self._port)
+      start = time.time()
+    raw = await self._read_raw()
+    if protocol.FLAGS.sc2_verbose_protocol:
+      self._log("-------------- [%s] Read %s in %0.1f msec --------------\n"
+                "%s\n<%s bytes>", self._port, raw.name,
+                1000 * (time.time() - start), self._packet_str(raw.header),
+                len(raw.payload))
+    self._check_response(raw.header)
+    return raw
+
+  async def write(self, request):
+    """Write a Request."""
+    if protocol.FLAGS.sc2_verbose_protocol:
+      self._log("-------------- [%s] Writing request: %s --------------\n%s",
+                self._port, request.WhichOneof("request"),
+                self._packet_str(request))
+    await self._write(request)
+
+  async def send_req(self, request):
+    """Write a pre-filled Request and return the Response."""
+    await self.write(request)
+    return await self.read()
+
+  async def send(self, **kwargs):
+    """Create and send a specific request, and return the response.
+
+    For example: await send(ping=sc_pb.RequestPing()) => sc_pb.ResponsePing
+
+    Args:
+      **kwargs: A single kwarg with the name and value to fill in to Request.
+
+    Returns:
+      The Response corresponding to your request.
+    Raises:
+      ConnectionError: if it gets a different response.
+    """
+    assert len(kwargs) == 1, "Must make a single request."
+    name = list(kwargs.keys())[0]
+    req = sc_pb.Request(**kwargs)
+    req.id = next(self._count)
+    try:
+      res = await self.send_req(req)
+    except protocol.ConnectionError as e:
+      raise protocol.ConnectionError("Error during %s: %s" % (name, e)) from e
+    if res.HasField("id") and res.id != req.id:
+      raise protocol.ConnectionError(
+          "Error during %s: Got a response with a different id" % name)
+    return getattr(res, name)
+
+  async def send_raw(self, **kwargs):
+    """Like `send`, but returns the serialized response without parsing it.
+
+    See `StarcraftProtocol.send_raw` for details.
+
+    Args:
+      **kwargs: A single kwarg with the name and value to fill in to Request.
+
+    Returns:
+      The serialized response corresponding to your request.
+    Raises:
+      ConnectionError: if it gets a different response.
+    """
+    assert len(kwargs) == 1, "Must make a single request."
+    name = list(kwargs.keys())[0]
+    req = sc_pb.Request(**kwargs)
+    req.id = next(self._count)
+    try:
+      await self.write(req)
+      raw = await self.read_raw()
+    except protocol.ConnectionError as e:
+      raise protocol.ConnectionError("Error during %s: %s" % (name, e)) from e
+    return self._raw_payload(name, req, raw)
+
+  async def send_pipelined(self, *requests):
+    """Send several requests back to back, then read all their responses.
+
+    See `StarcraftProtocol.send_pipelined` for details.
+
+    Args:
+      *requests: `(name, value)` tuples, each a request to fill in to Request.
+
+    Returns:
+      The Responses corresponding to your requests, in the same order.
+    Raises:
+      ConnectionError: if the responses don't match the requests.
+      ProtocolError: if any of the responses is an error.
+    """
+    reqs = self._pipelined_requests(requests)
+    names = ", ".join(name for name, _ in requests)
+    responses = []
+    try:
+      for req in reqs:
+        await self.write(req)
+      for _ in reqs:
+        try:
+          responses.append(await self.read())
+        except protocol.ProtocolError as e:
+          responses.append(e)
+    except protocol.ConnectionError as e:
+      raise protocol.ConnectionError(
+          "Error during %s: %s" % (names, e)) from e
+    return self._match_responses(requests, reqs, responses)
+
+  async def _recv(self):
+    """Actually read the response, returning the bytes."""
+    response_str = await self._sock.recv()
+    if not response_str:
+      raise protocol.ProtocolError("Got an empty response from SC2.")
+    return response_str
+
+  async def _read(self):
+    """Actually read the response and parse it, returning a Response."""
+    response_str = await self._recv()
+    with sw("parse_response"):
+      response = sc_pb.Response.FromString(response_str)
+    return response
+
+  async def _read_raw(self):
+    """Actually read the response, parsing only its header."""
+    response_str = await self._recv()
+    with sw("split_response"):
+      return protocol.split_response(response_str)
+
+  async def _write(self, request):
+    """Actually serialize and write the request."""
+    with sw("serialize_request"):
+      request_str = request.SerializeToString()
+    await self._sock.send(request_str)
@@ -0,0 +1,285 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""An asyncio controller, so one event loop can drive many SC2 instances."""
+
+import asyncio
+import sys
+import time
+
+from absl import logging
+from pysc2.lib import async_protocol
+from pysc2.lib import protocol
+from pysc2.lib import remote_controller
+from pysc2.lib import static_data
+
+from s2clientprotocol import debug_pb2 as sc_debug
+from s2clientprotocol import sc2api_pb2 as sc_pb
+
+FLAGS = remote_controller.FLAGS
+
+Status = protocol.Status  # pylint: disable=invalid-name
+ConnectError = remote_controller.ConnectError
+RequestError = remote_controller.RequestError
+
+catch_game_end = remote_controller.catch_game_end
+decorate_check_error = remote_controller.decorate_check_error
+skip_status = remote_controller.skip_status
+valid_status = remote_controller.valid_status
+
+
+class AsyncRemoteController(remote_controller.RemoteController):
+  """An asyncio version of `RemoteController`.
+
+  This has the same interface as `RemoteController`, except that every call
+  that talks to SC2 is a coroutine, and construction goes through `connect`:
+
+    controllers = await asyncio.gather(*[
+        AsyncRemoteController.connect(host, port) for port in ports])
+    await asyncio.gather(*[c.step(8) for c in controllers])
+
+  Each controller only supports one call in flight at a time, but calls on
+  different controllers can be freely interleaved on the same event loop.
+  """
+
+  def __init__(self, client):  # pylint: disable=super-init-not-called
+    """Use `connect` rather than constructing this directly."""
+    self._client = client
+    self._last_obs = None
+
+  @classmethod
+  async def connect(cls, host, port, proc=None, timeout_seconds=None):
+    """Connect to the websocket, retrying as needed. Returns a controller."""
+    timeout_seconds = timeout_seconds or FLAGS.sc2_timeout
+    sock = await cls._connect_websocket(host, port, proc, timeout_seconds)
+    controller = cls(async_protocol.AsyncStarcraftProtocol(sock))
+    await controller.ping()
+    return controller
+
+  @staticmethod
+  async def _connect_websocket(host, port, proc, timeout_seconds):
+    """Connect to the websocket, retrying as needed. Returns the socket."""
+    host = host.strip("[]")  # asyncio wants bare ipv6 addresses.
+    start = time.time()
+    was_running = False
+    for attempt, delay in enumerate(remote_controller.connect_delays()):
+      elapsed = time.time() - start
+      if elapsed >= timeout_seconds:
+        break
+      is_running = proc and proc.running
+      was_running = was_running or is_running
+      if (elapsed >= timeout_seconds / 4 or was_running) and not is_running:
+        logging.warning(
+            "SC2 isn't running, so bailing early on the websocket connection.")
+        break
+      if not proc or proc.listening:
+        logging.info("Connecting to: %s:%s, attempt: %s, running: %s", host,
+                     port, attempt, is_running)
+        try:
+          return await async_protocol.WebSocket.connect(
+              host, port, timeout=timeout_seconds)
+        except async_protocol.HandshakeError as err:
+          if err.status_code != 404:
+            raise
+          # SC2 is listening, but hasn't set up the /sc2api endpoint yet.
+        except protocol.ConnectionError:
+          pass  # SC2 hasn't started listening yet.
+      await asyncio.sleep(delay)
+    raise ConnectError("Failed to connect to the SC2 websocket. Is it up?")
+
+  @valid_status(Status.launched, Status.ended, Status.in_game, Status.in_replay)
+  @decorate_check_error(sc_pb.ResponseCreateGame.Error)
+  async def create_game(self, req_create_game):
+    """Create a new game. This can only be done by the host."""
+    return await self._client.send(create_game=req_create_game)
+
+  @valid_status(Status.launched, Status.init_game)
+  @decorate_check_error(sc_pb.ResponseSaveMap.Error)
+  async def save_map(self, map_path, map_data):
+    """Save a map into temp dir so create game can access it in multiplayer."""
+    return await self._client.send(save_map=sc_pb.RequestSaveMap(
+        map_path=map_path, map_data=map_data))
+
+  @valid_status(Status.launched, Status.init_game)
+  @decorate_check_error(sc_pb.ResponseJoinGame.Error)
+  async def join_game(self, req_join_game):
+    """Join a game, done by all connected clients."""
+    return await self._client.send(join_game=req_join_game)
+
+  @valid_status(Status.ended, Status.in_game)
+  @decorate_check_error(sc_pb.ResponseRestartGame.Error)
+  async def restart(self):
+    """Restart the game. Only done by the host."""
+    return await self._client.send(restart_game=sc_pb.RequestRestartGame())
+
+  @valid_status(Status.launched, Status.ended, Status.in_game, Status.in_replay)
+  @decorate_check_error(sc_pb.ResponseStartReplay.Error)
+  async def start_replay(self, req_start_replay):
+    """Start a replay."""
+    return await self._client.send(start_replay=req_start_replay)
+
+  @valid_status(Status.in_game, Status.in_replay)
+  async def game_info(self):
+    """Get the basic information about the game."""
+    return await self._client.send(game_info=sc_pb.RequestGameInfo())
+
+  @valid_status(Status.in_game, Status.in_replay)
+  async def data_raw(self, ability_id=True, unit_type_id=True, upgrade_id=True,
+                     buff_id=True, effect_id=True):
+    """Get the raw static data for the current game. Prefer `data` instead."""
+    return await self._client.send(data=sc_pb.RequestData(
+        ability_id=ability_id, unit_type_id=unit_type_id, upgrade_id=upgrade_id,
+        buff_id=buff_id, effect_id=effect_id))
+
+  async def data(self):
+    """Get the static data for the current game."""
+    return static_data.StaticData(await self.data_raw())
+
+  @valid_status(Status.in_game, Status.in_replay, Status.ended)
+  async def observe(self, disable_fog=False, target_game_loop=0):
+    """Get a current observation."""
+    obs = await self._client.send(observation=sc_pb.RequestObservation(
+        game_loop=target_game_loop,
+        disable_fog=disable_fog))
+    return self._process_observation(obs)
+
+  @valid_status(Status.in_game, Status.in_replay, Status.ended)
+  async def observe_raw(self, disable_fog=False, target_game_loop=0):
+    """Get a current observation as a serialized `sc_pb.ResponseObservation`."""
+    return await self._client.send_raw(observation=sc_pb.RequestObservation(
+        game_loop=target_game_loop,
+        disable_fog=disable_fog))
+
+  @valid_status(Status.in_game, Status.in_replay)
+  async def actions_step_observe(self, req_action, count=1, disable_fog=False,
+                                 target_game_loop=0):
+    """Send actions, step and observe in a single round trip."""
+    requests = [
+        ("step", sc_pb.RequestStep(count=count)),
+        ("observation", sc_pb.RequestObservation(
+            game_loop=target_game_loop, disable_fog=disable_fog))]
+    if self.status == Status.in_game:
+      self._log_actions(req_action)
+      requests.insert(0, ("action", req_action))
+    prev_status = self.status
+    try:
+      obs = (await self._client.send_pipelined(*requests))[-1]
+    except protocol.ProtocolError as protocol_error:
+      if not remote_controller.is_game_end_error(prev_status, protocol_error):
+        raise
+      # The responses were all read, so it's safe to ask again.
+      return await self.observe(disable_fog, target_game_loop)
+    return self._process_observation(obs)
+
+  @valid_status(Status.in_game, Status.in_replay)
+  @catch_game_end
+  async def actions_step(self, req_action, count=1):
+    """Send actions and step in a single round trip."""
+    requests = [("step", sc_pb.RequestStep(count=count))]
+    if self.status == Status.in_game:
+      self._log_actions(req_action)
+      requests.insert(0, ("action", req_action))
+    return (await self._client.send_pipelined(*requests))[-1]
+
+  async def available_maps(self):
+    return await self._client.send(
+        available_maps=sc_pb.RequestAvailableMaps())
+
+  @valid_status(Status.in_game, Status.in_replay)
+  @catch_game_end
+  async def step(self, count=1):
+    """Step the engine forward by one (or more) step."""
+    return await self._client.send(step=sc_pb.RequestStep(count=count))
+
+  @skip_status(Status.in_replay)
+  @valid_status(Status.in_game)
+  @catch_game_end
+  async def actions(self, req_action):
+    """Send a `sc_pb.RequestAction`, which may include multiple actions."""
+    self._log_actions(req_action)
+    return await self._client.send(action=req_action)
+
+  async def act(self, action):
+    """Send a single action. This is a shortcut for `actions`."""
+    if action and action.ListFields():  # Skip no-ops.
+      return await self.actions(sc_pb.RequestAction(actions=[action]))
+
+  @skip_status(Status.in_game)
+  @valid_status(Status.in_replay)
+  async def observer_actions(self, req_observer_action):
+    """Send a `sc_pb.RequestObserverAction`."""
+    if FLAGS.sc2_log_actions and req_observer_action.actions:
+      sys.stderr.write(" Sending observer actions ".center(60, ">") + "\n")
+      for action in req_observer_action.actions:
+        sys.stderr.write(str(action))
+      sys.stderr.flush()
+
+    return await self._client.send(obs_action=req_observer_action)
+
+  async def observer_act(self, action):
+    """Send a single observer action. A shortcut for `observer_actions`."""
+    if action and action.ListFields():  # Skip no-ops.
+      return await self.observer_actions(
+          sc_pb.RequestObserverAction(actions=[action]))
+
+  async def chat(self, message, channel=sc_pb.ActionChat.Broadcast):
+    """Send chat message as a broadcast."""
+    if message:
+      action_chat = sc_pb.ActionChat(
+          channel=channel, message=message)
+      action = sc_pb.Action(action_chat=action_chat)
+      return await self.act(action)
+
+  @valid_status(Status.in_game, Status.ended)
+  async def leave(self):
+    """Disconnect from a multiplayer game."""
+    return await self._client.send(leave_game=sc_pb.RequestLeaveGame())
+
+  @valid_status(Status.in_game, Status.in_replay, Status.ended)
+  async def save_replay(self):
+    """Save a replay, returning the data."""
+    res = await self._client.send(save_replay=sc_pb.RequestSaveReplay())
+    return res.data
+
+  @valid_status(Status.in_game)
+  async def debug(self, debug_commands):
+    """Run a debug command."""
+    if isinstance(debug_commands, sc_debug.DebugCommand):
+      debug_commands = [debug_commands]
+    return await self._client.send(
+        debug=sc_pb.RequestDebug(debug=debug_commands))
+
+  @valid_status(Status.in_game, Status.in_replay)
+  async def query(self, query):
+    """Query the game state."""
+    return await self._client.send(query=query)
+
+  @skip_status(Status.quit)
+  async def quit(self):
+    """Shut down the SC2 process."""
+    try:
+      # Don't expect a response.
+      await self._client.write(
+          sc_pb.Request(quit=sc_pb.RequestQuit(), id=999999999))
+    except protocol.ConnectionError:
+      pass  # It's likely already (shutting) down, so continue as if it worked.
+    finally:
+      self.close()
+
+  async def ping(self):
+    return await self._client.send(ping=sc_pb.RequestPing())
+
+  @decorate_check_error(sc_pb.ResponseReplayInfo.Error)
+  async def replay_info(self, replay_data):
+    return await self._client.send(replay_info=sc_pb.RequestReplayInfo(
+        replay_data=replay_data))
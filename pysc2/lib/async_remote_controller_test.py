@@ -0,0 +1,141 @@
+#!/usr/bin/python
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for async_remote_controller.py against a fake SC2 server."""
+
+import asyncio
+
+from absl.testing import absltest
+from pysc2.lib import async_protocol
+from pysc2.lib import async_remote_controller
+from pysc2.lib import fake_sc2_server
+from pysc2.lib import portspicker
+from pysc2.lib import remote_controller
+
+from s2clientprotocol import sc2api_pb2 as sc_pb
+
+
+AsyncRemoteController = async_remote_controller.AsyncRemoteController
+
+
+class WebSocketFramingTest(absltest.TestCase):
+
+  def _round_trip(self, payload, mask):
+    async def run():
+      reader = asyncio.StreamReader()
+      reader.feed_data(async_protocol.encode_frame(
+          async_protocol.OPCODE_BINARY, payload, mask=mask))
+      return await async_protocol.read_frame(reader)
+    return asyncio.run(run())
+
+  def testSmallFrame(self):
+    self.assertEqual(self._round_trip(b"hello", mask=True),
+                     (True, async_protocol.OPCODE_BINARY, b"hello"))
+
+  def testEmptyFrame(self):
+    self.assertEqual(self._round_trip(b"", mask=True),
+                     (True, async_protocol.OPCODE_BINARY, b""))
+
+  def testLargeFrames(self):
+    for size in (126, 2**16 - 1, 2**16, 300000):
+      payload = bytes(i % 251 for i in range(size))
+      for mask in (True, False):
+        _, _, out = self._round_trip(payload, mask=mask)
+        self.assertEqual(out, payload)
+
+  def testFragmentedMessage(self):
+    async def run():
+      reader = asyncio.StreamReader()
+      first = bytearray(async_protocol.encode_frame(
+          async_protocol.OPCODE_BINARY, b"abc", mask=True))
+      first[0] &= 0x7F  # Not the final frame.
+      reader.feed_data(bytes(first))
+      reader.feed_data(async_protocol.encode_frame(
+          async_protocol.OPCODE_CONTINUATION, b"def", mask=True))
+      return await async_protocol.read_message(reader, None, mask=False)
+    self.assertEqual(asyncio.run(run()), b"abcdef")
+
+
+class AsyncRemoteControllerTest(absltest.TestCase):
+
+  def setUp(self):
+    super(AsyncRemoteControllerTest, self).setUp()
+    self._server = fake_sc2_server.FakeSC2Server(step_latency=0.01).start()
+
+  def tearDown(self):
+    self._server.close()
+    super(AsyncRemoteControllerTest, self).tearDown()
+
+  def _connect(self):
+    return AsyncRemoteController.connect(
+        self._server.host, self._server.port, timeout_seconds=5)
+
+  def testStepAndObserve(self):
+    async def run():
+      controller = await self._connect()
+      self.assertEqual(controller.status, remote_controller.Status.in_game)
+      await controller.actions(sc_pb.RequestAction())
+      await controller.step(3)
+      obs = await controller.observe()
+      await controller.quit()
+      return obs
+    self.assertEqual(asyncio.run(run()).observation.game_loop, 3)
+
+  def testManyControllersOnOneLoop(self):
+    num_controllers = 20
+    num_steps = 5
+
+    async def run():
+      controllers = await asyncio.gather(
+          *[self._connect() for _ in range(num_controllers)])
+      for _ in range(num_steps):
+        await asyncio.gather(*[c.step() for c in controllers])
+        observations = await asyncio.gather(
+            *[c.observe() for c in controllers])
+      for c in controllers:
+        await c.quit()
+      return observations
+
+    observations = asyncio.run(run())
+    self.assertEqual([o.observation.game_loop for o in observations],
+                     [num_steps] * num_controllers)
+    # The steps ran concurrently rather than one after the other. See
+    # bin/benchmark_async.py for how much time that saves.
+    self.assertGreater(self._server.max_steps_in_flight, 1)
+
+  def testSyncControllerAgainstFakeServer(self):
+    controller = remote_controller.RemoteController(
+        self._server.host, self._server.port, timeout_seconds=5)
+    controller.step(2)
+    self.assertEqual(controller.observe().observation.game_loop, 2)
+    controller.quit()
+
+  def testConnectFailsWithoutServer(self):
+    port = portspicker.pick_unused_ports(1)[0]
+    with self.assertRaises(remote_controller.ConnectError):
+      asyncio.run(AsyncRemoteController.connect(
+          "127.0.0.1", port, timeout_seconds=1))
+    portspicker.return_ports([port])
+
+  def testValidStatusIsChecked(self):
+    async def run():
+      controller = await self._connect()
+      await controller.quit()
+      await controller.step()
+    with self.assertRaises(async_protocol.protocol.ProtocolError):
+      asyncio.run(run())
+
+
+if __name__ == "__main__":
+  absltest.main()
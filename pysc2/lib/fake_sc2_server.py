@@ -0,0 +1,180 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A fake SC2 websocket server, for testing and benchmarking the protocol.
+
+It answers every request with an empty response of the matching type, except
+for `step` and `observation` which track a game loop per connection, and can
+simulate the time SC2 would spend on them. Every connection is an independent
+game, with a status that follows the requests that change it.
+"""
+
+import asyncio
+import threading
+
+from pysc2.lib import async_protocol
+
+from s2clientprotocol import sc2api_pb2 as sc_pb
+
+
+# The status after each request that changes it.
+_STATUS_AFTER = {
+    "create_game": sc_pb.init_game,
+    "join_game": sc_pb.in_game,
+    "restart_game": sc_pb.in_game,
+    "start_replay": sc_pb.in_replay,
+    "leave_game": sc_pb.launched,
+}
+
+
+class FakeSC2Server(object):
+  """A websocket server that pretends to be an SC2 instance.
+
+  The server runs its own event loop in a background thread, so it can serve
+  both `RemoteController` and `AsyncRemoteController` clients:
+
+    with FakeSC2Server(step_latency=0.001) as server:
+      controller = RemoteController(server.host, server.port)
+  """
+
+  def __init__(self, step_latency=0, observation_latency=0, errors=None,
+               status=sc_pb.in_game, port=None):
+    """Create the server.
+
+    Args:
+      step_latency: How many seconds each game loop of a `step` should take.
+      observation_latency: How many seconds an `observation` should take.
+      errors: An optional dict of request name to an error string to respond
+          with instead, for example `{"step": "Game has already ended"}`.
+      status: The status each connection starts with.
+      port: The port to listen on. Defaults to an unused one.
+    """
+    self._step_latency = step_latency
+    self._observation_latency = observation_latency
+    self._errors = errors or {}
+    self._status = status
+    self._loop = None
+    self._server = None
+    self._thread = None
+    self.host = "127.0.0.1"
+    self.port = port
+    self.requests = 0
+    self.max_steps_in_flight = 0  # The most `step`s served at the same time.
+    self._steps_in_flight = 0
+
+  def start(self):
+    """Start serving in a background thread. Returns once it's listening."""
+    started = threading.Event()
+
+    def run():
+      self._loop = asyncio.new_event_loop()
+      asyncio.set_event_loop(self._loop)
+      self._server = self._loop.run_until_complete(
+          asyncio.start_server(self._serve, self.host, self.port or 0))
+      self.port = self._server.sockets[0].getsockname()[1]
+      started.set()
+      self._loop.run_forever()
+      self._server.close()
+      tasks = asyncio.all_tasks(self._loop)
+      for task in tasks:
+        task.cancel()
+      self._loop.run_until_complete(
+          asyncio.gather(*tasks, return_exceptions=True))
+      self._loop.close()
+
+    self._thread = threading.Thread(target=run, daemon=True)
+    self._thread.start()
+    started.wait()
+    return self
+
+  def close(self):
+    if self._thread:
+      self._loop.call_soon_threadsafe(self._loop.stop)
+      self._thread.join()
+      self._thread = None
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, unused_exception_type, unused_exc_value, unused_traceback):
+    self.close()
+
+  async def _serve(self, reader, writer):
+    """Handle a single connection, ie a single game."""
+    try:
+      if not await self._handshake(reader, writer):
+        return
+      game_loop = 0
+      status = self._status
+      while True:
+        message = await async_protocol.read_message(reader, writer, mask=False)
+        if message is None:
+          return
+        request = sc_pb.Request.FromString(message)
+        self.requests += 1
+        name = request.WhichOneof("request")
+        if name == "quit":
+          return
+        if name in _STATUS_AFTER and name not in self._errors:
+          status = _STATUS_AFTER[name]
+        response = sc_pb.Response(status=status)
+        if request.HasField("id"):
+          response.id = request.id
+        if name in self._errors:
+          response.error.append(self._errors[name])
+        elif name == "step":
+          self._steps_in_flight += 1
+          self.max_steps_in_flight = max(self.max_steps_in_flight,
+                                         self._steps_in_flight)
+          try:
+            await asyncio.sleep(request.step.count * self._step_latency)
+          finally:
+            self._steps_in_flight -= 1
+          game_loop += request.step.count
+          response.step.simulation_loop = game_loop
+        elif name == "observation":
+          await asyncio.sleep(self._observation_latency)
+          response.observation.observation.game_loop = game_loop
+        else:
+          getattr(response, name).SetInParent()
+        writer.write(async_protocol.encode_frame(
+            async_protocol.OPCODE_BINARY, response.SerializeToString(),
+            mask=False))
+        await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+      pass  # The client went away.
+    except asyncio.CancelledError:
+      pass  # The server is shutting down.
+    finally:
+      writer.close()
+
+  async def _handshake(self, reader, writer):
+    """Accept the websocket upgrade, or 404 anything but /sc2api."""
+    header = await reader.readuntil(b"\r\n\r\n")
+    lines = header.decode("latin-1").split("\r\n")
+    path = lines[0].split()[1]
+    headers = dict(line.split(":", 1) for line in lines[1:] if ":" in line)
+    headers = {k.strip().lower(): v.strip() for k, v in headers.items()}
+    if path != "/sc2api":
+      writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+      await writer.drain()
+      return False
+    accept = async_protocol.accept_key(
+        headers["sec-websocket-key"].encode()).decode()
+    writer.write((
+        "HTTP/1.1 101 Switching Protocols\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        "Sec-WebSocket-Accept: %s\r\n\r\n" % accept).encode())
+    await writer.drain()
+    return True
@@ -16,6 +16,8 @@
 
 import collections
 import enum
+import functools
+import operator
 import random
 
 from absl import logging
@@ -260,6 +262,23 @@ class Feature(collections.namedtuple(
       32: np.int32,
   }
 
+  # The bits of each byte, most significant first like np.unpackbits, in each
+  # dtype a feature layer can be unpacked into.
+  _byte_bits = {
+      np.dtype(dtype): np.unpackbits(
+          np.arange(256, dtype=np.uint8)[:, None], axis=1).astype(dtype)
+      for dtype in (np.uint8, np.uint16, np.int32)
+  }
+
+  @property
+  def dtype(self):
+    """The smallest dtype that can hold all values of this feature."""
+    if self.scale <= 2**8:
+      return np.uint8
+    elif self.scale <= 2**16:
+      return np.uint16
+    return np.int32
+
   def unpack(self, obs):
     """Return a correctly shaped numpy array for this feature."""
     planes = getattr(obs.feature_layer_data, self.layer_set)
@@ -284,6 +303,45 @@ class Feature(collections.namedtuple(
         data = data[:size.x * size.y]
     return data.reshape(size.y, size.x)
 
+  def unpack_into(self, obs, out):
+    """Decode this feature into `out`, or fill it with zeros if it's missing.
+
+    Unlike `unpack_layer` this writes straight into `out`, without temporary
+    arrays, so `out` must be C contiguous.
+
+    Args:
+      obs: The observation proto.
+      out: A [y, x] array to fill.
+
+    Raises:
+      ValueError: If `out` isn't contiguous or doesn't match the layer size.
+    """
+    planes = getattr(obs.feature_layer_data, self.layer_set)
+    plane = getattr(planes, self.name)
+    size = point.Point.build(plane.size)
+    if size == (0, 0):
+      # New layer that isn't implemented in this SC2 version.
+      out.fill(0)
+      return
+    if out.shape != (size.y, size.x) or not out.flags.c_contiguous:
+      raise ValueError("Can't unpack %s of size %s into an array of shape %s." %
+                       (self.name, size, out.shape))
+    data = np.frombuffer(plane.data, dtype=Feature.dtypes[plane.bits_per_pixel])
+    flat = out.reshape(-1)  # A view, as `out` is contiguous.
+    if plane.bits_per_pixel == 1:
+      # Look up the 8 bits of each byte. The last byte may be padded, so only
+      # use the bits needed.
+      byte_bits = Feature._byte_bits.get(out.dtype)
+      if byte_bits is None:
+        byte_bits = Feature._byte_bits[np.dtype(np.uint8)].astype(out.dtype)
+      whole = flat.size // 8
+      np.take(byte_bits, data[:whole], axis=0, mode="clip",
+              out=flat[:whole * 8].reshape(whole, 8))
+      if flat.size > whole * 8:
+        flat[whole * 8:] = byte_bits[data[whole], :flat.size - whole * 8]
+    else:
+      np.copyto(flat, data, casting="unsafe")
+
   @staticmethod
   @sw.decorate
   def unpack_rgb_image(plane):
@@ -488,7 +546,10 @@ class AgentInterfaceFormat(object):
       crop_to_playable_area=False,
       raw_crop_to_playable_area=False,
       allow_cheating_layers=False,
-      add_cargo_to_units=False):
+      add_cargo_to_units=False,
+      reuse_feature_layer_buffers=0,
+      use_native_dtypes=False,
+      lazy_observations=False):
     """Initializer.
 
     Args:
@@ -551,6 +612,18 @@ class AgentInterfaceFormat(object):
           layers on the minimap.
       add_cargo_to_units: Whether to add the units that are currently in cargo
           to the feature_units and raw_units lists.
+      reuse_feature_layer_buffers: [int] If non-zero, decode `feature_screen`
+          and `feature_minimap` into a ring of this many preallocated arrays
+          instead of allocating new ones every step. Each array is overwritten
+          when the ring wraps around, so only the last this-many observations
+          stay valid; copy them if you need to keep them for longer.
+      use_native_dtypes: Whether to keep the feature layers in the smallest
+          unsigned dtype that fits all their values, and the RGB images in
+          uint8, instead of upcasting them all to int32. See
+          `Features.observation_dtypes` for the resulting dtypes.
+      lazy_observations: Whether to compute each observation only when it's
+          first read, rather than all of them up front. Useful if the agent
+          only looks at a few of the observations.
 
     Raises:
       ValueError: if the parameters are inconsistent.
@@ -626,6 +699,9 @@ class AgentInterfaceFormat(object):
     self._crop_to_playable_area = crop_to_playable_area
     self._raw_crop_to_playable_area = raw_crop_to_playable_area
     self._allow_cheating_layers = allow_cheating_layers
+    self._reuse_feature_layer_buffers = reuse_feature_layer_buffers
+    self._use_native_dtypes = use_native_dtypes
+    self._lazy_observations = lazy_observations
 
     if action_space == actions.ActionSpace.FEATURES:
       self._action_dimensions = feature_dimensions
@@ -728,6 +804,18 @@ class AgentInterfaceFormat(object):
   def allow_cheating_layers(self):
     return self._allow_cheating_layers
 
+  @property
+  def reuse_feature_layer_buffers(self):
+    return self._reuse_feature_layer_buffers
+
+  @property
+  def use_native_dtypes(self):
+    return self._use_native_dtypes
+
+  @property
+  def lazy_observations(self):
+    return self._lazy_observations
+
 
 def parse_agent_interface_format(
     feature_screen=None,
@@ -917,6 +1005,206 @@ def _init_valid_raw_functions(raw_resolution, max_selected_units):
   return actions.ValidActions(types, functions)
 
 
+def _init_available_abilities(hide_specific_actions):
+  """Map each (ability_id, requires_point) to the function ids it enables.
+
+  This is done once up front so `available_actions` only needs a lookup per
+  available ability.
+
+  Args:
+    hide_specific_actions: See the documentation in `AgentInterfaceFormat`.
+
+  Returns:
+    A dict of (ability_id, requires_point) to a numpy array of function ids.
+    Combinations with no applicable function are missing.
+  """
+  available_abilities = {}
+  for ability_id, funcs in actions.ABILITY_IDS.items():
+    for requires_point in (False, True):
+      func_ids = set()
+      for func in funcs:
+        if func.function_type in actions.POINT_REQUIRED_FUNCS[requires_point]:
+          if func.general_id == 0 or not hide_specific_actions:
+            func_ids.add(func.id)
+          if func.general_id != 0:  # Always offer generic actions.
+            for general_func in actions.ABILITY_IDS[func.general_id]:
+              if general_func.function_type is func.function_type:
+                # Only the right type. Don't want to expose the general action
+                # to minimap if only the screen version is available.
+                func_ids.add(general_func.id)
+                break
+      if func_ids:
+        available_abilities[(ability_id, requires_point)] = np.array(
+            sorted(func_ids), dtype=np.int32)
+  return available_abilities
+
+
+@sw.decorate
+def _full_unit_array(units, pos_transform, get_addon_type, is_raw=False):
+  """Compute the `FeatureUnit` matrix for a sequence of `sc_raw.Unit` protos.
+
+  Each field is read into its own column, and all positions are transformed in
+  a single vectorized call, so there is no per-unit list or `Point`.
+
+  Args:
+    units: A sequence of `sc_raw.Unit` protos.
+    pos_transform: The `transform.Transform` from world to the output space.
+    get_addon_type: A function mapping an add-on tag to its unit type.
+    is_raw: Whether to include the unit tags.
+
+  Returns:
+    A `NamedNumpyArray` of shape (len(units), len(FeatureUnit)).
+  """
+  n = len(units)
+  if not n:
+    return named_array.NamedNumpyArray([], [None, FeatureUnit], dtype=np.int64)
+
+  def column(field, dtype=np.int64):
+    return np.fromiter(map(operator.attrgetter(field), units), dtype, n)
+
+  def ratio(value, value_max):
+    value = column(value, np.float64)
+    value_max = column(value_max, np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+      return np.where(value_max > 0, value / value_max * 255, 0)
+
+  def nth(values, i, fn, dtype=np.int64):
+    return np.fromiter((fn(v[i]) if len(v) > i else 0 for v in values),
+                       dtype, n)
+
+  out = np.zeros((n, len(FeatureUnit)), dtype=np.int64)
+
+  # Int and bool fields.
+  for name, field in (
+      (FeatureUnit.unit_type, "unit_type"),
+      (FeatureUnit.alliance, "alliance"),
+      (FeatureUnit.cargo_space_taken, "cargo_space_taken"),
+      (FeatureUnit.display_type, "display_type"),
+      (FeatureUnit.owner, "owner"),
+      (FeatureUnit.cloak, "cloak"),
+      (FeatureUnit.is_selected, "is_selected"),
+      (FeatureUnit.is_blip, "is_blip"),
+      (FeatureUnit.is_powered, "is_powered"),
+      (FeatureUnit.mineral_contents, "mineral_contents"),
+      (FeatureUnit.vespene_contents, "vespene_contents"),
+      (FeatureUnit.cargo_space_max, "cargo_space_max"),
+      (FeatureUnit.assigned_harvesters, "assigned_harvesters"),
+      (FeatureUnit.ideal_harvesters, "ideal_harvesters"),
+      (FeatureUnit.hallucination, "is_hallucination"),
+      (FeatureUnit.active, "is_active"),
+      (FeatureUnit.is_on_screen, "is_on_screen"),
+      (FeatureUnit.buff_duration_remain, "buff_duration_remain"),
+      (FeatureUnit.buff_duration_max, "buff_duration_max"),
+      (FeatureUnit.attack_upgrade_level, "attack_upgrade_level"),
+      (FeatureUnit.armor_upgrade_level, "armor_upgrade_level"),
+      (FeatureUnit.shield_upgrade_level, "shield_upgrade_level")):
+    out[:, name] = column(field)
+
+  # Float fields, truncated towards zero like `int()`.
+  for name, field in (
+      (FeatureUnit.health, "health"),
+      (FeatureUnit.shield, "shield"),
+      (FeatureUnit.energy, "energy"),
+      (FeatureUnit.facing, "facing"),
+      (FeatureUnit.weapon_cooldown, "weapon_cooldown")):
+    out[:, name] = column(field, np.float64)
+  out[:, FeatureUnit.build_progress] = column("build_progress", np.float64) * 100
+  out[:, FeatureUnit.health_ratio] = ratio("health", "health_max")
+  out[:, FeatureUnit.shield_ratio] = ratio("shield", "shield_max")
+  out[:, FeatureUnit.energy_ratio] = ratio("energy", "energy_max")
+
+  positions = np.empty((n, 2), dtype=np.float64)
+  positions[:, 0] = np.fromiter((u.pos.x for u in units), np.float64, n)
+  positions[:, 1] = np.fromiter((u.pos.y for u in units), np.float64, n)
+  out[:, FeatureUnit.x:FeatureUnit.y + 1] = pos_transform.fwd_pts(positions)
+  out[:, FeatureUnit.radius] = pos_transform.fwd_dist(
+      column("radius", np.float64))
+
+  orders = [u.orders for u in units]
+  # TODO(tewalds): Return a generalized func id.
+  raw_order = lambda o: actions.RAW_ABILITY_ID_TO_FUNC_ID.get(o.ability_id, 0)
+  out[:, FeatureUnit.order_length] = np.fromiter(map(len, orders), np.int64, n)
+  out[:, FeatureUnit.order_id_0] = nth(orders, 0, raw_order)
+  out[:, FeatureUnit.order_id_1] = nth(orders, 1, raw_order)
+  out[:, FeatureUnit.order_id_2] = nth(orders, 2, raw_order)
+  out[:, FeatureUnit.order_id_3] = nth(orders, 3, raw_order)
+  progress = operator.attrgetter("progress")
+  out[:, FeatureUnit.order_progress_0] = nth(
+      orders, 0, progress, np.float64) * 100
+  out[:, FeatureUnit.order_progress_1] = nth(
+      orders, 1, progress, np.float64) * 100
+
+  buff_ids = [u.buff_ids for u in units]
+  out[:, FeatureUnit.buff_id_0] = nth(buff_ids, 0, int)
+  out[:, FeatureUnit.buff_id_1] = nth(buff_ids, 1, int)
+
+  out[:, FeatureUnit.addon_unit_type] = np.fromiter(
+      (get_addon_type(u.add_on_tag) if u.add_on_tag else 0 for u in units),
+      np.int64, n)
+
+  if is_raw:
+    out[:, FeatureUnit.tag] = column("tag")
+
+  return named_array.NamedNumpyArray(out, [None, FeatureUnit], copy=False)
+
+
+class TagIndex(object):
+  """Maps between unit tags and their positions in `raw_units`, vectorized.
+
+  Built once per observation, so looking up many tags is a single
+  `np.searchsorted` rather than a scan of the units per tag.
+  """
+  __slots__ = ("_tags", "_order", "_sorted")
+
+  def __init__(self, tags):
+    self._tags = np.asarray(tags, dtype=np.int64).reshape(-1)
+    # Stable, so duplicate tags map to their first position.
+    self._order = np.argsort(self._tags, kind="stable")
+    self._sorted = self._tags[self._order]
+
+  def __len__(self):
+    return len(self._tags)
+
+  def __eq__(self, other):
+    # pylint: disable=protected-access
+    return (isinstance(other, TagIndex) and
+            np.array_equal(self._tags, other._tags))
+
+  def __ne__(self, other):
+    return not self == other
+
+  __hash__ = None
+
+  def __repr__(self):
+    return "TagIndex(%s)" % self._tags.tolist()
+
+  def positions(self, tags):
+    """Return the positions of `tags`, or -1 for tags that aren't present."""
+    tags = np.asarray(tags, dtype=np.int64)
+    if not len(self._tags):  # pylint: disable=g-explicit-length-test
+      return np.full(tags.shape, -1, dtype=np.int64)
+    i = np.minimum(np.searchsorted(self._sorted, tags), len(self._tags) - 1)
+    return np.where(self._sorted[i] == tags, self._order[i], -1)
+
+  def tags(self, positions):
+    """Return the tags at `positions` as a list of python ints.
+
+    Positions past the end are assumed to be real unit tags already, and are
+    returned unchanged. Positions of padding rows, with a tag of 0, are skipped.
+
+    Args:
+      positions: A sequence of positions in `raw_units`.
+
+    Returns:
+      The list of tags.
+    """
+    positions = np.asarray(positions, dtype=np.int64).reshape(-1)
+    in_range = positions < len(self._tags)
+    tags = positions.copy()
+    tags[in_range] = self._tags[positions[in_range]]
+    return tags[tags != 0].tolist()
+
+
 class Features(object):
   """Render feature layers from SC2 Observation protos into numpy arrays.
 
@@ -965,13 +1253,52 @@ class Features(object):
           aif.raw_resolution)
 
     self._send_observation_proto = aif.send_observation_proto
+    if aif.use_native_dtypes:
+      self._feature_screen_dtype = np.result_type(
+          *[f.dtype for f in SCREEN_FEATURES])
+      self._feature_minimap_dtype = np.result_type(
+          *[f.dtype for f in MINIMAP_FEATURES])
+      self._rgb_dtype = np.dtype(np.uint8)
+    else:
+      self._feature_screen_dtype = np.dtype(np.int32)
+      self._feature_minimap_dtype = np.dtype(np.int32)
+      self._rgb_dtype = np.dtype(np.int32)
+    self._feature_layer_buffers = []
+    self._next_feature_layer_buffer = 0
+    if aif.feature_dimensions:
+      for _ in range(aif.reuse_feature_layer_buffers):
+        self._feature_layer_buffers.append((
+            named_array.NamedNumpyArray(
+                np.zeros((len(SCREEN_FEATURES),
+                          aif.feature_dimensions.screen.y,
+                          aif.feature_dimensions.screen.x),
+                         dtype=self._feature_screen_dtype),
+                names=[ScreenFeatures, None, None]),
+            named_array.NamedNumpyArray(
+                np.zeros((len(MINIMAP_FEATURES),
+                          aif.feature_dimensions.minimap.y,
+                          aif.feature_dimensions.minimap.x),
+                         dtype=self._feature_minimap_dtype),
+                names=[MinimapFeatures, None, None])))
     self._raw = aif.use_raw_actions
+    # The `TagIndex` of the last observation's raw_units, and that observation.
+    self._raw_tag_index = lambda: TagIndex([])
+    self._raw_tag_index_obs = None
     if self._raw:
       self._valid_functions = _init_valid_raw_functions(
           aif.raw_resolution, aif.max_selected_units)
-      self._raw_tags = []
     else:
       self._valid_functions = _init_valid_functions(aif.action_dimensions)
+    # `available_actions` works with raw actions too, so always build these.
+    self._available_abilities = _init_available_abilities(
+        aif.hide_specific_actions)
+    self._available_ui_funcs = list(actions.FUNCTIONS_AVAILABLE.values())
+    self._available_ui_func_ids = np.array(
+        [f.id for f in self._available_ui_funcs], dtype=np.int32)
+    # (obs, key, mask) of the last observation whose available actions were
+    # computed, so validating its actions doesn't compute them again.
+    self._available_actions_cache = None
+    self._batch_arg_types = None  # Built by `transform_actions_batch`.
     self._requested_races = requested_races
     if requested_races is not None:
       assert len(requested_races) <= 2
@@ -1110,6 +1437,30 @@ class Features(object):
     obs_spec["away_race_requested"] = (1,)
     return obs_spec
 
+  def observation_dtypes(self):
+    """The dtypes of the observations, matching `observation_spec`.
+
+    Returns:
+      The dict of observation names to their numpy dtypes. Most are int32, but
+      the unit lists are int64, and the spatial observations depend on
+      `use_native_dtypes`.
+    """
+    obs_dtypes = named_array.NamedDict(
+        (name, np.dtype(np.int32)) for name in self.observation_spec())
+    obs_dtypes["map_name"] = np.dtype(np.str_)
+    for name in ("feature_units", "raw_units"):
+      if name in obs_dtypes:
+        obs_dtypes[name] = np.dtype(np.int64)
+    if "feature_screen" in obs_dtypes:
+      obs_dtypes["feature_screen"] = self._feature_screen_dtype
+      obs_dtypes["feature_minimap"] = self._feature_minimap_dtype
+    if "rgb_screen" in obs_dtypes:
+      obs_dtypes["rgb_screen"] = self._rgb_dtype
+      obs_dtypes["rgb_minimap"] = self._rgb_dtype
+    if "_response_observation" in obs_dtypes:
+      obs_dtypes["_response_observation"] = np.dtype(object)
+    return obs_dtypes
+
   def action_spec(self):
     """The action space pretty complicated and fills the ValidFunctions."""
     return self._valid_functions
@@ -1124,68 +1475,137 @@ class Features(object):
 
   @sw.decorate
   def transform_obs(self, obs):
-    """Render some SC2 observations into something an agent can handle."""
-    empty_unit = np.array([], dtype=np.int32).reshape((0, len(UnitLayer)))
-    out = named_array.NamedDict({  # Fill out some that are sometimes empty.
-        "single_select": empty_unit,
-        "multi_select": empty_unit,
-        "build_queue": empty_unit,
-        "cargo": empty_unit,
-        "production_queue": np.array([], dtype=np.int32).reshape(
-            (0, len(ProductionQueue))),
+    """Render some SC2 observations into something an agent can handle.
+
+    Each observation is computed by a function registered with `observe`. These
+    are called right away, unless `lazy_observations` is set, in which case
+    they're called the first time their observation is read.
+
+    Args:
+      obs: A `sc_pb.ResponseObservation`.
+
+    Returns:
+      A `NamedDict`, or a `LazyNamedDict` if `lazy_observations` is set.
+    """
+    aif = self._agent_interface_format
+
+    out = named_array.NamedDict({
         "last_actions": np.array([], dtype=np.int32),
-        "cargo_slots_available": np.array([0], dtype=np.int32),
         "home_race_requested": np.array([0], dtype=np.int32),
         "away_race_requested": np.array([0], dtype=np.int32),
         "map_name": self._map_name,
     })
-
-    def or_zeros(layer, size):
+    if aif.lazy_observations:
+      out = named_array.LazyNamedDict(out)
+
+    def observe(*names):
+      """Decorator adding the observations computed by a function to `out`.
+
+      Args:
+        *names: The names of the observations. With a single name the function
+            returns its value, otherwise it returns a dict of name to value.
+
+      Returns:
+        The decorator.
+      """
+      def decorator(func):
+        func = sw.decorate(names[0] if len(names) == 1 else func.__name__)(func)
+        if len(names) == 1:
+          fields = {names[0]: func}
+        else:
+          cache = []
+          def compute(name):
+            if not cache:
+              cache.append(func())
+            return cache[0][name]
+          fields = {name: functools.partial(compute, name) for name in names}
+        for name, field in fields.items():
+          if aif.lazy_observations:
+            out.set_lazy(name, field)
+          else:
+            out[name] = field()
+        return func
+      return decorator
+
+    def or_zeros(layer, size, dtype):
       if layer is not None:
-        return layer.astype(np.int32, copy=False)
+        return layer.astype(dtype, copy=False)
       else:
-        return np.zeros((size.y, size.x), dtype=np.int32)
-
-    aif = self._agent_interface_format
-
-    if aif.feature_dimensions:
-      with sw("feature_screen"):
-        out["feature_screen"] = named_array.NamedNumpyArray(
+        return np.zeros((size.y, size.x), dtype=dtype)
+
+    if self._feature_layer_buffers:
+      screen_buffer, minimap_buffer = self._feature_layer_buffers[
+          self._next_feature_layer_buffer]
+      self._next_feature_layer_buffer = (
+          (self._next_feature_layer_buffer + 1) %
+          len(self._feature_layer_buffers))
+
+      @observe("feature_screen")
+      def feature_screen():
+        planes = np.asarray(screen_buffer)
+        for f in SCREEN_FEATURES:
+          f.unpack_into(obs.observation, planes[f.index])
+        return screen_buffer
+
+      @observe("feature_minimap")
+      def feature_minimap():
+        planes = np.asarray(minimap_buffer)
+        for f in MINIMAP_FEATURES:
+          f.unpack_into(obs.observation, planes[f.index])
+        return minimap_buffer
+    elif aif.feature_dimensions:
+      @observe("feature_screen")
+      def feature_screen():
+        return named_array.NamedNumpyArray(
             np.stack([or_zeros(f.unpack(obs.observation),
-                               aif.feature_dimensions.screen)
+                               aif.feature_dimensions.screen,
+                               self._feature_screen_dtype)
                       for f in SCREEN_FEATURES]),
             names=[ScreenFeatures, None, None])
-      with sw("feature_minimap"):
-        out["feature_minimap"] = named_array.NamedNumpyArray(
+
+      @observe("feature_minimap")
+      def feature_minimap():
+        return named_array.NamedNumpyArray(
             np.stack([or_zeros(f.unpack(obs.observation),
-                               aif.feature_dimensions.minimap)
+                               aif.feature_dimensions.minimap,
+                               self._feature_minimap_dtype)
                       for f in MINIMAP_FEATURES]),
             names=[MinimapFeatures, None, None])
 
     if aif.rgb_dimensions:
-      with sw("rgb_screen"):
-        out["rgb_screen"] = Feature.unpack_rgb_image(
-            obs.observation.render_data.map).astype(np.int32)
-      with sw("rgb_minimap"):
-        out["rgb_minimap"] = Feature.unpack_rgb_image(
-            obs.observation.render_data.minimap).astype(np.int32)
+      @observe("rgb_screen")
+      def rgb_screen():
+        return Feature.unpack_rgb_image(
+            obs.observation.render_data.map).astype(self._rgb_dtype)
+
+      @observe("rgb_minimap")
+      def rgb_minimap():
+        return Feature.unpack_rgb_image(
+            obs.observation.render_data.minimap).astype(self._rgb_dtype)
 
     if not self._raw:
-      with sw("last_actions"):
-        out["last_actions"] = np.array(
+      @observe("last_actions")
+      def last_actions():
+        return np.array(
             [self.reverse_action(a).function for a in obs.actions],
             dtype=np.int32)
 
-    out["action_result"] = np.array([o.result for o in obs.action_errors],
-                                    dtype=np.int32)
+    @observe("action_result")
+    def action_result():
+      return np.array([o.result for o in obs.action_errors], dtype=np.int32)
 
-    out["alerts"] = np.array(obs.observation.alerts, dtype=np.int32)
+    @observe("alerts")
+    def alerts():
+      return np.array(obs.observation.alerts, dtype=np.int32)
 
-    out["game_loop"] = np.array([obs.observation.game_loop], dtype=np.int32)
+    @observe("game_loop")
+    def game_loop():
+      return np.array([obs.observation.game_loop], dtype=np.int32)
 
-    with sw("score"):
+    @observe("score_cumulative", "score_by_category", "score_by_vital")
+    def score():
       score_details = obs.observation.score.score_details
-      out["score_cumulative"] = named_array.NamedNumpyArray([
+      score_cumulative = named_array.NamedNumpyArray([
           obs.observation.score.score,
           score_details.idle_production_time,
           score_details.idle_worker_time,
@@ -1205,30 +1625,39 @@ class Features(object):
         row = getattr(details, key.name)
         return [getattr(row, category.name) for category in categories]
 
-      out["score_by_category"] = named_array.NamedNumpyArray([
+      score_by_category = named_array.NamedNumpyArray([
           get_score_details(key, score_details, ScoreCategories)
           for key in ScoreByCategory
       ], names=[ScoreByCategory, ScoreCategories], dtype=np.int32)
 
-      out["score_by_vital"] = named_array.NamedNumpyArray([
+      score_by_vital = named_array.NamedNumpyArray([
           get_score_details(key, score_details, ScoreVitals)
           for key in ScoreByVital
       ], names=[ScoreByVital, ScoreVitals], dtype=np.int32)
 
+      return {
+          "score_cumulative": score_cumulative,
+          "score_by_category": score_by_category,
+          "score_by_vital": score_by_vital,
+      }
+
     player = obs.observation.player_common
-    out["player"] = named_array.NamedNumpyArray([
-        player.player_id,
-        player.minerals,
-        player.vespene,
-        player.food_used,
-        player.food_cap,
-        player.food_army,
-        player.food_workers,
-        player.idle_worker_count,
-        player.army_count,
-        player.warp_gate_count,
-        player.larva_count,
-    ], names=Player, dtype=np.int32)
+
+    @observe("player")
+    def player_common():
+      return named_array.NamedNumpyArray([
+          player.player_id,
+          player.minerals,
+          player.vespene,
+          player.food_used,
+          player.food_cap,
+          player.food_army,
+          player.food_workers,
+          player.idle_worker_count,
+          player.army_count,
+          player.warp_gate_count,
+          player.larva_count,
+      ], names=Player, dtype=np.int32)
 
     def unit_vec(u):
       return np.array((
@@ -1241,39 +1670,52 @@ class Features(object):
           int(u.build_progress * 100),  # discretize
       ), dtype=np.int32)
 
-    ui = obs.observation.ui_data
+    @observe("control_groups", "single_select", "multi_select", "build_queue",
+             "cargo", "cargo_slots_available", "production_queue")
+    def ui():
+      ui = obs.observation.ui_data
+      empty_unit = np.array([], dtype=np.int32).reshape((0, len(UnitLayer)))
+      ui_out = {  # Fill out some that are sometimes empty.
+          "single_select": empty_unit,
+          "multi_select": empty_unit,
+          "build_queue": empty_unit,
+          "cargo": empty_unit,
+          "production_queue": np.array([], dtype=np.int32).reshape(
+              (0, len(ProductionQueue))),
+          "cargo_slots_available": np.array([0], dtype=np.int32),
+      }
 
-    with sw("ui"):
       groups = np.zeros((10, 2), dtype=np.int32)
       for g in ui.groups:
         groups[g.control_group_index, :] = (g.leader_unit_type, g.count)
-      out["control_groups"] = groups
+      ui_out["control_groups"] = groups
 
       if ui.HasField("single"):
-        out["single_select"] = named_array.NamedNumpyArray(
+        ui_out["single_select"] = named_array.NamedNumpyArray(
             [unit_vec(ui.single.unit)], [None, UnitLayer])
       elif ui.HasField("multi"):
-        out["multi_select"] = named_array.NamedNumpyArray(
+        ui_out["multi_select"] = named_array.NamedNumpyArray(
             [unit_vec(u) for u in ui.multi.units], [None, UnitLayer])
       elif ui.HasField("cargo"):
-        out["single_select"] = named_array.NamedNumpyArray(
+        ui_out["single_select"] = named_array.NamedNumpyArray(
             [unit_vec(ui.cargo.unit)], [None, UnitLayer])
-        out["cargo"] = named_array.NamedNumpyArray(
+        ui_out["cargo"] = named_array.NamedNumpyArray(
             [unit_vec(u) for u in ui.cargo.passengers], [None, UnitLayer])
-        out["cargo_slots_available"] = np.array([ui.cargo.slots_available],
-                                                dtype=np.int32)
+        ui_out["cargo_slots_available"] = np.array([ui.cargo.slots_available],
+                                                   dtype=np.int32)
       elif ui.HasField("production"):
-        out["single_select"] = named_array.NamedNumpyArray(
+        ui_out["single_select"] = named_array.NamedNumpyArray(
             [unit_vec(ui.production.unit)], [None, UnitLayer])
         if ui.production.build_queue:
-          out["build_queue"] = named_array.NamedNumpyArray(
+          ui_out["build_queue"] = named_array.NamedNumpyArray(
               [unit_vec(u) for u in ui.production.build_queue],
               [None, UnitLayer], dtype=np.int32)
         if ui.production.production_queue:
-          out["production_queue"] = named_array.NamedNumpyArray(
+          ui_out["production_queue"] = named_array.NamedNumpyArray(
               [(item.ability_id, item.build_progress * 100)
                for item in ui.production.production_queue],
               [None, ProductionQueue], dtype=np.int32)
+      return ui_out
 
     tag_types = {}  # Only populate the cache if it's needed.
     def get_addon_type(tag):
@@ -1282,132 +1724,8 @@ class Features(object):
           tag_types[u.tag] = u.unit_type
       return tag_types.get(tag, 0)
 
-    def full_unit_vec(u, pos_transform, is_raw=False):
-      """Compute unit features."""
-      screen_pos = pos_transform.fwd_pt(
-          point.Point.build(u.pos))
-      screen_radius = pos_transform.fwd_dist(u.radius)
-      def raw_order(i):
-        if len(u.orders) > i:
-          # TODO(tewalds): Return a generalized func id.
-          return actions.RAW_ABILITY_ID_TO_FUNC_ID.get(
-              u.orders[i].ability_id, 0)
-        return 0
-      features = [
-          # Match unit_vec order
-          u.unit_type,
-          u.alliance,  # Self = 1, Ally = 2, Neutral = 3, Enemy = 4
-          u.health,
-          u.shield,
-          u.energy,
-          u.cargo_space_taken,
-          int(u.build_progress * 100),  # discretize
-
-          # Resume API order
-          int(u.health / u.health_max * 255) if u.health_max > 0 else 0,
-          int(u.shield / u.shield_max * 255) if u.shield_max > 0 else 0,
-          int(u.energy / u.energy_max * 255) if u.energy_max > 0 else 0,
-          u.display_type,  # Visible = 1, Snapshot = 2, Hidden = 3
-          u.owner,  # 1-15, 16 = neutral
-          screen_pos.x,
-          screen_pos.y,
-          u.facing,
-          screen_radius,
-          u.cloak,  # Cloaked = 1, CloakedDetected = 2, NotCloaked = 3
-          u.is_selected,
-          u.is_blip,
-          u.is_powered,
-          u.mineral_contents,
-          u.vespene_contents,
-
-          # Not populated for enemies or neutral
-          u.cargo_space_max,
-          u.assigned_harvesters,
-          u.ideal_harvesters,
-          u.weapon_cooldown,
-          len(u.orders),
-          raw_order(0),
-          raw_order(1),
-          u.tag if is_raw else 0,
-          u.is_hallucination,
-          u.buff_ids[0] if len(u.buff_ids) >= 1 else 0,
-          u.buff_ids[1] if len(u.buff_ids) >= 2 else 0,
-          get_addon_type(u.add_on_tag) if u.add_on_tag else 0,
-          u.is_active,
-          u.is_on_screen,
-          int(u.orders[0].progress * 100) if len(u.orders) >= 1 else 0,
-          int(u.orders[1].progress * 100) if len(u.orders) >= 2 else 0,
-          raw_order(2),
-          raw_order(3),
-          0,
-          u.buff_duration_remain,
-          u.buff_duration_max,
-          u.attack_upgrade_level,
-          u.armor_upgrade_level,
-          u.shield_upgrade_level,
-      ]
-      return features
-
     raw = obs.observation.raw_data
 
-    if aif.use_feature_units:
-      with sw("feature_units"):
-        # Update the camera location so we can calculate world to screen pos
-        self._update_camera(point.Point.build(raw.player.camera))
-        feature_units = [full_unit_vec(u, self._world_to_feature_screen_px)
-                         for u in raw.units if u.is_on_screen]
-        out["feature_units"] = named_array.NamedNumpyArray(
-            feature_units, [None, FeatureUnit], dtype=np.int64)
-
-        feature_effects = []
-        feature_screen_size = aif.feature_dimensions.screen
-        for effect in raw.effects:
-          for pos in effect.pos:
-            screen_pos = self._world_to_feature_screen_px.fwd_pt(
-                point.Point.build(pos))
-            if (0 <= screen_pos.x < feature_screen_size.x and
-                0 <= screen_pos.y < feature_screen_size.y):
-              feature_effects.append([
-                  effect.effect_id,
-                  effect.alliance,
-                  effect.owner,
-                  effect.radius,
-                  screen_pos.x,
-                  screen_pos.y,
-              ])
-        out["feature_effects"] = named_array.NamedNumpyArray(
-            feature_effects, [None, EffectPos], dtype=np.int32)
-
-    if aif.use_raw_units:
-      with sw("raw_units"):
-        with sw("to_list"):
-          raw_units = [full_unit_vec(u, self._world_to_minimap_px, is_raw=True)
-                       for u in raw.units]
-        with sw("to_numpy"):
-          out["raw_units"] = named_array.NamedNumpyArray(
-              raw_units, [None, FeatureUnit], dtype=np.int64)
-        if raw_units:
-          self._raw_tags = out["raw_units"][:, FeatureUnit.tag]
-        else:
-          self._raw_tags = np.array([])
-
-        raw_effects = []
-        for effect in raw.effects:
-          for pos in effect.pos:
-            raw_pos = self._world_to_minimap_px.fwd_pt(point.Point.build(pos))
-            raw_effects.append([
-                effect.effect_id,
-                effect.alliance,
-                effect.owner,
-                effect.radius,
-                raw_pos.x,
-                raw_pos.y,
-            ])
-        out["raw_effects"] = named_array.NamedNumpyArray(
-            raw_effects, [None, EffectPos], dtype=np.int32)
-
-    out["upgrades"] = np.array(raw.player.upgrade_ids, dtype=np.int32)
-
     def cargo_units(u, pos_transform, is_raw=False):
       """Compute unit features."""
       screen_pos = pos_transform.fwd_pt(
@@ -1464,10 +1782,34 @@ class Features(object):
         ])
       return features
 
-    if aif.add_cargo_to_units:
-      with sw("add_cargo_to_units"):
-        if aif.use_feature_units:
-          with sw("feature_units"):
+    if aif.use_feature_units:
+      @observe("feature_units", "feature_effects")
+      def feature_units():
+        # Update the camera location so we can calculate world to screen pos
+        self._update_camera(point.Point.build(raw.player.camera))
+        feature_units = _full_unit_array(
+            [u for u in raw.units if u.is_on_screen],
+            self._world_to_feature_screen_px, get_addon_type)
+
+        feature_effects = []
+        feature_screen_size = aif.feature_dimensions.screen
+        for effect in raw.effects:
+          for pos in effect.pos:
+            screen_pos = self._world_to_feature_screen_px.fwd_pt(
+                point.Point.build(pos))
+            if (0 <= screen_pos.x < feature_screen_size.x and
+                0 <= screen_pos.y < feature_screen_size.y):
+              feature_effects.append([
+                  effect.effect_id,
+                  effect.alliance,
+                  effect.owner,
+                  effect.radius,
+                  screen_pos.x,
+                  screen_pos.y,
+              ])
+
+        if aif.add_cargo_to_units:
+          with sw("add_cargo_to_units"):
             with sw("to_list"):
               feature_cargo_units = []
               for u in raw.units:
@@ -1476,14 +1818,38 @@ class Features(object):
                       u, self._world_to_feature_screen_px)
             with sw("to_numpy"):
               if feature_cargo_units:
-                all_feature_units = np.array(
-                    feature_cargo_units, dtype=np.int64)
                 all_feature_units = np.concatenate(
-                    [out["feature_units"], feature_cargo_units], axis=0)
-                out["feature_units"] = named_array.NamedNumpyArray(
+                    [feature_units, feature_cargo_units], axis=0)
+                feature_units = named_array.NamedNumpyArray(
                     all_feature_units, [None, FeatureUnit], dtype=np.int64)
-        if aif.use_raw_units:
-          with sw("raw_units"):
+
+        return {
+            "feature_units": feature_units,
+            "feature_effects": named_array.NamedNumpyArray(
+                feature_effects, [None, EffectPos], dtype=np.int32),
+        }
+
+    if aif.use_raw_units:
+      @observe("raw_units", "raw_effects")
+      def raw_units():
+        raw_units = _full_unit_array(
+            raw.units, self._world_to_minimap_px, get_addon_type, is_raw=True)
+
+        raw_effects = []
+        for effect in raw.effects:
+          for pos in effect.pos:
+            raw_pos = self._world_to_minimap_px.fwd_pt(point.Point.build(pos))
+            raw_effects.append([
+                effect.effect_id,
+                effect.alliance,
+                effect.owner,
+                effect.radius,
+                raw_pos.x,
+                raw_pos.y,
+            ])
+
+        if aif.add_cargo_to_units:
+          with sw("add_cargo_to_units"):
             with sw("to_list"):
               raw_cargo_units = []
               for u in raw.units:
@@ -1493,31 +1859,56 @@ class Features(object):
               if raw_cargo_units:
                 raw_cargo_units = np.array(raw_cargo_units, dtype=np.int64)
                 all_raw_units = np.concatenate(
-                    [out["raw_units"], raw_cargo_units], axis=0)
-                out["raw_units"] = named_array.NamedNumpyArray(
+                    [raw_units, raw_cargo_units], axis=0)
+                raw_units = named_array.NamedNumpyArray(
                     all_raw_units, [None, FeatureUnit], dtype=np.int64)
-                self._raw_tags = out["raw_units"][:, FeatureUnit.tag]
+
+        return {
+            "raw_units": raw_units,
+            "raw_effects": named_array.NamedNumpyArray(
+                raw_effects, [None, EffectPos], dtype=np.int32),
+        }
+
+      # Built the first time an action needs it, so lazy observations needn't
+      # compute raw_units for it.
+      @functools.lru_cache(maxsize=None)
+      def raw_tag_index():
+        if len(out["raw_units"]):  # pylint: disable=g-explicit-length-test
+          return TagIndex(out["raw_units"][:, FeatureUnit.tag])
+        return TagIndex([])
+      self._raw_tag_index = raw_tag_index
+      self._raw_tag_index_obs = out
+
+    @observe("upgrades")
+    def upgrades():
+      return np.array(raw.player.upgrade_ids, dtype=np.int32)
 
     if aif.use_unit_counts:
-      with sw("unit_counts"):
+      @observe("unit_counts")
+      def unit_counts():
         unit_counts = collections.defaultdict(int)
         for u in raw.units:
           if u.alliance == sc_raw.Self:
             unit_counts[u.unit_type] += 1
-        out["unit_counts"] = named_array.NamedNumpyArray(
+        return named_array.NamedNumpyArray(
             sorted(unit_counts.items()), [None, UnitCounts], dtype=np.int32)
 
     if aif.use_camera_position:
-      camera_position = self._world_to_minimap_px.fwd_pt(
-          point.Point.build(raw.player.camera))
-      out["camera_position"] = np.array((camera_position.x, camera_position.y),
-                                        dtype=np.int32)
+      @observe("camera_position")
+      def camera_position():
+        camera_position = self._world_to_minimap_px.fwd_pt(
+            point.Point.build(raw.player.camera))
+        return np.array((camera_position.x, camera_position.y),
+                        dtype=np.int32)
+
       out["camera_size"] = np.array((self._camera_size.x, self._camera_size.y),
                                     dtype=np.int32)
 
     if not self._raw:
-      out["available_actions"] = np.array(
-          self.available_actions(obs.observation), dtype=np.int32)
+      @observe("available_actions")
+      def available_actions():
+        return np.flatnonzero(
+            self.available_actions_mask(obs.observation)).astype(np.int32)
 
     if self._requested_races is not None:
       out["home_race_requested"] = np.array(
@@ -1527,12 +1918,14 @@ class Features(object):
           out["away_race_requested"] = np.array((race,), dtype=np.int32)
 
     if aif.use_feature_units or aif.use_raw_units:
-      def transform_radar(radar):
-        p = self._world_to_minimap_px.fwd_pt(point.Point.build(radar.pos))
-        return p.x, p.y, radar.radius
-      out["radar"] = named_array.NamedNumpyArray(
-          list(map(transform_radar, obs.observation.raw_data.radar)),
-          [None, Radar], dtype=np.int32)
+      @observe("radar")
+      def radar():
+        def transform_radar(radar):
+          p = self._world_to_minimap_px.fwd_pt(point.Point.build(radar.pos))
+          return p.x, p.y, radar.radius
+        return named_array.NamedNumpyArray(
+            list(map(transform_radar, obs.observation.raw_data.radar)),
+            [None, Radar], dtype=np.int32)
 
     # Send the entire proto as well (in a function, so it isn't copied).
     if self._send_observation_proto:
@@ -1541,34 +1934,53 @@ class Features(object):
     return out
 
   @sw.decorate
-  def available_actions(self, obs):
-    """Return the list of available action ids."""
-    available_actions = set()
-    hide_specific_actions = self._agent_interface_format.hide_specific_actions
-    for i, func in actions.FUNCTIONS_AVAILABLE.items():
-      if func.avail_fn(obs):
-        available_actions.add(i)
+  def available_actions_mask(self, obs):
+    """Return a bool mask over the function ids, True for available ones."""
+    mask = np.zeros(len(actions.FUNCTIONS), dtype=bool)
+    mask[self._available_ui_func_ids] = [
+        func.avail_fn(obs) for func in self._available_ui_funcs]
+    func_ids = []
     for a in obs.abilities:
-      if a.ability_id not in actions.ABILITY_IDS:
+      ids = self._available_abilities.get((a.ability_id, a.requires_point))
+      if ids is not None:
+        func_ids.append(ids)
+      elif a.ability_id not in actions.ABILITY_IDS:
         logging.warning("Unknown ability %s seen as available.", a.ability_id)
-        continue
-      found_applicable = False
-      for func in actions.ABILITY_IDS[a.ability_id]:
-        if func.function_type in actions.POINT_REQUIRED_FUNCS[a.requires_point]:
-          if func.general_id == 0 or not hide_specific_actions:
-            available_actions.add(func.id)
-            found_applicable = True
-          if func.general_id != 0:  # Always offer generic actions.
-            for general_func in actions.ABILITY_IDS[func.general_id]:
-              if general_func.function_type is func.function_type:
-                # Only the right type. Don't want to expose the general action
-                # to minimap if only the screen version is available.
-                available_actions.add(general_func.id)
-                found_applicable = True
-                break
-      if not found_applicable:
+      else:
         raise ValueError("Failed to find applicable action for {}".format(a))
-    return list(available_actions)
+    if func_ids:
+      mask[np.concatenate(func_ids)] = True
+    self._available_actions_cache = (obs, self._available_actions_key(obs),
+                                     mask.copy())
+    return mask
+
+  @staticmethod
+  def _available_actions_key(obs):
+    # The identity of obs isn't enough, as protos can be changed in place.
+    return obs.game_loop, len(obs.abilities)
+
+  def _cached_available_actions_mask(self, obs):
+    """Like `available_actions_mask`, but reuses the mask for the same obs.
+
+    `transform_obs` computes the mask, so the actions for that observation can
+    be validated in constant time. The mask returned mustn't be modified.
+
+    Args:
+      obs: A `sc_pb.Observation`.
+
+    Returns:
+      A bool mask over the function ids, True for available ones.
+    """
+    cache = self._available_actions_cache
+    if (cache is not None and cache[0] is obs and
+        cache[1] == self._available_actions_key(obs)):
+      return cache[2]
+    self.available_actions_mask(obs)
+    return self._available_actions_cache[2]
+
+  def available_actions(self, obs):
+    """Return the list of available action ids."""
+    return np.flatnonzero(self.available_actions_mask(obs)).tolist()
 
   @sw.decorate
   def transform_action(self, obs, func_call, skip_available=False):
@@ -1602,7 +2014,7 @@ class Features(object):
 
     # Available?
     if not (skip_available or self._raw or
-            func_id in self.available_actions(obs)):
+            self._cached_available_actions_mask(obs)[func_id]):
       raise ValueError("Function %s/%s is currently not available" % (
           func_id, func.name))
 
@@ -1646,8 +2058,20 @@ class Features(object):
     kwargs = {type_.name: type_.fn(a)
               for type_, a in zip(func.args, func_call.arguments)}
 
-    # Call the right callback to get an SC2 action proto.
     sc2_action = sc_pb.Action()
+    self._fill_action(sc2_action, func, kwargs, self._raw_tag_index)
+    return sc2_action
+
+  def _fill_action(self, sc2_action, func, kwargs, tag_index):
+    """Call the right callback to fill in an SC2 action proto.
+
+    Args:
+      sc2_action: The `sc_pb.Action` to fill in.
+      func: The `actions.Function` to call.
+      kwargs: Its arguments, already validated and converted to python types.
+      tag_index: A function returning the `TagIndex` to map unit positions to
+          tags with. Only called if it's needed.
+    """
     kwargs["action"] = sc2_action
     if func.ability_id:
       kwargs["ability_id"] = func.ability_id
@@ -1655,24 +2079,112 @@ class Features(object):
     if self._raw:
       if "world" in kwargs:
         kwargs["world"] = self._world_to_minimap_px.back_pt(kwargs["world"])
-      def find_original_tag(position):
-        if position >= len(self._raw_tags):  # Assume it's a real unit tag.
-          return position
-        original_tag = self._raw_tags[position]
-        if original_tag == 0:
-          logging.warning("Tag not found: %s", original_tag)
-        return original_tag
       if "target_unit_tag" in kwargs:
-        kwargs["target_unit_tag"] = find_original_tag(
-            kwargs["target_unit_tag"][0])
+        kwargs["target_unit_tag"] = (tag_index().tags(
+            kwargs["target_unit_tag"][:1]) or [0])[0]
       if "unit_tags" in kwargs:
-        kwargs["unit_tags"] = [find_original_tag(t)
-                               for t in kwargs["unit_tags"]]
-      actions.RAW_FUNCTIONS[func_id].function_type(**kwargs)
+        kwargs["unit_tags"] = tag_index().tags(kwargs["unit_tags"])
     else:
-      kwargs["action_space"] = aif.action_space
-      actions.FUNCTIONS[func_id].function_type(**kwargs)
-    return sc2_action
+      kwargs["action_space"] = self._agent_interface_format.action_space
+    func.function_type(**kwargs)
+
+  @sw.decorate
+  def transform_actions_batch(self, observations, function_ids, arguments,
+                              skip_available=False, tag_indices=None):
+    """Transform a batch of agent actions, eg one per env, into SC2 requests.
+
+    This is the batched version of `transform_action`. The actions are given as
+    arrays rather than `FunctionCall`s, and are validated all at once.
+
+    Args:
+      observations: The `sc_pb.Observation` each action is taken after, to check
+          the actions are available. May be None if `skip_available`.
+      function_ids: An int array of shape [batch] of function ids.
+      arguments: A dict of argument type name to an int array of its values,
+          with shape [batch, len(sizes)], or [batch] if it has a single value.
+          `unit_tags` is [batch, max_tags], padded with -1. Only the arguments
+          of each row's function are read, and arguments no function in the
+          batch takes may be left out.
+      skip_available: If True, assume the actions are available.
+      tag_indices: For raw actions, the `TagIndex` of each row's observation,
+          to map unit positions to tags. Defaults to the index of the last
+          observation transformed by this `Features`.
+
+    Returns:
+      A list of `sc_pb.RequestAction`, one per row, each with a single action.
+
+    Raises:
+      ValueError: if any action doesn't pass validation. The message says which
+          rows failed.
+    """
+    funcs = actions.RAW_FUNCTIONS if self._raw else actions.FUNCTIONS
+    types = self._valid_functions.types
+    function_ids = np.asarray(function_ids, dtype=np.int64).reshape(-1)
+    batch_size = len(function_ids)
+    if not batch_size:
+      return []
+
+    def check(ok, message):
+      if not np.all(ok):
+        rows = np.flatnonzero(~ok)
+        raise ValueError("%s for rows %s, function ids: %s" % (
+            message, rows.tolist(), function_ids[rows].tolist()))
+
+    check((function_ids >= 0) & (function_ids < len(funcs)),
+          "Invalid function id")
+
+    if not (skip_available or self._raw):
+      masks = np.stack([self._cached_available_actions_mask(obs)
+                        for obs in observations])
+      check(masks[np.arange(batch_size), function_ids],
+            "Function is currently not available")
+
+    # Which argument types each function takes, [function, type].
+    if self._batch_arg_types is None:
+      self._batch_arg_types = np.zeros((len(funcs), len(types)), dtype=bool)
+      for func in funcs:
+        self._batch_arg_types[func.id, [t.id for t in func.args]] = True
+    uses = self._batch_arg_types[function_ids]
+
+    values = {}  # Argument name -> a list of python values per row.
+    for t in types:
+      used = uses[:, t.id]
+      if not used.any():
+        continue
+      if t.name not in arguments:
+        raise ValueError("Missing argument %s for rows %s" % (
+            t.name, np.flatnonzero(used).tolist()))
+      arg = np.asarray(arguments[t.name], dtype=np.int64)
+      arg = arg.reshape(batch_size, -1)
+      if t.name in ("unit_tags", "target_unit_tag"):
+        count = actions.RAW_TYPES[t.id].count
+        num = (arg >= 0).sum(axis=1)
+        check(~used | ((1 <= num) & (num <= count)),
+              "Wrong number of values for argument %s" % t.name)
+        values[t.name] = [[v for v in row if v >= 0] for row in arg.tolist()]
+      else:
+        if arg.shape[1] != len(t.sizes):
+          raise ValueError("Wrong number of values for argument %s: %s" % (
+              t.name, arg.shape))
+        in_range = np.all((arg >= 0) & (arg < t.sizes), axis=1)
+        check(~used | in_range, "Argument %s is out of range" % t.name)
+        values[t.name] = arg.tolist()
+
+    requests = []
+    for row, func_id in enumerate(function_ids.tolist()):
+      func = funcs[func_id]
+      kwargs = {t.name: (values[t.name][row] if t.count else
+                         t.fn(values[t.name][row]))
+                for t in func.args}
+      request = sc_pb.RequestAction()
+      if tag_indices is None:
+        tag_index = self._raw_tag_index
+      else:
+        # Called right away, so the loop variable is still current.
+        tag_index = lambda: tag_indices[row]  # pylint: disable=cell-var-from-loop
+      self._fill_action(request.actions.add(), func, kwargs, tag_index)
+      requests.append(request)
+    return requests
 
   @sw.decorate
   def reverse_action(self, action):
@@ -1792,13 +2304,17 @@ class Features(object):
       ValueError: if it doesn't know how to transform this action.
     """
     aif = self._agent_interface_format
-    raw_tags = prev_obs["raw_units"][:, FeatureUnit.tag]
-    def find_tag_position(original_tag):
-      for i, tag in enumerate(raw_tags):
-        if tag == original_tag:
-          return i
-      logging.warning("Not found tag! %s", original_tag)
-      return -1
+    if prev_obs is self._raw_tag_index_obs:
+      tag_index = self._raw_tag_index()
+    else:
+      tag_index = TagIndex(prev_obs["raw_units"][:, FeatureUnit.tag])
+
+    def find_tag_positions(original_tags):
+      """Return the positions of the tags, dropping any that aren't found."""
+      positions = tag_index.positions(list(original_tags))
+      for tag in np.asarray(original_tags)[positions == -1]:
+        logging.warning("Not found tag! %s", tag)
+      return positions[positions != -1].tolist()
 
     def func_call_ability(ability_id, cmd_type, *args):
       """Get the function id for a specific ability id and action type."""
@@ -1825,18 +2341,16 @@ class Features(object):
         uc = raw_act.unit_command
         ability_id = uc.ability_id
         queue_command = uc.queue_command
-        unit_tags = (find_tag_position(t) for t in uc.unit_tags)
-        # Remove invalid units.
-        unit_tags = [t for t in unit_tags if t != -1]
+        unit_tags = find_tag_positions(uc.unit_tags)
         if not unit_tags:
           return actions.RAW_FUNCTIONS.no_op()
 
         if uc.HasField("target_unit_tag"):
-          target_unit_tag = find_tag_position(uc.target_unit_tag)
-          if target_unit_tag == -1:
+          target_unit_tag = find_tag_positions([uc.target_unit_tag])
+          if not target_unit_tag:
             return actions.RAW_FUNCTIONS.no_op()
           return func_call_ability(ability_id, actions.raw_cmd_unit,
-                                   queue_command, unit_tags, target_unit_tag)
+                                   queue_command, unit_tags, target_unit_tag[0])
         if uc.HasField("target_world_space_pos"):
           coord = point.Point.build(uc.target_world_space_pos)
           coord = self._world_to_minimap_px.fwd_pt(coord)
@@ -1849,9 +2363,7 @@ class Features(object):
       if raw_act.HasField("toggle_autocast"):
         uc = raw_act.toggle_autocast
         ability_id = uc.ability_id
-        unit_tags = (find_tag_position(t) for t in uc.unit_tags)
-        # Remove invalid units.
-        unit_tags = [t for t in unit_tags if t != -1]
+        unit_tags = find_tag_positions(uc.unit_tags)
         if not unit_tags:
           return actions.RAW_FUNCTIONS.no_op()
         return func_call_ability(ability_id, actions.raw_autocast, unit_tags)
@@ -1873,6 +2385,9 @@ class Passthrough:
   def observation_spec(self):
     return {}
 
+  def observation_dtypes(self):
+    return {}
+
   def transform_obs(self, observation):
     return observation
 
@@ -1889,6 +2404,11 @@ class Passthrough:
     raise NotImplementedError(
         "available_actions isn't supported for passthrough")
 
+  def available_actions_mask(self, observation):
+    del observation
+    raise NotImplementedError(
+        "available_actions_mask isn't supported for passthrough")
+
   def reverse_action(self, action):
     del action
     raise NotImplementedError("reverse_action isn't supported for passthrough")
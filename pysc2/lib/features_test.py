@@ -16,6 +16,8 @@
 
 import copy
 import pickle
+import random
+from unittest import mock
 
 from absl.testing import absltest
 from absl.testing import parameterized
@@ -23,8 +25,11 @@ import numpy
 from pysc2.lib import actions
 from pysc2.lib import features
 from pysc2.lib import point
+from pysc2.lib import units
+from pysc2.tests import dummy_observation
 
 from google.protobuf import text_format
+from s2clientprotocol import common_pb2
 from s2clientprotocol import sc2api_pb2 as sc_pb
 
 
@@ -76,6 +81,56 @@ class AvailableActionsTest(absltest.TestCase):
   def testAlways(self):
     self.assertAvail([])
 
+  def testMaskMatchesIds(self):
+    self.obs.player_common.army_count = 3
+    self.obs.abilities.add(ability_id=17, requires_point=True)
+    mask = self.features.available_actions_mask(self.obs)
+    self.assertEqual(mask.dtype, bool)
+    self.assertLen(mask, len(actions.FUNCTIONS))
+    self.assertEqual(numpy.flatnonzero(mask).tolist(),
+                     sorted(self.features.available_actions(self.obs)))
+    self.assertTrue(mask[actions.FUNCTIONS.Patrol_minimap.id])
+    self.assertFalse(mask[actions.FUNCTIONS.select_larva.id])
+
+  def testRawActions(self):
+    self.features = features.Features(features.AgentInterfaceFormat(
+        use_raw_units=True, use_raw_actions=True, hide_specific_actions=True),
+                                      map_size=point.Point(64, 64))
+    self.obs.abilities.add(ability_id=17, requires_point=True)
+    self.assertAvail(["Patrol_screen", "Patrol_minimap"])
+    self.assertTrue(self.features.available_actions_mask(self.obs)[
+        actions.FUNCTIONS.Patrol_minimap.id])
+
+  def testTransformActionReusesAvailableActions(self):
+    self.obs.abilities.add(ability_id=17, requires_point=True)
+    patrol = actions.FUNCTIONS.Patrol_minimap("now", [1, 2])
+    with mock.patch.object(self.features, "available_actions_mask",
+                           wraps=self.features.available_actions_mask) as mask:
+      for _ in range(3):
+        self.features.transform_action(self.obs, patrol)
+      self.assertEqual(mask.call_count, 1)
+
+      # A changed observation is checked again.
+      self.obs.abilities.add(ability_id=23, requires_point=True)
+      self.features.transform_action(
+          self.obs, actions.FUNCTIONS.Attack_minimap("now", [1, 2]))
+      self.assertEqual(mask.call_count, 2)
+
+    self.obs.game_loop += 1
+    self.obs.ClearField("abilities")
+    self.obs.abilities.add(ability_id=23, requires_point=True)
+    with self.assertRaisesRegex(ValueError, "not available"):
+      self.features.transform_action(self.obs, patrol)
+
+  def testUnknownAbilityIsIgnored(self):
+    self.obs.abilities.add(ability_id=999999)
+    self.assertAvail([])
+
+  def testInapplicableAbilityRaises(self):
+    self.obs.abilities.add(ability_id=32, requires_point=True)  # Salvage
+    with self.assertRaises(ValueError):
+      self.features.available_actions(self.obs)
+
   def testSelectUnit(self):
     self.obs.ui_data.multi.units.add(unit_type=1)
     self.assertAvail(["select_unit"])
@@ -206,6 +261,40 @@ class AvailableActionsTest(absltest.TestCase):
     ])
 
 
+class TagIndexTest(absltest.TestCase):
+
+  def testPositions(self):
+    index = features.TagIndex([57, 12, 99, 12, 40])
+    self.assertLen(index, 5)
+    self.assertEqual(index.positions([99, 12, 1234, 57, 40]).tolist(),
+                     [2, 1, -1, 0, 4])
+    self.assertEqual(index.positions(numpy.array([], dtype=numpy.int64)).shape,
+                     (0,))
+
+  def testTags(self):
+    index = features.TagIndex([57, 12, 99])
+    tags = index.tags([2, 0, 12345])  # Past the end is a real tag already.
+    self.assertEqual(tags, [99, 57, 12345])
+    self.assertIsInstance(tags[0], int)
+
+  def testTagsSkipsPadding(self):
+    index = features.TagIndex([57, 0, 0])  # Padded raw_units rows.
+    with mock.patch.object(features.logging, "warning") as warning:
+      self.assertEqual(index.tags([1, 0, 2]), [57])
+    warning.assert_not_called()
+
+  def testEmpty(self):
+    index = features.TagIndex([])
+    self.assertEqual(index.positions([1, 2]).tolist(), [-1, -1])
+    self.assertEqual(index.tags([5]), [5])
+
+  def testEquality(self):
+    self.assertEqual(features.TagIndex([1, 2]), features.TagIndex([1, 2]))
+    self.assertNotEqual(features.TagIndex([1, 2]), features.TagIndex([2, 1]))
+    index = features.TagIndex([3, 1, 2])
+    self.assertEqual(pickle.loads(pickle.dumps(index)), index)
+
+
 class ToPointTest(absltest.TestCase):
 
   def testIntAsString(self):
@@ -492,6 +581,144 @@ class FeaturesTest(absltest.TestCase):
     self.assertEqual(transform("Attack_unit", tag, [tag]).target_unit_tag, tag)
     self.assertEqual(transform("Attack_unit", tag, [ntag]).target_unit_tag, tag)
 
+  def testReverseRawActionUnitTags(self):
+    feats = features.Features(
+        features.AgentInterfaceFormat(
+            use_raw_units=True,
+            action_space=actions.ActionSpace.RAW),
+        map_size=point.Point(100, 100))
+    raw_units = numpy.zeros((5, len(features.FeatureUnit)), dtype=numpy.int64)
+    raw_units[:, features.FeatureUnit.tag] = [57, 12, 99, 12, 40]
+    prev_obs = {"raw_units": raw_units}
+
+    action = sc_pb.Action()
+    cmd = action.action_raw.unit_command
+    cmd.ability_id = 23  # Attack
+    cmd.unit_tags.extend([99, 12, 1234, 57])  # 1234 isn't a unit, so dropped.
+    cmd.target_unit_tag = 40
+    func_call = feats.reverse_raw_action(action, prev_obs)
+    self.assertEqual(func_call.function, actions.RAW_FUNCTIONS.Attack_unit.id)
+    self.assertEqual(func_call.arguments[1], [2, 1, 0])
+    self.assertEqual(func_call.arguments[2], [4])
+
+    cmd.target_unit_tag = 1234
+    self.assertEqual(feats.reverse_raw_action(action, prev_obs).function,
+                     actions.RAW_FUNCTIONS.no_op.id)
+
+  def testRawTagIndexStaysInternal(self):
+    feats = features.Features(
+        features.AgentInterfaceFormat(
+            use_raw_units=True,
+            action_space=actions.ActionSpace.RAW),
+        map_size=point.Point(100, 100))
+    self.assertNotIn("_raw_tag_index", feats.observation_spec())
+    self.assertNotIn("_raw_tag_index", feats.observation_dtypes())
+
+    obs = sc_pb.ResponseObservation()
+    for tag in (57, 12):
+      obs.observation.raw_data.units.add(tag=tag, unit_type=48, owner=1)
+    transformed = feats.transform_obs(obs)
+    self.assertNotIn("_raw_tag_index", transformed)
+
+    # Actions on the observation map positions back to its tags.
+    func_call = actions.RAW_FUNCTIONS.Attack_unit("now", [1, 0], [1])
+    cmd = feats.transform_action(
+        transformed, func_call, skip_available=True).action_raw.unit_command
+    self.assertEqual(list(cmd.unit_tags), [12, 57])
+    self.assertEqual(cmd.target_unit_tag, 12)
+
+    action = sc_pb.Action()
+    action.action_raw.unit_command.ability_id = 23  # Attack
+    action.action_raw.unit_command.unit_tags.extend([57])
+    action.action_raw.unit_command.target_unit_tag = 12
+    self.assertEqual(feats.reverse_raw_action(action, transformed).arguments,
+                     [[False], [0], [1]])
+
+  def _batch(self, action_spec, func_calls):
+    """Lay out `FunctionCall`s as arrays for `transform_actions_batch`."""
+    arguments = {t.name: numpy.zeros((len(func_calls), len(t.sizes)),
+                                     dtype=numpy.int32)
+                 for t in action_spec.types}
+    for row, func_call in enumerate(func_calls):
+      for t, arg in zip(action_spec.functions[func_call.function].args,
+                        func_call.arguments):
+        arguments[t.name][row] = arg
+    return [f.function for f in func_calls], arguments
+
+  def testTransformActionsBatchMatchesTransformAction(self):
+    feats = features.Features(features.AgentInterfaceFormat(
+        feature_dimensions=RECTANGULAR_DIMENSIONS,
+        hide_specific_actions=False))
+    action_spec = feats.action_spec()
+    func_calls = [self.gen_random_function_call(action_spec, f.id)
+                  for f in action_spec.functions for _ in range(3)]
+    requests = feats.transform_actions_batch(
+        None, *self._batch(action_spec, func_calls), skip_available=True)
+    self.assertLen(requests, len(func_calls))
+    for request, func_call in zip(requests, func_calls):
+      self.assertLen(request.actions, 1)
+      self.assertEqual(
+          request.actions[0],
+          feats.transform_action(None, func_call, skip_available=True),
+          msg=func_call)
+
+  def testTransformActionsBatchRaw(self):
+    feats = features.Features(
+        features.AgentInterfaceFormat(
+            use_raw_units=True,
+            action_space=actions.ActionSpace.RAW),
+        map_size=point.Point(100, 100))
+    function_ids = [actions.RAW_FUNCTIONS.Attack_unit.id,
+                    actions.RAW_FUNCTIONS.Stop_quick.id]
+    arguments = {
+        "queued": [0, 1],
+        "unit_tags": [[1, 0, -1], [2, -1, -1]],
+        "target_unit_tag": [2, 0],
+    }
+    tag_indices = [features.TagIndex([10, 11, 12]),
+                   features.TagIndex([20, 21, 22])]
+    requests = feats.transform_actions_batch(
+        None, function_ids, arguments, tag_indices=tag_indices)
+    attack = requests[0].actions[0].action_raw.unit_command
+    self.assertEqual(attack.unit_tags, [11, 10])
+    self.assertEqual(attack.target_unit_tag, 12)
+    self.assertFalse(attack.queue_command)
+    stop = requests[1].actions[0].action_raw.unit_command
+    self.assertEqual(stop.unit_tags, [22])
+    self.assertFalse(stop.HasField("target_unit_tag"))
+    self.assertTrue(stop.queue_command)
+
+    arguments["unit_tags"] = [[1, 0, -1], [-1, -1, -1]]
+    with self.assertRaisesRegex(ValueError, r"unit_tags for rows \[1\]"):
+      feats.transform_actions_batch(
+          None, function_ids, arguments, tag_indices=tag_indices)
+
+  def testTransformActionsBatchValidates(self):
+    feats = features.Features(features.AgentInterfaceFormat(
+        feature_dimensions=RECTANGULAR_DIMENSIONS))
+    obs = text_format.Parse(observation_text_proto, sc_pb.Observation())
+    move_camera = actions.FUNCTIONS.move_camera.id
+    select_army = actions.FUNCTIONS.select_army.id
+
+    requests = feats.transform_actions_batch(
+        [obs, obs], [move_camera, 0], {"minimap": [[3, 4], [0, 0]]})
+    self.assertEqual(
+        requests[0].actions[0].action_feature_layer.camera_move.center_minimap,
+        common_pb2.PointI(x=3, y=4))
+    self.assertEqual(requests[1].actions[0], sc_pb.Action())
+
+    with self.assertRaisesRegex(ValueError, r"out of range for rows \[1\]"):
+      feats.transform_actions_batch(
+          [obs, obs], [move_camera, move_camera],
+          {"minimap": [[3, 4], [64, 0]]})
+    with self.assertRaisesRegex(ValueError, r"not available for rows \[1\]"):
+      feats.transform_actions_batch(
+          [obs, obs], [0, select_army], {"select_add": [0, 0]})
+    with self.assertRaisesRegex(ValueError, "Invalid function id"):
+      feats.transform_actions_batch([obs], [100000], {}, skip_available=True)
+    with self.assertRaisesRegex(ValueError, "Missing argument minimap"):
+      feats.transform_actions_batch([obs], [move_camera], {})
+
   def testCanPickleSpecs(self):
     feats = features.Features(features.AgentInterfaceFormat(
         feature_dimensions=SQUARE_DIMENSIONS))
@@ -586,5 +813,316 @@ class FeaturesTest(absltest.TestCase):
     self.assertEqual(obs_spec["rgb_minimap"], (77, 74, 3))
 
 
+def _reference_unit_vec(u, pos_transform, tag_types, is_raw=False):
+  """The original per-unit implementation, used to check `transform_obs`."""
+  screen_pos = pos_transform.fwd_pt(point.Point.build(u.pos))
+  screen_radius = pos_transform.fwd_dist(u.radius)
+  def raw_order(i):
+    if len(u.orders) > i:
+      return actions.RAW_ABILITY_ID_TO_FUNC_ID.get(u.orders[i].ability_id, 0)
+    return 0
+  return [
+      u.unit_type,
+      u.alliance,
+      u.health,
+      u.shield,
+      u.energy,
+      u.cargo_space_taken,
+      int(u.build_progress * 100),
+      int(u.health / u.health_max * 255) if u.health_max > 0 else 0,
+      int(u.shield / u.shield_max * 255) if u.shield_max > 0 else 0,
+      int(u.energy / u.energy_max * 255) if u.energy_max > 0 else 0,
+      u.display_type,
+      u.owner,
+      screen_pos.x,
+      screen_pos.y,
+      u.facing,
+      screen_radius,
+      u.cloak,
+      u.is_selected,
+      u.is_blip,
+      u.is_powered,
+      u.mineral_contents,
+      u.vespene_contents,
+      u.cargo_space_max,
+      u.assigned_harvesters,
+      u.ideal_harvesters,
+      u.weapon_cooldown,
+      len(u.orders),
+      raw_order(0),
+      raw_order(1),
+      u.tag if is_raw else 0,
+      u.is_hallucination,
+      u.buff_ids[0] if len(u.buff_ids) >= 1 else 0,
+      u.buff_ids[1] if len(u.buff_ids) >= 2 else 0,
+      tag_types.get(u.add_on_tag, 0) if u.add_on_tag else 0,
+      u.is_active,
+      u.is_on_screen,
+      int(u.orders[0].progress * 100) if len(u.orders) >= 1 else 0,
+      int(u.orders[1].progress * 100) if len(u.orders) >= 2 else 0,
+      raw_order(2),
+      raw_order(3),
+      0,
+      u.buff_duration_remain,
+      u.buff_duration_max,
+      u.attack_upgrade_level,
+      u.armor_upgrade_level,
+      u.shield_upgrade_level,
+  ]
+
+
+class UnitExtractionTest(parameterized.TestCase):
+
+  def setUp(self):
+    super(UnitExtractionTest, self).setUp()
+    self._features = features.Features(
+        features.AgentInterfaceFormat(
+            feature_dimensions=features.Dimensions(screen=(64, 60),
+                                                   minimap=(32, 28)),
+            use_feature_units=True,
+            use_raw_units=True,
+            raw_resolution=(80, 72)),
+        map_size=point.Point(152, 136))
+    self._builder = dummy_observation.Builder(
+        self._features.observation_spec())
+
+  def _random_units(self, rng, count):
+    feature_units = []
+    for _ in range(count):
+      health_max = rng.choice([0, 40, 45.5, 1500])
+      shield_max = rng.choice([0, 20, 150])
+      energy_max = rng.choice([0, 50, 200])
+      feature_units.append(dummy_observation.FeatureUnit(
+          rng.choice([units.Protoss.Probe, units.Terran.Marine,
+                      units.Zerg.Hatchery, units.Terran.Barracks]),
+          rng.choice(list(features.PlayerRelative)[1:]),
+          owner=rng.randint(1, 16),
+          pos=common_pb2.Point(x=rng.uniform(0, 152), y=rng.uniform(0, 136),
+                               z=rng.uniform(0, 16)),
+          radius=rng.uniform(0.25, 3),
+          health=rng.uniform(0, health_max),
+          health_max=health_max,
+          is_on_screen=rng.random() < 0.5,
+          shield=rng.uniform(0, shield_max),
+          shield_max=shield_max,
+          energy=rng.uniform(0, energy_max),
+          energy_max=energy_max,
+          cargo_space_taken=rng.randint(0, 8),
+          cargo_space_max=rng.randint(0, 8),
+          build_progress=rng.random(),
+          facing=rng.uniform(0, 6.3),
+          is_selected=rng.random() < 0.3,
+          mineral_contents=rng.randint(0, 1800),
+          assigned_harvesters=rng.randint(0, 16),
+          weapon_cooldown=rng.uniform(0, 20)))
+    return feature_units
+
+  def _random_observation(self, seed, count):
+    rng = random.Random(seed)
+    self._builder.feature_units(self._random_units(rng, count))
+    obs = self._builder.build()
+    raw_units = obs.observation.raw_data.units
+    for u in raw_units:
+      for _ in range(rng.randint(0, 5)):
+        u.orders.add(ability_id=rng.choice([1, 16, 23, 3674, 880, 999999]),
+                     progress=rng.random())
+      u.buff_ids.extend(rng.sample([5, 11, 27, 99], rng.randint(0, 3)))
+      if rng.random() < 0.2:
+        u.add_on_tag = rng.choice([rng.randint(1, count), 12345])
+      u.is_hallucination = rng.random() < 0.1
+      u.buff_duration_remain = rng.randint(0, 100)
+      u.attack_upgrade_level = rng.randint(0, 3)
+    return obs
+
+  @parameterized.parameters((0, 0), (1, 1), (2, 17), (3, 500))
+  def testMatchesPerUnitImplementation(self, seed, count):
+    obs = self._random_observation(seed, count)
+    transformed = self._features.transform_obs(obs)
+    raw = obs.observation.raw_data
+    tag_types = {u.tag: u.unit_type for u in raw.units}
+
+    expected_raw = numpy.array(
+        [_reference_unit_vec(u, self._features._world_to_minimap_px,
+                             tag_types, is_raw=True)
+         for u in raw.units], dtype=numpy.int64)
+    expected_feature = numpy.array(
+        [_reference_unit_vec(u, self._features._world_to_feature_screen_px,
+                             tag_types)
+         for u in raw.units if u.is_on_screen], dtype=numpy.int64)
+
+    for expected, actual in ((expected_raw, transformed.raw_units),
+                             (expected_feature, transformed.feature_units)):
+      self.assertEqual(actual.dtype, numpy.int64)
+      self.assertEqual(actual.shape, expected.shape)
+      numpy.testing.assert_array_equal(actual, expected)
+    if count:
+      self.assertEqual(transformed.raw_units[0].unit_type,
+                       raw.units[0].unit_type)
+
+
+class FeatureLayerBufferTest(absltest.TestCase):
+
+  def _features(self, reuse_feature_layer_buffers=0):
+    return features.Features(
+        features.AgentInterfaceFormat(
+            feature_dimensions=features.Dimensions(screen=(64, 60),
+                                                   minimap=(32, 28)),
+            reuse_feature_layer_buffers=reuse_feature_layer_buffers),
+        map_size=point.Point(152, 136))
+
+  def _random_observation(self, seed):
+    builder = dummy_observation.Builder(self._features().observation_spec())
+    obs = builder.build()
+    rng = numpy.random.RandomState(seed)
+    for plane in (obs.observation.feature_layer_data.renders.unit_type,
+                  obs.observation.feature_layer_data.minimap_renders.creep):
+      plane.data = rng.randint(0, 256, len(plane.data)).astype(
+          numpy.uint8).tobytes()
+    # A 1-bit plane, and one that is missing in this game version.
+    selected = obs.observation.feature_layer_data.renders.selected
+    selected.bits_per_pixel = 1
+    selected.data = rng.randint(0, 256, 64 * 60 // 8).astype(
+        numpy.uint8).tobytes()
+    obs.observation.feature_layer_data.renders.ClearField("placeholder")
+    return obs
+
+  def testMatchesUnbufferedOutput(self):
+    unbuffered = self._features()
+    buffered = self._features(reuse_feature_layer_buffers=2)
+    for seed in range(5):
+      obs = self._random_observation(seed)
+      expected = unbuffered.transform_obs(obs)
+      actual = buffered.transform_obs(obs)
+      for name in ("feature_screen", "feature_minimap"):
+        self.assertEqual(actual[name].dtype, expected[name].dtype)
+        numpy.testing.assert_array_equal(actual[name], expected[name])
+      self.assertEqual(actual.feature_screen.unit_type.shape, (60, 64))
+
+  def testBuffersAreReusedInARing(self):
+    feats = self._features(reuse_feature_layer_buffers=2)
+    outputs = [feats.transform_obs(self._random_observation(seed))
+               for seed in range(3)]
+    self.assertIs(outputs[0].feature_screen, outputs[2].feature_screen)
+    self.assertIs(outputs[0].feature_minimap, outputs[2].feature_minimap)
+    self.assertIsNot(outputs[0].feature_screen, outputs[1].feature_screen)
+
+  def testUnpackIntoPaddedBits(self):
+    obs = self._random_observation(0)
+    plane = obs.observation.feature_layer_data.renders.selected
+    plane.size.x, plane.size.y = 5, 3  # 15 bits, so the last byte is padded.
+    plane.data = b"\xa5\xff"
+    feature = features.SCREEN_FEATURES.selected
+    out = numpy.full((3, 5), 7, dtype=numpy.int32)
+    feature.unpack_into(obs.observation, out)
+    numpy.testing.assert_array_equal(out, feature.unpack_layer(plane))
+
+    with self.assertRaises(ValueError):
+      feature.unpack_into(obs.observation, numpy.zeros((5, 6))[:3, :5])
+
+
+class NativeDtypesTest(parameterized.TestCase):
+
+  def _features(self, use_native_dtypes):
+    return features.Features(
+        features.AgentInterfaceFormat(
+            feature_dimensions=features.Dimensions(screen=(64, 60),
+                                                   minimap=(32, 28)),
+            rgb_dimensions=features.Dimensions(screen=(128, 124),
+                                               minimap=(64, 60)),
+            action_space=actions.ActionSpace.FEATURES,
+            use_feature_units=True,
+            use_raw_units=True,
+            send_observation_proto=True,
+            use_native_dtypes=use_native_dtypes),
+        map_size=point.Point(152, 136))
+
+  def _observation(self, feats):
+    obs = dummy_observation.Builder(feats.observation_spec()).build()
+    rng = numpy.random.RandomState(0)
+    for plane in (obs.observation.feature_layer_data.renders.height_map,
+                  obs.observation.render_data.map):
+      plane.data = rng.randint(0, 256, len(plane.data)).astype(
+          numpy.uint8).tobytes()
+    unit_type = obs.observation.feature_layer_data.renders.unit_type
+    unit_type.bits_per_pixel = 16
+    unit_type.data = rng.randint(0, 2000, 64 * 60).astype(
+        numpy.uint16).tobytes()
+    return obs
+
+  def testFeatureDtypesFitTheirScale(self):
+    for f in list(features.SCREEN_FEATURES) + list(features.MINIMAP_FEATURES):
+      self.assertLessEqual(f.scale - 1, numpy.iinfo(f.dtype).max)
+    self.assertEqual(features.SCREEN_FEATURES.creep.dtype, numpy.uint8)
+    self.assertEqual(features.SCREEN_FEATURES.unit_type.dtype, numpy.uint16)
+
+  @parameterized.parameters(True, False)
+  def testObservationDtypesMatchObservation(self, use_native_dtypes):
+    feats = self._features(use_native_dtypes)
+    obs_dtypes = feats.observation_dtypes()
+    self.assertCountEqual(obs_dtypes.keys(), feats.observation_spec().keys())
+    transformed = feats.transform_obs(self._observation(feats))
+    for name, dtype in obs_dtypes.items():
+      if name in ("map_name", "_response_observation"):
+        continue
+      self.assertEqual(transformed[name].dtype, dtype, name)
+
+  def testNativeDtypesPreserveValues(self):
+    native = self._features(use_native_dtypes=True)
+    upcast = self._features(use_native_dtypes=False)
+    obs = self._observation(native)
+    native_obs = native.transform_obs(obs)
+    upcast_obs = upcast.transform_obs(obs)
+    self.assertEqual(native_obs.feature_screen.dtype, numpy.uint16)
+    self.assertEqual(native_obs.rgb_screen.dtype, numpy.uint8)
+    self.assertEqual(upcast_obs.feature_screen.dtype, numpy.int32)
+    for name in ("feature_screen", "feature_minimap", "rgb_screen",
+                 "rgb_minimap"):
+      numpy.testing.assert_array_equal(native_obs[name], upcast_obs[name])
+
+
+class LazyObservationsTest(absltest.TestCase):
+
+  def _features(self, lazy_observations):
+    return features.Features(
+        features.AgentInterfaceFormat(
+            feature_dimensions=features.Dimensions(screen=(64, 60),
+                                                   minimap=(32, 28)),
+            use_feature_units=True,
+            use_raw_units=True,
+            use_unit_counts=True,
+            use_camera_position=True,
+            lazy_observations=lazy_observations),
+        map_size=point.Point(152, 136))
+
+  def _observation(self):
+    builder = dummy_observation.Builder(
+        self._features(False).observation_spec())
+    builder.multi_select([dummy_observation.Unit(
+        units.Protoss.Probe, features.PlayerRelative.SELF, 20)])
+    builder.feature_units([dummy_observation.FeatureUnit(
+        units.Protoss.Probe, features.PlayerRelative.SELF, owner=1,
+        pos=common_pb2.Point(x=30, y=40), radius=0.5, health=20,
+        health_max=20, is_on_screen=True)])
+    return builder.build()
+
+  def testMatchesEagerObservation(self):
+    obs = self._observation()
+    eager = self._features(False).transform_obs(obs)
+    lazy = self._features(True).transform_obs(obs)
+    self.assertIsInstance(lazy, features.named_array.LazyNamedDict)
+    self.assertCountEqual(lazy.keys(), eager.keys())
+    for name, value in eager.items():
+      numpy.testing.assert_array_equal(lazy[name], value)
+    self.assertEqual(lazy.multi_select[0].unit_type, units.Protoss.Probe)
+
+  def testOnlyComputesWhatIsRead(self):
+    lazy = self._features(True).transform_obs(self._observation())
+    self.assertEqual(lazy.raw_units[0].unit_type, units.Protoss.Probe)
+    self.assertEqual(lazy.player.player_id, 1)
+    for name in ("feature_screen", "feature_minimap", "feature_units",
+                 "available_actions", "single_select"):
+      self.assertFalse(lazy.is_computed(name), name)
+
+
 if __name__ == "__main__":
   absltest.main()
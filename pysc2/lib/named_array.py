@@ -32,6 +32,101 @@ class NamedDict(dict):
     self.__dict__ = self
 
 
+class _Lazy(object):
+  """A value of a `LazyNamedDict` that hasn't been computed yet."""
+  __slots__ = ("func",)
+
+  def __init__(self, func):
+    self.func = func
+
+
+class LazyNamedDict(NamedDict):
+  """A NamedDict where some values are only computed when first read.
+
+  Values added with `set_lazy` are zero-argument functions that get called the
+  first time the key is read, by `d["element"]`, `d.element` or anything that
+  reads the values, and their result is then cached. The keys are all known up
+  front, so `len`, `in` and iteration over the keys don't compute anything.
+
+  Example usage:
+    d = named_array.LazyNamedDict(a=1)
+    d.set_lazy("b", expensive_function)
+    d.a, "b" in d => 1, True  # expensive_function isn't called yet.
+    d.b => expensive_function()  # Called once, and then cached.
+  """
+
+  def __init__(self, *args, **kwargs):  # pylint: disable=super-init-not-called
+    # Skip NamedDict.__init__, as attribute access has to compute the value.
+    dict.__init__(self, *args, **kwargs)
+
+  def set_lazy(self, key, func):
+    """Set `key` to be the result of calling `func` when it's first read."""
+    dict.__setitem__(self, key, _Lazy(func))
+
+  def is_computed(self, key):
+    """Whether the value for `key` has been computed already."""
+    return not isinstance(dict.__getitem__(self, key), _Lazy)
+
+  def __getitem__(self, key):
+    value = dict.__getitem__(self, key)
+    if isinstance(value, _Lazy):
+      value = value.func()
+      dict.__setitem__(self, key, value)
+    return value
+
+  def __getattr__(self, name):
+    try:
+      return self[name]
+    except KeyError:
+      raise AttributeError(name)
+
+  def __setattr__(self, name, value):
+    self[name] = value
+
+  def __delattr__(self, name):
+    try:
+      del self[name]
+    except KeyError:
+      raise AttributeError(name)
+
+  def __iter__(self):
+    # Overriding this also stops `dict(d)` and `{**d}` from reading the
+    # uncomputed values directly, so they go through `__getitem__` instead.
+    return dict.__iter__(self)
+
+  def __eq__(self, other):
+    return dict(self.items()) == other
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return "%s(%s)" % (type(self).__name__, dict(self.items()))
+
+  def get(self, key, default=None):
+    return self[key] if key in self else default
+
+  def items(self):
+    return [(k, self[k]) for k in self]
+
+  def values(self):
+    return [self[k] for k in self]
+
+  def copy(self):
+    return NamedDict(self.items())
+
+  def pop(self, key, *default):
+    if key in self:
+      value = self[key]
+      dict.__delitem__(self, key)
+      return value
+    return dict.pop(self, key, *default)
+
+  def __reduce__(self):
+    # Pickle as a normal NamedDict with all the values computed.
+    return (NamedDict, (dict(self.items()),))
+
+
 _NULL_SLICE = slice(None, None, None)
 
 
@@ -37,6 +37,45 @@ class NamedDictTest(absltest.TestCase):
     self.assertEqual(a["c"], 3)
 
 
+class LazyNamedDictTest(absltest.TestCase):
+
+  def setUp(self):
+    super(LazyNamedDictTest, self).setUp()
+    self.calls = []
+    self.d = named_array.LazyNamedDict(a=2)
+    self.d.set_lazy("b", lambda: self.calls.append("b") or (1, 2))
+
+  def test_keys_dont_compute(self):
+    self.assertLen(self.d, 2)
+    self.assertIn("b", self.d)
+    self.assertCountEqual(self.d.keys(), ["a", "b"])
+    self.assertFalse(self.d.is_computed("b"))
+    self.assertEmpty(self.calls)
+
+  def test_computed_once(self):
+    self.assertEqual(self.d["b"], (1, 2))
+    self.assertIs(self.d["b"], self.d.b)
+    self.assertEqual(self.d.a, 2)
+    self.assertTrue(self.d.is_computed("b"))
+    self.assertEqual(self.calls, ["b"])
+    with self.assertRaises(AttributeError):
+      _ = self.d.c
+    self.d.c = 3
+    self.assertEqual(self.d["c"], 3)
+
+  def test_conversions_compute(self):
+    self.assertEqual(dict(self.d), {"a": 2, "b": (1, 2)})
+    self.assertEqual({**self.d}, {"a": 2, "b": (1, 2)})
+    self.assertEqual(self.d, {"a": 2, "b": (1, 2)})
+    self.assertEqual(self.d.get("b"), (1, 2))
+    self.assertEqual(self.calls, ["b"])
+
+  def test_pickle(self):
+    unpickled = pickle.loads(pickle.dumps(self.d))
+    self.assertIsInstance(unpickled, named_array.NamedDict)
+    self.assertEqual(unpickled.b, (1, 2))
+
+
 class TestEnum(enum.IntEnum):
   a = 0
   b = 1
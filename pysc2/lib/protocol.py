@@ -13,6 +13,7 @@
 # limitations under the License.
 """Protocol library to make communication easy."""
 
+import collections
 import contextlib
 import enum
 import itertools
@@ -55,6 +56,90 @@ class ProtocolError(Exception):  # pylint: disable=g-bad-exception-name
   pass
 
 
+class RawResponse(collections.namedtuple(
+    "RawResponse", ["header", "name", "payload"])):
+  """A Response whose payload hasn't been parsed.
+
+  Attributes:
+    header: A `sc_pb.Response` with only the id, status and error filled in.
+    name: The name of the response field that was set, eg "observation", or
+        None if there wasn't one, ie for errors.
+    payload: The serialized response, eg a `sc_pb.ResponseObservation`, or
+        b"" if there wasn't one.
+  """
+  __slots__ = ()
+
+
+# Response field numbers that are part of the header, not the payload.
+_HEADER_FIELDS = frozenset(
+    sc_pb.Response.DESCRIPTOR.fields_by_name[name].number
+    for name in ("id", "error", "status"))
+_RESPONSE_NAMES = {f.number: f.name for f in sc_pb.Response.DESCRIPTOR.fields}
+
+
+def _read_varint(data, pos):
+  """Decode the varint at `data[pos]`, returning it and the next position."""
+  result = 0
+  shift = 0
+  while True:
+    b = data[pos]
+    pos += 1
+    result |= (b & 0x7f) << shift
+    if not b & 0x80:
+      return result, pos
+    shift += 7
+
+
+def split_response(response_str):
+  """Parse the header of a serialized Response, leaving the payload alone.
+
+  Only the top level of the wire format is walked, so this is cheap regardless
+  of the size of the payload.
+
+  Args:
+    response_str: A serialized `sc_pb.Response`.
+
+  Returns:
+    A `RawResponse`.
+  Raises:
+    ProtocolError: if the response is malformed.
+  """
+  header_parts = []
+  payload_parts = []
+  name = None
+  pos = 0
+  try:
+    while pos < len(response_str):
+      start = pos
+      key, pos = _read_varint(response_str, pos)
+      field_number, wire_type = key >> 3, key & 7
+      if wire_type == 0:  # varint
+        _, pos = _read_varint(response_str, pos)
+      elif wire_type == 1:  # fixed64
+        pos += 8
+      elif wire_type == 2:  # length delimited
+        length, pos = _read_varint(response_str, pos)
+        value_start = pos
+        pos += length
+      elif wire_type == 5:  # fixed32
+        pos += 4
+      else:
+        raise ProtocolError("Unexpected wire type %s in a response." %
+                            wire_type)
+      if pos > len(response_str):
+        raise ProtocolError("Got a truncated response from SC2.")
+      if field_number in _HEADER_FIELDS or wire_type != 2:
+        header_parts.append(response_str[start:pos])
+      else:
+        # Repeated copies of a message field merge, same as concatenating them.
+        name = _RESPONSE_NAMES.get(field_number)
+        payload_parts.append(response_str[value_start:pos])
+  except IndexError as e:
+    raise ProtocolError("Got a truncated response from SC2.") from e
+  header = sc_pb.Response.FromString(b"".join(header_parts))
+  return RawResponse(header, name, b"".join(payload_parts))
+
+
 @contextlib.contextmanager
 def catch_websocket_connection_errors():
   """A context manager that translates websocket errors into ConnectionError."""
@@ -100,6 +185,10 @@ class StarcraftProtocol(object):
       self._log("-------------- [%s] Read %s in %0.1f msec --------------\n%s",
                 self._port, response.WhichOneof("response"),
                 1000 * (time.time() - start), self._packet_str(response))
+    return self._check_response(response)
+
+  def _check_response(self, response):
+    """Validate a Response, update the status and return the Response."""
     if not response.HasField("status"):
       raise ProtocolError("Got an incomplete response without a status.")
     prev_status = self._status
@@ -112,6 +201,22 @@ class StarcraftProtocol(object):
       raise ProtocolError(err_str)
     return response
 
+  @sw.decorate
+  def read_raw(self):
+    """Read a Response, validate its header, and return it as a RawResponse."""
+    if FLAGS.sc2_verbose_protocol:
+      self._log("-------------- [%s] Reading raw response --------------",
+                self._port)
+      start = time.time()
+    raw = self._read_raw()
+    if FLAGS.sc2_verbose_protocol:
+      self._log("-------------- [%s] Read %s in %0.1f msec --------------\n"
+                "%s\n<%s bytes>", self._port, raw.name,
+                1000 * (time.time() - start), self._packet_str(raw.header),
+                len(raw.payload))
+    self._check_response(raw.header)
+    return raw
+
   @sw.decorate
   def write(self, request):
     """Write a Request."""
@@ -152,6 +257,107 @@ class StarcraftProtocol(object):
           "Error during %s: Got a response with a different id" % name)
     return getattr(res, name)
 
+  def send_raw(self, **kwargs):
+    """Like `send`, but returns the serialized response without parsing it.
+
+    For example: send_raw(observation=sc_pb.RequestObservation())
+        => serialized sc_pb.ResponseObservation
+
+    This is useful for passing the response on, ie to disk or to C++, without
+    paying to parse it and serialize it again in python.
+
+    Args:
+      **kwargs: A single kwarg with the name and value to fill in to Request.
+
+    Returns:
+      The serialized response corresponding to your request.
+    Raises:
+      ConnectionError: if it gets a different response.
+    """
+    assert len(kwargs) == 1, "Must make a single request."
+    name = list(kwargs.keys())[0]
+    req = sc_pb.Request(**kwargs)
+    req.id = next(self._count)
+    try:
+      self.write(req)
+      raw = self.read_raw()
+    except ConnectionError as e:
+      raise ConnectionError("Error during %s: %s" % (name, e)) from e
+    return self._raw_payload(name, req, raw)
+
+  def _raw_payload(self, name, req, raw):
+    """Check a RawResponse matches the request, and return its payload."""
+    if raw.header.HasField("id") and raw.header.id != req.id:
+      raise ConnectionError(
+          "Error during %s: Got a response with a different id" % name)
+    if raw.name not in (name, None):
+      raise ConnectionError(
+          "Error during %s: Got a %s response" % (name, raw.name))
+    return raw.payload
+
+  def send_pipelined(self, *requests):
+    """Send several requests back to back, then read all their responses.
+
+    This takes a single round trip rather than one per request, which matters
+    when the latency to SC2 is high. SC2 still handles them in order, so later
+    requests see the effects of earlier ones.
+
+    For example:
+      send_pipelined(("step", sc_pb.RequestStep(count=8)),
+                     ("observation", sc_pb.RequestObservation()))
+        => [sc_pb.ResponseStep, sc_pb.ResponseObservation]
+
+    Args:
+      *requests: `(name, value)` tuples, each a request to fill in to Request.
+
+    Returns:
+      The Responses corresponding to your requests, in the same order.
+    Raises:
+      ConnectionError: if the responses don't match the requests.
+      ProtocolError: if any of the responses is an error. All the responses
+          are read first, so the connection remains usable.
+    """
+    reqs = self._pipelined_requests(requests)
+    names = ", ".join(name for name, _ in requests)
+    responses = []
+    try:
+      for req in reqs:
+        self.write(req)
+      for _ in reqs:
+        try:
+          responses.append(self.read())
+        except ProtocolError as e:
+          responses.append(e)
+    except ConnectionError as e:
+      raise ConnectionError("Error during %s: %s" % (names, e)) from e
+    return self._match_responses(requests, reqs, responses)
+
+  def _pipelined_requests(self, requests):
+    """Create the Requests with their ids for `send_pipelined`."""
+    reqs = []
+    for name, value in requests:
+      req = sc_pb.Request(**{name: value})
+      req.id = next(self._count)
+      reqs.append(req)
+    return reqs
+
+  def _match_responses(self, requests, reqs, responses):
+    """Match the responses to the requests by id, raising the first error."""
+    for res in responses:
+      if isinstance(res, ProtocolError):
+        raise res
+    by_id = {}
+    for req, res in zip(reqs, responses):
+      # Assume responses without an id come back in order.
+      by_id[res.id if res.HasField("id") else req.id] = res
+    out = []
+    for (name, _), req in zip(requests, reqs):
+      if req.id not in by_id:
+        raise ConnectionError(
+            "Error during %s: Got a response with a different id" % name)
+      out.append(getattr(by_id[req.id], name))
+    return out
+
   def _packet_str(self, packet):
     """Return a string form of this packet."""
     max_lines = FLAGS.sc2_verbose_protocol
@@ -172,17 +378,28 @@ class StarcraftProtocol(object):
     sys.stderr.write((s + "\n") % args)
     sys.stderr.flush()
 
-  def _read(self):
-    """Actually read the response and parse it, returning a Response."""
+  def _recv(self):
+    """Actually read the response, returning the bytes."""
     with sw("read_response"):
       with catch_websocket_connection_errors():
         response_str = self._sock.recv()
     if not response_str:
       raise ProtocolError("Got an empty response from SC2.")
+    return response_str
+
+  def _read(self):
+    """Actually read the response and parse it, returning a Response."""
+    response_str = self._recv()
     with sw("parse_response"):
       response = sc_pb.Response.FromString(response_str)
     return response
 
+  def _read_raw(self):
+    """Actually read the response, parsing only its header."""
+    response_str = self._recv()
+    with sw("split_response"):
+      return split_response(response_str)
+
   def _write(self, request):
     """Actually serialize and write the request."""
     with sw("serialize_request"):
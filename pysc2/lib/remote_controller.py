@@ -15,6 +15,7 @@
 
 import copy
 import functools
+import inspect
 import socket
 import sys
 import time
@@ -45,6 +46,14 @@ class ConnectError(Exception):
   pass
 
 
+def connect_delays(initial=0.01, maximum=1):
+  """Yield exponentially increasing delays to wait between connect attempts."""
+  delay = initial
+  while True:
+    yield delay
+    delay = min(delay * 2, maximum)
+
+
 class RequestError(Exception):
 
   def __init__(self, description, res):
@@ -65,6 +74,12 @@ def check_error(res, error_enum):
 def decorate_check_error(error_enum):
   """Decorator to call `check_error` on the return value."""
   def decorator(func):
+    if inspect.iscoroutinefunction(func):
+      @functools.wraps(func)
+      async def _check_error_async(*args, **kwargs):
+        return check_error(await func(*args, **kwargs), error_enum)
+      return _check_error_async
+
     @functools.wraps(func)
     def _check_error(*args, **kwargs):
       return check_error(func(*args, **kwargs), error_enum)
@@ -75,6 +90,13 @@ def decorate_check_error(error_enum):
 def skip_status(*skipped):
   """Decorator to skip this call if we're in one of the skipped states."""
   def decorator(func):
+    if inspect.iscoroutinefunction(func):
+      @functools.wraps(func)
+      async def _skip_status_async(self, *args, **kwargs):
+        if self.status not in skipped:
+          return await func(self, *args, **kwargs)
+      return _skip_status_async
+
     @functools.wraps(func)
     def _skip_status(self, *args, **kwargs):
       if self.status not in skipped:
@@ -86,19 +108,59 @@ def skip_status(*skipped):
 def valid_status(*valid):
   """Decorator to assert that we're in a valid state."""
   def decorator(func):
-    @functools.wraps(func)
-    def _valid_status(self, *args, **kwargs):
+    def check_status(self):
       if self.status not in valid:
         raise protocol.ProtocolError(
             "`%s` called while in state: %s, valid: (%s)" % (
                 func.__name__, self.status, ",".join(map(str, valid))))
+
+    if inspect.iscoroutinefunction(func):
+      @functools.wraps(func)
+      async def _valid_status_async(self, *args, **kwargs):
+        check_status(self)
+        return await func(self, *args, **kwargs)
+      return _valid_status_async
+
+    @functools.wraps(func)
+    def _valid_status(self, *args, **kwargs):
+      check_status(self)
       return func(self, *args, **kwargs)
     return _valid_status
   return decorator
 
 
+def is_game_end_error(prev_status, protocol_error):
+  """Whether this is a spurious 'Game has already ended' error."""
+  if prev_status == Status.in_game and (
+      "Game has already ended" in str(protocol_error)):
+    # It's currently possible for us to receive this error even though
+    # our previous status was in_game. This shouldn't happen according
+    # to the protocol. It does happen sometimes when we don't observe on
+    # every step (possibly also requiring us to be playing against a
+    # built-in bot). To work around the issue, we catch the exception
+    # and so let the client code continue.
+    logging.warning(
+        "Received a 'Game has already ended' error from SC2 whilst status "
+        "in_game. Suppressing the exception, returning None.")
+    return True
+  return False
+
+
 def catch_game_end(func):
   """Decorator to handle 'Game has already ended' exceptions."""
+  if inspect.iscoroutinefunction(func):
+    @functools.wraps(func)
+    async def _catch_game_end_async(self, *args, **kwargs):
+      """Decorator to handle 'Game has already ended' exceptions."""
+      prev_status = self.status
+      try:
+        return await func(self, *args, **kwargs)
+      except protocol.ProtocolError as protocol_error:
+        if is_game_end_error(prev_status, protocol_error):
+          return None
+        raise
+    return _catch_game_end_async
+
   @functools.wraps(func)
   def _catch_game_end(self, *args, **kwargs):
     """Decorator to handle 'Game has already ended' exceptions."""
@@ -106,21 +168,9 @@ def catch_game_end(func):
     try:
       return func(self, *args, **kwargs)
     except protocol.ProtocolError as protocol_error:
-      if prev_status == Status.in_game and (
-          "Game has already ended" in str(protocol_error)):
-        # It's currently possible for us to receive this error even though
-        # our previous status was in_game. This shouldn't happen according
-        # to the protocol. It does happen sometimes when we don't observe on
-        # every step (possibly also requiring us to be playing against a
-        # built-in bot). To work around the issue, we catch the exception
-        # and so let the client code continue.
-        logging.warning(
-            "Received a 'Game has already ended' error from SC2 whilst status "
-            "in_game. Suppressing the exception, returning None.")
-
+      if is_game_end_error(prev_status, protocol_error):
         return None
-      else:
-        raise
+      raise
 
   return _catch_game_end
 
@@ -146,33 +196,60 @@ class RemoteController(object):
 
   @sw.decorate
   def _connect(self, host, port, proc, timeout_seconds):
-    """Connect to the websocket, retrying as needed. Returns the socket."""
+    """Connect to the websocket, retrying as needed. Returns the socket.
+
+    Retries with exponential backoff, starting at a few milliseconds, so a fast
+    SC2 startup isn't rounded up to whole seconds. If `proc` is given, only
+    tries to connect once the process is listening on its port.
+
+    Args:
+      host: The host SC2 is listening on.
+      port: The port SC2 is listening on.
+      proc: An optional `StarcraftProcess` to check whether it's still running
+          and whether it's listening yet.
+      timeout_seconds: How long to keep trying.
+
+    Returns:
+      The connected websocket.
+    Raises:
+      ConnectError: if it failed to connect within the timeout.
+    """
     if ":" in host and not host.startswith("["):  # Support ipv6 addresses.
       host = "[%s]" % host
     url = "ws://%s:%s/sc2api" % (host, port)
 
+    start = time.time()
     was_running = False
-    for i in range(timeout_seconds):
+    for attempt, delay in enumerate(connect_delays()):
+      elapsed = time.time() - start
+      if elapsed >= timeout_seconds:
+        break
       is_running = proc and proc.running
       was_running = was_running or is_running
-      if (i >= timeout_seconds // 4 or was_running) and not is_running:
+      if (elapsed >= timeout_seconds / 4 or was_running) and not is_running:
         logging.warning(
             "SC2 isn't running, so bailing early on the websocket connection.")
         break
-      logging.info("Connecting to: %s, attempt: %s, running: %s", url, i,
-                   is_running)
-      try:
-        return websocket.create_connection(url, timeout=timeout_seconds)
-      except socket.error:
-        pass  # SC2 hasn't started listening yet.
-      except websocket.WebSocketConnectionClosedException:
-        raise ConnectError("Connection rejected. Is something else connected?")
-      except websocket.WebSocketBadStatusException as err:
-        if err.status_code == 404:
-          pass  # SC2 is listening, but hasn't set up the /sc2api endpoint yet.
-        else:
-          raise
-      time.sleep(1)
+      with sw("connect_wait_for_listen"):
+        listening = not proc or proc.listening
+      if listening:
+        logging.info("Connecting to: %s, attempt: %s, running: %s", url,
+                     attempt, is_running)
+        try:
+          with sw("connect_websocket"):
+            return websocket.create_connection(url, timeout=timeout_seconds)
+        except socket.error:
+          pass  # SC2 hasn't started listening yet.
+        except websocket.WebSocketConnectionClosedException:
+          raise ConnectError(
+              "Connection rejected. Is something else connected?")
+        except websocket.WebSocketBadStatusException as err:
+          if err.status_code == 404:
+            pass  # SC2 is listening, but hasn't set up the /sc2api endpoint.
+          else:
+            raise
+      with sw("connect_backoff"):
+        time.sleep(delay)
     raise ConnectError("Failed to connect to the SC2 websocket. Is it up?")
 
   def close(self):
@@ -244,7 +321,31 @@ class RemoteController(object):
     obs = self._client.send(observation=sc_pb.RequestObservation(
         game_loop=target_game_loop,
         disable_fog=disable_fog))
+    return self._process_observation(obs)
+
+  @valid_status(Status.in_game, Status.in_replay, Status.ended)
+  @sw.decorate
+  def observe_raw(self, disable_fog=False, target_game_loop=0):
+    """Get a current observation as a serialized `sc_pb.ResponseObservation`.
+
+    This skips parsing the observation, so is much cheaper if it's only going
+    to be written to disk or passed to C++. Unlike `observe`, stub observations
+    at the end of the game aren't replaced and actions aren't logged, so don't
+    mix the two in one game.
+
+    Args:
+      disable_fog: Bool, True to disable fog of war.
+      target_game_loop: Wait for this game loop before responding.
+
+    Returns:
+      The serialized `sc_pb.ResponseObservation`.
+    """
+    return self._client.send_raw(observation=sc_pb.RequestObservation(
+        game_loop=target_game_loop,
+        disable_fog=disable_fog))
 
+  def _process_observation(self, obs):
+    """Replace stub observations with the last one, and log the actions."""
     if obs.observation.game_loop == 2**32 - 1:
       logging.info("Received stub observation.")
 
@@ -272,6 +373,62 @@ class RemoteController(object):
 
     return obs
 
+  @valid_status(Status.in_game, Status.in_replay)
+  @catch_game_end
+  @sw.decorate
+  def actions_step(self, req_action, count=1):
+    """Send actions and step in a single round trip.
+
+    This is equivalent to `actions` then `step`, but pipelines the requests.
+
+    Args:
+      req_action: A `sc_pb.RequestAction`, ignored in replays.
+      count: How many game loops to step.
+
+    Returns:
+      The `sc_pb.ResponseStep`.
+    """
+    requests = [("step", sc_pb.RequestStep(count=count))]
+    if self.status == Status.in_game:
+      self._log_actions(req_action)
+      requests.insert(0, ("action", req_action))
+    return self._client.send_pipelined(*requests)[-1]
+
+  @valid_status(Status.in_game, Status.in_replay)
+  @sw.decorate
+  def actions_step_observe(self, req_action, count=1, disable_fog=False,
+                           target_game_loop=0):
+    """Send actions, step and observe in a single round trip.
+
+    This is equivalent to `actions`, `step` then `observe`, but pipelines the
+    requests so it's faster when the latency to SC2 is high.
+
+    Args:
+      req_action: A `sc_pb.RequestAction`, ignored in replays.
+      count: How many game loops to step.
+      disable_fog: Whether to disable fog in the observation.
+      target_game_loop: The game loop to observe at, see `observe`.
+
+    Returns:
+      The `sc_pb.ResponseObservation` after stepping.
+    """
+    requests = [
+        ("step", sc_pb.RequestStep(count=count)),
+        ("observation", sc_pb.RequestObservation(
+            game_loop=target_game_loop, disable_fog=disable_fog))]
+    if self.status == Status.in_game:
+      self._log_actions(req_action)
+      requests.insert(0, ("action", req_action))
+    prev_status = self.status
+    try:
+      obs = self._client.send_pipelined(*requests)[-1]
+    except protocol.ProtocolError as protocol_error:
+      if not is_game_end_error(prev_status, protocol_error):
+        raise
+      # The responses were all read, so it's safe to ask again.
+      return self.observe(disable_fog, target_game_loop)
+    return self._process_observation(obs)
+
   def available_maps(self):
     return self._client.send(available_maps=sc_pb.RequestAvailableMaps())
 
@@ -288,14 +445,16 @@ class RemoteController(object):
   @sw.decorate
   def actions(self, req_action):
     """Send a `sc_pb.RequestAction`, which may include multiple actions."""
+    self._log_actions(req_action)
+    return self._client.send(action=req_action)
+
+  def _log_actions(self, req_action):
     if FLAGS.sc2_log_actions and req_action.actions:
       sys.stderr.write(" Sending actions ".center(60, ">") + "\n")
       for action in req_action.actions:
         sys.stderr.write(str(action))
       sys.stderr.flush()
 
-    return self._client.send(action=req_action)
-
   def act(self, action):
     """Send a single action. This is a shortcut for `actions`."""
     if action and action.ListFields():  # Skip no-ops.
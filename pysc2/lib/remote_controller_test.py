@@ -0,0 +1,224 @@
+#!/usr/bin/python
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for remote_controller.py against a fake SC2 server."""
+
+import asyncio
+import threading
+import time
+
+from absl.testing import absltest
+from pysc2.lib import async_remote_controller
+from pysc2.lib import fake_sc2_server
+from pysc2.lib import portspicker
+from pysc2.lib import protocol
+from pysc2.lib import remote_controller
+from pysc2.lib import sc_process
+
+from s2clientprotocol import sc2api_pb2 as sc_pb
+
+
+class PipelinedRequestsTest(absltest.TestCase):
+
+  def _controller(self, server):
+    return remote_controller.RemoteController(
+        server.host, server.port, timeout_seconds=5)
+
+  def testSendPipelined(self):
+    with fake_sc2_server.FakeSC2Server() as server:
+      controller = self._controller(server)
+      step, obs = controller._client.send_pipelined(
+          ("step", sc_pb.RequestStep(count=4)),
+          ("observation", sc_pb.RequestObservation()))
+      self.assertIsInstance(step, sc_pb.ResponseStep)
+      self.assertEqual(step.simulation_loop, 4)
+      self.assertEqual(obs.observation.game_loop, 4)
+      controller.quit()
+
+  def testActionsStepObserve(self):
+    with fake_sc2_server.FakeSC2Server() as server:
+      controller = self._controller(server)
+      for i in range(1, 4):
+        obs = controller.actions_step_observe(sc_pb.RequestAction(), count=8)
+        self.assertEqual(obs.observation.game_loop, 8 * i)
+      controller.quit()
+
+  def testActionsStep(self):
+    with fake_sc2_server.FakeSC2Server() as server:
+      controller = self._controller(server)
+      step = controller.actions_step(sc_pb.RequestAction(), count=8)
+      self.assertEqual(step.simulation_loop, 8)
+      self.assertEqual(controller.observe().observation.game_loop, 8)
+      controller.quit()
+
+  def testErrorsAreRaisedAfterReadingAllResponses(self):
+    with fake_sc2_server.FakeSC2Server(errors={"step": "Bad step"}) as server:
+      controller = self._controller(server)
+      with self.assertRaisesRegex(protocol.ProtocolError, "Bad step"):
+        controller._client.send_pipelined(
+            ("step", sc_pb.RequestStep(count=4)),
+            ("observation", sc_pb.RequestObservation()))
+      # The observation response was consumed, so the ids still line up.
+      self.assertEqual(controller.observe().observation.game_loop, 0)
+      controller.quit()
+
+  def testGameEndIsSuppressed(self):
+    errors = {"step": "Game has already ended"}
+    with fake_sc2_server.FakeSC2Server(errors=errors) as server:
+      controller = self._controller(server)
+      obs = controller.actions_step_observe(sc_pb.RequestAction(), count=8)
+      self.assertEqual(obs.observation.game_loop, 0)
+      controller.quit()
+
+  def testAsyncActionsStepObserve(self):
+    async def run(server):
+      controller = await async_remote_controller.AsyncRemoteController.connect(
+          server.host, server.port, timeout_seconds=5)
+      await controller.actions_step_observe(sc_pb.RequestAction(), count=3)
+      obs = await controller.actions_step_observe(
+          sc_pb.RequestAction(), count=3)
+      await controller.quit()
+      return obs
+
+    with fake_sc2_server.FakeSC2Server() as server:
+      obs = asyncio.run(run(server))
+    self.assertEqual(obs.observation.game_loop, 6)
+
+  def testAsyncActionsStep(self):
+    async def run(server):
+      controller = await async_remote_controller.AsyncRemoteController.connect(
+          server.host, server.port, timeout_seconds=5)
+      step = await controller.actions_step(sc_pb.RequestAction(), count=5)
+      obs = await controller.observe()
+      await controller.quit()
+      return step, obs
+
+    with fake_sc2_server.FakeSC2Server() as server:
+      step, obs = asyncio.run(run(server))
+    self.assertEqual(step.simulation_loop, 5)
+    self.assertEqual(obs.observation.game_loop, 5)
+
+
+class RawResponseTest(absltest.TestCase):
+
+  def testSplitResponse(self):
+    response = sc_pb.Response(id=12, status=sc_pb.in_replay)
+    response.observation.observation.game_loop = 300
+    action = response.observation.actions.add()
+    action.action_raw.camera_move.center_world_space.x = 3
+    raw = protocol.split_response(response.SerializeToString())
+    self.assertEqual(raw.name, "observation")
+    self.assertEqual(raw.header, sc_pb.Response(id=12, status=sc_pb.in_replay))
+    self.assertEqual(sc_pb.ResponseObservation.FromString(raw.payload),
+                     response.observation)
+
+  def testSplitErrorResponse(self):
+    response = sc_pb.Response(status=sc_pb.launched, error=["Bad", "Worse"])
+    raw = protocol.split_response(response.SerializeToString())
+    self.assertIsNone(raw.name)
+    self.assertEqual(raw.payload, b"")
+    self.assertEqual(raw.header, response)
+
+  def testSplitTruncatedResponse(self):
+    response = sc_pb.Response(status=sc_pb.in_game)
+    response.observation.observation.game_loop = 300
+    with self.assertRaisesRegex(protocol.ProtocolError, "truncated"):
+      protocol.split_response(response.SerializeToString()[:-2])
+
+  def testObserveRaw(self):
+    with fake_sc2_server.FakeSC2Server() as server:
+      controller = remote_controller.RemoteController(
+          server.host, server.port, timeout_seconds=5)
+      controller.step(5)
+      obs = sc_pb.ResponseObservation.FromString(controller.observe_raw())
+      self.assertEqual(obs.observation.game_loop, 5)
+      self.assertEqual(obs, controller.observe())
+      controller.quit()
+
+  def testObserveRawError(self):
+    errors = {"observation": "Bad observation"}
+    with fake_sc2_server.FakeSC2Server(errors=errors) as server:
+      controller = remote_controller.RemoteController(
+          server.host, server.port, timeout_seconds=5)
+      with self.assertRaisesRegex(protocol.ProtocolError, "Bad observation"):
+        controller.observe_raw()
+      controller.quit()
+
+  def testAsyncObserveRaw(self):
+    async def run(server):
+      controller = await async_remote_controller.AsyncRemoteController.connect(
+          server.host, server.port, timeout_seconds=5)
+      await controller.step(7)
+      obs = await controller.observe_raw()
+      await controller.quit()
+      return obs
+
+    with fake_sc2_server.FakeSC2Server() as server:
+      obs = sc_pb.ResponseObservation.FromString(asyncio.run(run(server)))
+    self.assertEqual(obs.observation.game_loop, 7)
+
+
+class _FakeProcess(object):
+  """Just enough of a StarcraftProcess for `_connect`."""
+
+  def __init__(self, port):
+    self._port = port
+    self.running = True
+
+  @property
+  def listening(self):
+    return sc_process._is_listening(self._port) is not False
+
+
+class ConnectTest(absltest.TestCase):
+
+  def testConnectDelays(self):
+    delays = remote_controller.connect_delays(initial=0.01, maximum=0.05)
+    self.assertEqual([next(delays) for _ in range(5)],
+                     [0.01, 0.02, 0.04, 0.05, 0.05])
+
+  def testIsListening(self):
+    port = portspicker.pick_unused_ports(1)[0]
+    if sc_process._is_listening(port) is None:
+      self.skipTest("Can't check listening sockets on this platform.")
+    self.assertFalse(sc_process._is_listening(port))
+    with fake_sc2_server.FakeSC2Server(port=port):
+      self.assertTrue(sc_process._is_listening(port))
+    portspicker.return_ports([port])
+
+  def testConnectsSoonAfterStartup(self):
+    port = portspicker.pick_unused_ports(1)[0]
+    server = fake_sc2_server.FakeSC2Server(port=port)
+    timer = threading.Timer(0.1, server.start)
+    timer.start()
+    start = time.time()
+    controller = remote_controller.RemoteController(
+        "127.0.0.1", port, proc=_FakeProcess(port), timeout_seconds=5)
+    elapsed = time.time() - start
+    controller.quit()
+    timer.join()
+    server.close()
+    portspicker.return_ports([port])
+    # Polling once per second would take at least a second.
+    self.assertLess(elapsed, 0.9)
+
+  def testConnectTimesOut(self):
+    port = portspicker.pick_unused_ports(1)[0]
+    with self.assertRaises(remote_controller.ConnectError):
+      remote_controller.RemoteController("127.0.0.1", port, timeout_seconds=1)
+    portspicker.return_ports([port])
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -17,18 +17,46 @@
 import io
 import json
 import mpyq
+from s2protocol import versions as s2versions
 
 from pysc2.run_configs import lib as run_configs_lib
 
 
-def get_replay_version(replay_data):
+def _get_replay_metadata(replay_data):
   replay_io = io.BytesIO()
   replay_io.write(replay_data)
   replay_io.seek(0)
   archive = mpyq.MPQArchive(replay_io).extract()
-  metadata = json.loads(archive[b"replay.gamemetadata.json"].decode("utf-8"))
+  return json.loads(archive[b"replay.gamemetadata.json"].decode("utf-8"))
+
+
+def _version_from_metadata(metadata):
   return run_configs_lib.Version(
       game_version=".".join(metadata["GameVersion"].split(".")[:-1]),
       build_version=int(metadata["BaseBuild"][4:]),
       data_version=metadata.get("DataVersion"),  # Only in replays version 4.1+.
       binary=None)
+
+
+def get_replay_version(replay_data):
+  return _version_from_metadata(_get_replay_metadata(replay_data))
+
+
+def get_replay_header(replay_data):
+  """Read the version and length of a replay without needing SC2.
+
+  This only decompresses the metadata and reads the MPQ user data header, so
+  is much cheaper than extracting the whole replay or a `replay_info` request.
+
+  Args:
+    replay_data: The contents of a replay file.
+
+  Returns:
+    A tuple of the `run_configs.lib.Version` and `game_duration_loops`.
+  """
+  archive = mpyq.MPQArchive(io.BytesIO(replay_data))
+  metadata = json.loads(
+      archive.read_file("replay.gamemetadata.json").decode("utf-8"))
+  header = s2versions.latest().decode_replay_header(
+      archive.header["user_data_header"]["content"])
+  return _version_from_metadata(metadata), header["m_elapsedGameLoops"]
@@ -0,0 +1,169 @@
+# Copyright 2021 DeepMind Technologies Ltd. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A cache of `sc2_replay_utils.raw_action_skips`, keyed by replay hash.
+
+Computing the action skips means decoding all the game events of a replay,
+which is needed for each player perspective, and again for every conversion
+of the replay. The cache keeps recent results in memory, and optionally on
+disk so they're shared across runs:
+
+  cache = ActionSkipsCache(cache_dir="/data/skips")
+  cache.precompute(replay_paths, parallel=16)  # No SC2 needed.
+  skips = cache.get(replay_data)
+"""
+
+import collections
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from pysc2.lib import gfile
+from pysc2.lib.replay import sc2_replay
+from pysc2.lib.replay import sc2_replay_utils
+
+ActionSkips = Mapping[int, List[int]]
+
+
+def replay_hash(replay_data: bytes) -> str:
+  """The key for a replay in the cache."""
+  return hashlib.sha256(replay_data).hexdigest()
+
+
+def _disk_path(cache_dir: str, key: str) -> str:
+  return os.path.join(cache_dir, key[:2], key + ".json")
+
+
+def _load(cache_dir: Optional[str], key: str) -> Optional[ActionSkips]:
+  if cache_dir:
+    path = _disk_path(cache_dir, key)
+    if gfile.Exists(path):
+      with gfile.Open(path) as f:
+        # json only has string keys.
+        return {int(k): v for k, v in json.load(f).items()}
+  return None
+
+
+def _save(cache_dir: Optional[str], key: str, skips: ActionSkips):
+  if cache_dir:
+    path = _disk_path(cache_dir, key)
+    gfile.MakeDirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename, so concurrent readers never see a partial file.
+    tmp_path = "%s.%s.tmp" % (path, os.getpid())
+    with gfile.Open(tmp_path, "w") as f:
+      json.dump(skips, f)
+    os.replace(tmp_path, path)
+
+
+def _compute(replay_data: bytes, cache_dir: Optional[str], key: str,
+             replay: Optional[sc2_replay.SC2Replay] = None) -> ActionSkips:
+  """Load the skips from disk, or compute and save them."""
+  skips = _load(cache_dir, key)
+  if skips is None:
+    skips = dict(sc2_replay_utils.raw_action_skips(
+        replay or sc2_replay.SC2Replay(replay_data)))
+    _save(cache_dir, key, skips)
+  return skips
+
+
+def _precompute_worker(args):
+  """Compute the skips for a replay path. Runs in a worker process."""
+  replay_path, cache_dir = args
+  with gfile.Open(replay_path, "rb") as f:
+    replay_data = f.read()
+  key = replay_hash(replay_data)
+  return replay_path, key, _compute(replay_data, cache_dir, key)
+
+
+class ActionSkipsCache(object):
+  """An LRU cache of action skips, optionally backed by a directory on disk.
+
+  This is thread safe, and the disk store can be shared by many processes.
+  """
+
+  def __init__(self, cache_dir: Optional[str] = None, max_entries: int = 1024):
+    """Create the cache.
+
+    Args:
+      cache_dir: An optional directory to persist the skips in.
+      max_entries: How many replays' skips to keep in memory.
+    """
+    self._cache_dir = cache_dir
+    self._max_entries = max_entries
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, replay_data: bytes,
+          replay: Optional[sc2_replay.SC2Replay] = None) -> ActionSkips:
+    """Returns player id -> the game loops on which each player acted.
+
+    Args:
+      replay_data: The contents of the replay.
+      replay: Optionally the already parsed replay, to save parsing it again
+          if the skips need to be computed.
+    """
+    key = replay_hash(replay_data)
+    with self._lock:
+      skips = self._entries.get(key)
+      if skips is not None:
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._copy(skips)
+      self.misses += 1
+    skips = _compute(replay_data, self._cache_dir, key, replay)
+    self._put(key, skips)
+    return self._copy(skips)
+
+  def precompute(self, replay_paths: Iterable[str],
+                 parallel: Optional[int] = None) -> Dict[str, ActionSkips]:
+    """Compute the skips for many replays in parallel, without SC2.
+
+    Replays already on disk are loaded rather than computed again. The most
+    recent results are kept in memory too.
+
+    Args:
+      replay_paths: The paths of the replays.
+      parallel: How many processes to use. Defaults to the number of cpus.
+
+    Returns:
+      A dict of replay path to its skips.
+    """
+    replay_paths = list(replay_paths)
+    if not replay_paths:
+      return {}
+    out = {}
+    with multiprocessing.Pool(min(parallel or os.cpu_count(),
+                                  len(replay_paths))) as pool:
+      for replay_path, key, skips in pool.imap_unordered(
+          _precompute_worker,
+          [(replay_path, self._cache_dir) for replay_path in replay_paths]):
+        self._put(key, skips)
+        out[replay_path] = skips
+    return out
+
+  def _put(self, key: str, skips: ActionSkips):
+    with self._lock:
+      self._entries[key] = skips
+      self._entries.move_to_end(key)
+      while len(self._entries) > self._max_entries:
+        self._entries.popitem(last=False)
+
+  @staticmethod
+  def _copy(skips: ActionSkips) -> ActionSkips:
+    # Callers are free to modify their copy.
+    return {k: list(v) for k, v in skips.items()}
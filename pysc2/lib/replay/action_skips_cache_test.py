@@ -0,0 +1,92 @@
+# Copyright 2021 DeepMind Technologies Ltd. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for action_skips_cache.py."""
+
+import os
+from unittest import mock
+
+from absl.testing import absltest
+from pysc2.lib import resources
+from pysc2.lib.replay import action_skips_cache
+from pysc2.lib.replay import sc2_replay
+from pysc2.lib.replay import sc2_replay_utils
+
+PATH = "pysc2/lib/replay/test_data"
+
+
+def _replay_path(i):
+  return resources.GetResourceFilename(
+      os.path.join(PATH, "replay_0%d.SC2Replay" % i))
+
+
+def _replay_data(i):
+  with open(_replay_path(i), "rb") as f:
+    return f.read()
+
+
+class ActionSkipsCacheTest(absltest.TestCase):
+
+  def setUp(self):
+    super(ActionSkipsCacheTest, self).setUp()
+    self._data = _replay_data(1)
+    self._expected = dict(sc2_replay_utils.raw_action_skips(
+        sc2_replay.SC2Replay(self._data)))
+
+  def testMemoryCache(self):
+    cache = action_skips_cache.ActionSkipsCache()
+    with mock.patch.object(sc2_replay_utils, "raw_action_skips",
+                           wraps=sc2_replay_utils.raw_action_skips) as compute:
+      self.assertEqual(cache.get(self._data), self._expected)
+      skips = cache.get(self._data)
+      self.assertEqual(skips, self._expected)
+      self.assertEqual(compute.call_count, 1)
+    self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    # Changing the result doesn't change the cache.
+    skips[1].clear()
+    self.assertEqual(cache.get(self._data), self._expected)
+
+  def testEviction(self):
+    cache = action_skips_cache.ActionSkipsCache(max_entries=1)
+    cache.get(self._data)
+    cache.get(_replay_data(2))
+    cache.get(self._data)
+    self.assertEqual((cache.hits, cache.misses), (0, 3))
+
+  def testDiskCache(self):
+    cache_dir = self.create_tempdir().full_path
+    action_skips_cache.ActionSkipsCache(cache_dir).get(self._data)
+    with mock.patch.object(sc2_replay_utils, "raw_action_skips") as compute:
+      cache = action_skips_cache.ActionSkipsCache(cache_dir)
+      self.assertEqual(cache.get(self._data), self._expected)
+      compute.assert_not_called()
+
+  def testPrecompute(self):
+    cache_dir = self.create_tempdir().full_path
+    cache = action_skips_cache.ActionSkipsCache(cache_dir)
+    paths = [_replay_path(1), _replay_path(2)]
+    skips = cache.precompute(paths, parallel=2)
+    self.assertCountEqual(skips, paths)
+    self.assertEqual(skips[paths[0]], self._expected)
+    self.assertEqual(cache.get(self._data), self._expected)
+    self.assertEqual(cache.hits, 1)
+
+    # They're on disk for the next run too.
+    with mock.patch.object(sc2_replay_utils, "raw_action_skips") as compute:
+      action_skips_cache.ActionSkipsCache(cache_dir).get(self._data)
+      compute.assert_not_called()
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -0,0 +1,283 @@
+# Copyright 2021 DeepMind Technologies Ltd. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Many SC2 replays -> ResponseObservation protos, using worker processes."""
+
+import collections
+import multiprocessing
+import queue
+import struct
+import threading
+from typing import Any, Dict, Hashable, Iterable, Iterator, Optional, Tuple
+
+from absl import logging
+from pysc2.lib import replay
+from pysc2.lib import sc_process_pool
+from pysc2.lib.replay import replay_observation_stream
+
+from s2clientprotocol import sc2api_pb2 as sc_pb
+from s2protocol import decoders as s2decoders
+
+# How long blocking queue operations wait before checking for a shutdown.
+_POLL_SECONDS = 0.1
+
+# What reading the header of a truncated or corrupt replay can raise.
+_HEADER_ERRORS = (AttributeError, KeyError, NotImplementedError, RuntimeError,
+                  ValueError, struct.error, s2decoders.CorruptedError,
+                  s2decoders.TruncatedError)
+
+
+class ReplayFailure(collections.namedtuple("ReplayFailure", ["error"])):
+  """Yielded instead of an observation when a replay fails.
+
+  Attributes:
+    error: A description of the error.
+  """
+  __slots__ = ()
+
+
+def _put(q, item, stop) -> bool:
+  """Put an item on the queue, giving up if `stop` is set."""
+  while not stop.is_set():
+    try:
+      q.put(item, timeout=_POLL_SECONDS)
+      return True
+    except queue.Full:
+      pass
+  return False
+
+
+def _worker(stream_cls, stream_kwargs, in_queue, out_queue, stop):
+  """Process replays from `in_queue`, putting observations on `out_queue`."""
+  # Keep one idle SC2 per version, so switching back and forth is cheap.
+  pool = sc_process_pool.ProcessPool(max_idle_per_key=1)
+  stream = stream_cls(process_pool=pool, **stream_kwargs)
+  try:
+    while not stop.is_set():
+      try:
+        item = in_queue.get(timeout=_POLL_SECONDS)
+      except queue.Empty:
+        continue
+      if item is None:
+        break
+      replay_id, replay_data, player_id = item
+      if isinstance(replay_data, ReplayFailure):
+        # The dispatcher failed to read it, but pass it on so it's in order.
+        if not _put(out_queue, (replay_id, replay_data), stop):
+          return
+        continue
+      # Any error, including failing to launch SC2, only fails this replay, so
+      # the replays already queued for this worker are still processed.
+      try:
+        stream.start_replay_from_data(replay_data, player_id)
+        for obs in stream.observations():
+          # Serialize explicitly, it's much faster than pickling the protos.
+          if isinstance(obs, list):
+            payload = [o.SerializeToString() for o in obs]
+          else:
+            payload = obs.SerializeToString()
+          if not _put(out_queue, (replay_id, payload), stop):
+            return
+      except Exception as e:  # pylint: disable=broad-except
+        logging.exception("Failed to process replay %s: %s", replay_id, e)
+        stream.close()  # The pool health checks the processes when released.
+        if not _put(out_queue, (replay_id, ReplayFailure(repr(e))), stop):
+          return
+  finally:
+    stream.close()
+    pool.close()
+    _put(out_queue, None, stop)
+
+
+class ParallelReplayObservationStream(object):
+  """Streams observations from many replays, sharded across worker processes.
+
+  Each worker process runs a `ReplayObservationStream`, and keeps a warm SC2
+  instance per game version it has seen. Replays are sent to a worker that
+  last ran the same version where possible, to avoid relaunching SC2.
+  Observations come back through a bounded queue, so workers pause when the
+  consumer falls behind.
+
+  How to use the class:
+
+  with ParallelReplayObservationStream(interface, num_workers=8) as stream:
+    for replay_id, obs in stream.observations(
+        (path, run_config.replay_data(path), 1) for path in replay_paths):
+      # Do something with each observation.
+
+  Observations from the same replay are in order, but are interleaved with
+  those from other replays. A replay that fails yields a `ReplayFailure` after
+  any observations it did produce.
+  """
+
+  _stream_cls = replay_observation_stream.ReplayObservationStream
+
+  def __init__(self,
+               interface_options: sc_pb.InterfaceOptions,
+               num_workers: Optional[int] = None,
+               queue_size: int = 256,
+               step_mul: int = 1,
+               disable_fog: bool = False,
+               game_steps_per_episode: int = 0,
+               add_opponent_observations: bool = False):
+    """Constructs the parallel replay stream.
+
+    Args:
+      interface_options: Interface format to use.
+      num_workers: How many worker processes, each with its own SC2 instance.
+          Defaults to the number of cpus.
+      queue_size: How many observations can be buffered before the workers
+          block waiting for the consumer.
+      step_mul: Number of skipped observations in between environment steps.
+      disable_fog: Bool, True to disable fog of war.
+      game_steps_per_episode: Int, truncate after this many steps (0 for inf.).
+      add_opponent_observations: Bool, True to return the opponent's
+          observations in addition to the observing player, as a list.
+    """
+    if not interface_options:
+      raise ValueError("Please specify interface_options")
+    self._num_workers = num_workers or multiprocessing.cpu_count()
+    self._queue_size = queue_size
+    self._stream_kwargs = dict(
+        interface_options=interface_options,
+        step_mul=step_mul,
+        disable_fog=disable_fog,
+        game_steps_per_episode=game_steps_per_episode,
+        add_opponent_observations=add_opponent_observations)
+    self._stop = None
+    self._workers = []
+    self._out_queue = None
+    self._dispatcher = None
+
+  def observations(
+      self, replays: Iterable[Tuple[Hashable, bytes, int]]
+  ) -> Iterator[Tuple[Hashable, Any]]:
+    """Yields `(replay_id, observation)` for every step of every replay.
+
+    Args:
+      replays: An iterable of `(replay_id, replay_data, player_id)` tuples.
+          It is consumed lazily by a background thread.
+
+    Yields:
+      `(replay_id, observation)` tuples, where the observation is a
+      `ResponseObservation`, or a list of them if using opponent observations,
+      or a `ReplayFailure` if the replay failed.
+    """
+    self.close()
+    self._stop = multiprocessing.Event()
+    in_queues = [multiprocessing.Queue(maxsize=2)
+                 for _ in range(self._num_workers)]
+    self._out_queue = multiprocessing.Queue(maxsize=self._queue_size)
+    self._workers = [
+        multiprocessing.Process(
+            target=_worker,
+            args=(self._stream_cls, self._stream_kwargs, q, self._out_queue,
+                  self._stop),
+            daemon=True)
+        for q in in_queues]
+    for w in self._workers:
+      w.start()
+    self._dispatcher = threading.Thread(
+        target=self._dispatch, args=(replays, in_queues), daemon=True)
+    self._dispatcher.start()
+
+    try:
+      remaining = len(self._workers)
+      while remaining:
+        item = self._out_queue.get()
+        if item is None:
+          remaining -= 1
+          continue
+        replay_id, payload = item
+        if isinstance(payload, ReplayFailure):
+          yield replay_id, payload
+        elif isinstance(payload, list):
+          yield replay_id, [sc_pb.ResponseObservation.FromString(p)
+                            for p in payload]
+        else:
+          yield replay_id, sc_pb.ResponseObservation.FromString(payload)
+    finally:
+      self.close()
+
+  def _dispatch(self, replays, in_queues):
+    """Send each replay to a worker, preferring one on the same version."""
+    affinity: Dict[Any, int] = {}  # version -> worker that last ran it.
+    next_worker = 0
+    try:
+      for replay_id, replay_data, player_id in replays:
+        try:
+          # Only reads the header, rather than decompressing the whole replay.
+          version, _ = replay.get_replay_header(replay_data)
+        except _HEADER_ERRORS as err:
+          logging.exception("Error getting the version of replay %s: %s",
+                            replay_id, err)
+          version, replay_data = None, ReplayFailure(repr(err))
+        item = (replay_id, replay_data, player_id)
+        # Workers only exit early if they crash. Skip them, or their full
+        # queues would block the dispatch forever.
+        while not self._stop.is_set():
+          live = [i for i, w in enumerate(self._workers) if w.is_alive()]
+          if not live:
+            logging.error("All the workers have exited, dropping the rest of "
+                          "the replays.")
+            return
+          worker = affinity.get(version)
+          if worker not in live or in_queues[worker].full():
+            # Spread the load over workers with space, round robin.
+            live.sort(key=lambda i: (i - next_worker) % len(in_queues))
+            with_space = [i for i in live if not in_queues[i].full()]
+            if with_space:
+              worker = with_space[0]
+            elif worker not in live:
+              worker = live[0]
+          try:
+            in_queues[worker].put(item, timeout=_POLL_SECONDS)
+            break
+          except queue.Full:
+            pass
+        else:
+          return
+        next_worker = (worker + 1) % len(in_queues)
+        affinity[version] = worker
+    finally:
+      for q, w in zip(in_queues, self._workers):
+        if w.is_alive():
+          _put(q, None, self._stop)
+
+  def close(self):
+    """Stop the workers, which closes their SC2 instances."""
+    if self._stop is None:
+      return
+    self._stop.set()
+    # Drain the output so workers blocked on it can notice the stop.
+    for w in self._workers:
+      while w.is_alive():
+        try:
+          self._out_queue.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+          pass
+        w.join(timeout=0)
+    if self._dispatcher:
+      self._dispatcher.join()
+    self._workers = []
+    self._out_queue = None
+    self._dispatcher = None
+    self._stop = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exception_type, exception_value, traceback):
+    if exception_value:
+      logging.error("[%s]: %s", exception_type, exception_value)
+    self.close()
@@ -0,0 +1,153 @@
+# Copyright 2021 DeepMind Technologies Ltd. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for parallel_replay_observation_stream.py with a fake stream."""
+
+import collections
+import time
+from unittest import mock
+
+from absl.testing import absltest
+from pysc2.lib import sc_process
+from pysc2.lib.replay import parallel_replay_observation_stream
+from pysc2.lib.replay import replay_observation_stream
+
+from s2clientprotocol import sc2api_pb2 as sc_pb
+
+
+class _FakeStream(object):
+  """Yields `length` observations for replay data of the form b"length:ver".
+
+  A length of -1 fails the replay, -2 fails to launch SC2 and -3 crashes the
+  worker.
+  """
+
+  def __init__(self, process_pool, add_opponent_observations, **kwargs):
+    del process_pool, kwargs  # Unused.
+    self._add_opponent_observations = add_opponent_observations
+    self._length = 0
+
+  def start_replay_from_data(self, replay_data, player_id):
+    del player_id  # Unused.
+    self._length = int(replay_data.split(b":")[0])
+    if self._length == -1:
+      raise replay_observation_stream.ReplayError("Bad replay")
+    if self._length == -2:
+      raise sc_process.SC2LaunchError("No binary")
+    if self._length == -3:
+      raise SystemExit("Crashed")
+
+  def observations(self):
+    for i in range(self._length):
+      obs = sc_pb.ResponseObservation()
+      obs.observation.game_loop = i
+      yield [obs, obs] if self._add_opponent_observations else obs
+
+  def close(self):
+    pass
+
+
+def _fake_header(replay_data):
+  if b":" not in replay_data:
+    raise ValueError("No version")
+  return replay_data.split(b":")[1], 0
+
+
+class _FakeParallelStream(
+    parallel_replay_observation_stream.ParallelReplayObservationStream):
+  _stream_cls = _FakeStream
+
+
+class ParallelReplayObservationStreamTest(absltest.TestCase):
+
+  def setUp(self):
+    super(ParallelReplayObservationStreamTest, self).setUp()
+    patcher = mock.patch.object(
+        parallel_replay_observation_stream, "replay",
+        mock.Mock(get_replay_header=_fake_header))
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def testYieldsEveryObservationInOrder(self):
+    replays = [(i, b"%d:v%d" % (i + 1, i % 3), 1) for i in range(20)]
+    game_loops = collections.defaultdict(list)
+    with _FakeParallelStream(
+        sc_pb.InterfaceOptions(raw=True), num_workers=3,
+        queue_size=4) as stream:
+      for replay_id, obs in stream.observations(replays):
+        game_loops[replay_id].append(obs.observation.game_loop)
+    self.assertEqual(dict(game_loops),
+                     {i: list(range(i + 1)) for i in range(20)})
+
+  def testOpponentObservations(self):
+    with _FakeParallelStream(
+        sc_pb.InterfaceOptions(raw=True), num_workers=2,
+        add_opponent_observations=True) as stream:
+      out = list(stream.observations([("a", b"2:v1", 1)]))
+    self.assertLen(out, 2)
+    self.assertLen(out[0][1], 2)
+
+  def testReportsBadReplays(self):
+    replays = [("bad", b"-1:v1", 1), ("no_version", b"3", 1),
+               ("good", b"3:v1", 1)]
+    with _FakeParallelStream(
+        sc_pb.InterfaceOptions(raw=True), num_workers=1) as stream:
+      out = list(stream.observations(replays))
+    self.assertEqual([replay_id for replay_id, _ in out],
+                     ["bad", "no_version"] + ["good"] * 3)
+    failure = parallel_replay_observation_stream.ReplayFailure
+    self.assertIsInstance(out[0][1], failure)
+    self.assertIn("Bad replay", out[0][1].error)
+    self.assertIsInstance(out[1][1], failure)
+    self.assertIn("No version", out[1][1].error)
+    self.assertNotIsInstance(out[2][1], failure)
+
+  def testWorkerSurvivesLaunchErrors(self):
+    replays = [("no_binary", b"-2:v1", 1), ("good", b"3:v1", 1)]
+    with _FakeParallelStream(
+        sc_pb.InterfaceOptions(raw=True), num_workers=1) as stream:
+      out = list(stream.observations(replays))
+    self.assertEqual([replay_id for replay_id, _ in out],
+                     ["no_binary"] + ["good"] * 3)
+    self.assertIsInstance(out[0][1],
+                          parallel_replay_observation_stream.ReplayFailure)
+    self.assertIn("No binary", out[0][1].error)
+
+  def testSkipsWorkersThatExited(self):
+    stream = _FakeParallelStream(
+        sc_pb.InterfaceOptions(raw=True), num_workers=2)
+
+    def replays():
+      yield "crash", b"-3:v1", 1
+      while all(w.is_alive() for w in stream._workers):
+        time.sleep(0.01)
+      for i in range(10):
+        yield i, b"2:v1", 1
+
+    with stream:
+      out = list(stream.observations(replays()))
+    self.assertCountEqual([replay_id for replay_id, _ in out],
+                          [i for i in range(10) for _ in range(2)])
+
+  def testStopsEarly(self):
+    replays = ((i, b"1000:v1", 1) for i in range(1000))
+    stream = _FakeParallelStream(
+        sc_pb.InterfaceOptions(raw=True), num_workers=2, queue_size=2)
+    for i, _ in enumerate(stream.observations(replays)):
+      if i == 10:
+        break
+    stream.close()
+
+
+if __name__ == "__main__":
+  absltest.main()
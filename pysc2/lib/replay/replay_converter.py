@@ -14,19 +14,21 @@
 """SC2 replay data -> converted observations."""
 
 import collections
-from typing import Any, Dict, Iterable, Sequence
+from typing import Any, Dict, Iterable, Optional, Sequence
 
 import numpy as np
 from pysc2.env.converter import converter as converter_lib
 from pysc2.env.converter import derive_interface_options
 from pysc2.env.converter.proto import converter_pb2
+from pysc2.lib.replay import action_skips_cache
 from pysc2.lib.replay import replay_observation_stream
-from pysc2.lib.replay import sc2_replay
-from pysc2.lib.replay import sc2_replay_utils
 import tree
 
 from s2clientprotocol import sc2api_pb2
 
+# Shared by all streams in the process, eg the two players of a replay.
+_ACTION_SKIPS_CACHE = action_skips_cache.ActionSkipsCache(max_entries=64)
+
 
 def _unconverted_observation(observation, actions):
   return converter_pb2.Observation(
@@ -141,8 +143,23 @@ def converted_observation_stream(
     player_id: int,
     converter_settings: converter_pb2.ConverterSettings,
     disable_fog: bool = False,
-    max_steps: int = int(1e6)):
-  """Generator of transformed observations (incl. action and time delay)."""
+    max_steps: int = int(1e6),
+    skips_cache: Optional[action_skips_cache.ActionSkipsCache] = None):
+  """Generator of transformed observations (incl. action and time delay).
+
+  Args:
+    replay_data: The contents of the replay.
+    player_id: The player to observe from.
+    converter_settings: How to convert the observations.
+    disable_fog: Whether to see through the fog of war.
+    max_steps: The maximum number of game loops to run the replay for.
+    skips_cache: Where to look up the game loops with actions. Defaults to a
+        process wide in-memory cache, so both player perspectives of a replay
+        only decode its game events once.
+
+  Yields:
+    The converted observations.
+  """
 
   with replay_observation_stream.ReplayObservationStream(
       step_mul=1,
@@ -160,16 +177,17 @@ def converted_observation_stream(
             game_info=replay_stream.game_info(),
             replay_info=replay_stream.replay_info()))
 
-    replay_file = sc2_replay.SC2Replay(replay_data)
-    action_skips = sc2_replay_utils.raw_action_skips(replay_file)
-    player_action_skips = action_skips[player_id]
+    action_skips = (skips_cache or _ACTION_SKIPS_CACHE).get(replay_data)
+    player_action_skips = action_skips.get(player_id, [])
     step_sequence = get_step_sequence(player_action_skips)
 
     observations_iterator = replay_stream.observations(
         step_sequence=step_sequence)
 
+    action_steps = frozenset(player_action_skips)
+
     def _accept_step_fn(step):
-      return step in player_action_skips
+      return step in action_steps
 
     yield from converted_observations(observations_iterator, obs_converter,
                                       _accept_step_fn)
@@ -0,0 +1,389 @@
+# Copyright 2021 DeepMind Technologies Ltd. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Sharded, columnar storage for converted replay observations.
+
+A dataset is a directory of shards plus a manifest and an index:
+
+  manifest.json      The replay ids, and where each chunk's columns are.
+  index.npy          One row per step: (replay, player, step, shard, chunk,
+                     row), so any step can be found without scanning.
+  shard-00000.data   Chunks of steps. Each chunk stores every column (ie every
+                     key of the observation dict) as one contiguous array of
+                     `steps_per_chunk` rows, optionally zlib compressed.
+
+Write the output of `replay_converter.converted_observation_stream`:
+
+  with ReplayDatasetWriter(path) as writer:
+    for replay_id, player_id, replay_data in replays:
+      writer.add_episode(replay_id, player_id,
+                         converted_observation_stream(replay_data, ...))
+
+Then sample minibatches from it:
+
+  with ReplayDatasetReader(path) as reader:
+    batch = reader.sample(batch_size=32)
+
+Uncompressed columns are read straight out of the memory mapped shards, while
+compressed ones are decompressed a chunk at a time, and cached.
+"""
+
+import collections
+import json
+import mmap
+import os
+import queue
+import threading
+from typing import Any, Dict, Hashable, Iterable, List, Mapping, Optional, Sequence
+import zlib
+
+import numpy as np
+
+_MANIFEST = "manifest.json"
+_INDEX = "index.npy"
+_FORMAT_VERSION = 1
+_ALIGNMENT = 64  # Keep uncompressed columns aligned for fast access.
+
+INDEX_DTYPE = np.dtype([
+    ("replay", np.int32),
+    ("player", np.int32),
+    ("step", np.int64),
+    ("shard", np.int32),
+    ("chunk", np.int32),
+    ("row", np.int32),
+])
+
+
+def _shard_name(shard: int) -> str:
+  return "shard-%05d.data" % shard
+
+
+class ReplayDatasetWriter(object):
+  """Writes converted observations to a sharded, columnar dataset.
+
+  Steps are batched into chunks in memory. Full chunks are stacked, compressed
+  and appended to the current shard by a background thread, so the caller can
+  get on with converting the next replay. The manifest and index are written by
+  `close`, so the dataset is only readable once the writer is closed.
+  """
+
+  def __init__(self,
+               path: str,
+               steps_per_chunk: int = 256,
+               chunks_per_shard: int = 64,
+               compression_level: Optional[int] = 1,
+               max_pending_chunks: int = 4):
+    """Create the writer.
+
+    Args:
+      path: The directory to write to. It is created if needed, and must not
+          contain a dataset already.
+      steps_per_chunk: How many steps to store per chunk. Bigger chunks
+          compress better, but each random access decompresses a whole chunk.
+      chunks_per_shard: How many chunks to store per shard file.
+      compression_level: zlib compression level, or None to not compress,
+          which lets the reader use the shards without copying them.
+      max_pending_chunks: How many full chunks can wait to be written before
+          `add` blocks.
+    """
+    if steps_per_chunk < 1 or chunks_per_shard < 1:
+      raise ValueError("steps_per_chunk and chunks_per_shard must be positive.")
+    if os.path.exists(os.path.join(path, _MANIFEST)):
+      raise ValueError("A dataset already exists at %s" % path)
+    os.makedirs(path, exist_ok=True)
+    self._path = path
+    self._steps_per_chunk = steps_per_chunk
+    self._chunks_per_shard = chunks_per_shard
+    self._compression_level = compression_level
+
+    self._replays: List[Hashable] = []
+    self._replay_ids: Dict[Hashable, int] = {}
+    self._index: List[tuple] = []
+    self._steps: List[Mapping[str, Any]] = []
+    self._num_chunks = 0
+    self._shards: List[List[Dict[str, Any]]] = []  # shard -> chunk metadata.
+    self._error = None
+    self._closed = False
+
+    self._queue = queue.Queue(maxsize=max_pending_chunks)
+    self._thread = threading.Thread(target=self._write_chunks, daemon=True)
+    self._thread.start()
+
+  def add(self, replay_id: Hashable, player_id: int, step: int,
+          observation: Mapping[str, Any]):
+    """Add a single step.
+
+    Args:
+      replay_id: An id for the replay, ie its path or hash. It's stored as
+          json, so should be a string or number.
+      player_id: The player the observation is for.
+      step: The position of the step within the episode.
+      observation: A flat mapping of string labels to numpy arrays or scalars,
+          as returned by the converter. All the steps in a chunk must have the
+          same keys, shapes and dtypes.
+    """
+    self._check()
+    replay = self._replay_ids.get(replay_id)
+    if replay is None:
+      replay = self._replay_ids[replay_id] = len(self._replays)
+      self._replays.append(replay_id)
+    self._index.append((
+        replay, player_id, step,
+        self._num_chunks // self._chunks_per_shard,
+        self._num_chunks % self._chunks_per_shard,
+        len(self._steps)))
+    self._steps.append(observation)
+    if len(self._steps) >= self._steps_per_chunk:
+      self._flush()
+
+  def add_episode(self, replay_id: Hashable, player_id: int,
+                  observations: Iterable[Mapping[str, Any]]) -> int:
+    """Add every step of an episode, returning the number of steps."""
+    steps = 0
+    for steps, observation in enumerate(observations, 1):
+      self.add(replay_id, player_id, steps - 1, observation)
+    return steps
+
+  def _flush(self):
+    """Send the current chunk to the background thread."""
+    if self._steps:
+      chunk = self._num_chunks
+      self._queue.put((chunk // self._chunks_per_shard,
+                       chunk % self._chunks_per_shard, self._steps))
+      self._steps = []
+      self._num_chunks += 1
+
+  def _check(self):
+    if self._closed:
+      raise ValueError("The writer is closed.")
+    if self._error:
+      raise self._error
+
+  def _write_chunks(self):
+    """The background thread that stacks, compresses and writes chunks."""
+    f = None
+    current_shard = None
+    try:
+      while True:
+        item = self._queue.get()
+        if item is None:
+          return
+        shard, chunk, steps = item
+        if shard != current_shard:
+          if f:
+            f.close()
+          f = open(os.path.join(self._path, _shard_name(shard)), "wb")
+          current_shard = shard
+          self._shards.append([])
+        self._shards[shard].append(self._write_chunk(f, chunk, steps))
+    except Exception as e:  # pylint: disable=broad-except
+      self._error = e
+      # Keep consuming so the writer doesn't block forever.
+      while self._queue.get() is not None:
+        pass
+    finally:
+      if f:
+        f.close()
+
+  def _write_chunk(self, f, chunk, steps) -> Dict[str, Any]:
+    """Write one chunk of steps, returning its metadata."""
+    keys = sorted(steps[0])
+    columns = {}
+    for key in keys:
+      try:
+        column = np.stack([np.asarray(step[key]) for step in steps])
+      except KeyError as e:
+        raise ValueError("Key %s is missing from some steps in chunk %s" %
+                         (key, chunk)) from e
+      except ValueError as e:
+        raise ValueError("Inconsistent shapes for %s in chunk %s: %s" %
+                         (key, chunk, e)) from e
+      if column.dtype.hasobject:
+        raise ValueError("Can't store objects, as found in %s" % key)
+      data = np.ascontiguousarray(column).tobytes()
+      compressed = self._compression_level is not None
+      if compressed:
+        data = zlib.compress(data, self._compression_level)
+      offset = f.tell()
+      padding = -offset % _ALIGNMENT
+      f.write(b"\0" * padding)
+      f.write(data)
+      columns[key] = {
+          "offset": offset + padding,
+          "length": len(data),
+          "dtype": column.dtype.str,
+          "shape": column.shape,
+          "compressed": compressed,
+      }
+    return {"num_steps": len(steps), "columns": columns}
+
+  def close(self):
+    """Write out the remaining steps, and the manifest and index."""
+    if self._closed:
+      return
+    self._flush()
+    self._queue.put(None)
+    self._thread.join()
+    self._closed = True
+    if self._error:
+      raise self._error
+    index = np.array(self._index, dtype=INDEX_DTYPE)
+    np.save(os.path.join(self._path, _INDEX), index)
+    with open(os.path.join(self._path, _MANIFEST), "w") as f:
+      json.dump({
+          "version": _FORMAT_VERSION,
+          "replays": self._replays,
+          "shards": [{"file": _shard_name(i), "chunks": chunks}
+                     for i, chunks in enumerate(self._shards)],
+      }, f)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exception_type, exception_value, traceback):
+    self.close()
+
+
+class ReplayDatasetReader(object):
+  """Random access to a dataset written by `ReplayDatasetWriter`.
+
+  Shards are memory mapped, so only the columns and chunks that are used get
+  read from disk.
+  """
+
+  def __init__(self, path: str, cache_chunks: int = 64):
+    """Open the dataset.
+
+    Args:
+      path: The directory the dataset was written to.
+      cache_chunks: How many decompressed columns of chunks to keep around.
+    """
+    self._path = path
+    with open(os.path.join(path, _MANIFEST)) as f:
+      manifest = json.load(f)
+    if manifest["version"] != _FORMAT_VERSION:
+      raise ValueError("Unknown dataset version: %s" % manifest["version"])
+    self._replays = manifest["replays"]
+    self._shards = manifest["shards"]
+    self._index = np.load(os.path.join(path, _INDEX), mmap_mode="r")
+    self._positions = None
+    self._files = {}
+    self._maps = {}
+    self._cache = collections.OrderedDict()
+    self._cache_chunks = cache_chunks
+
+  def __len__(self) -> int:
+    return len(self._index)
+
+  @property
+  def replays(self) -> Sequence[Any]:
+    """The replay ids, indexed by the `replay` column of `index`."""
+    return self._replays
+
+  @property
+  def index(self) -> np.ndarray:
+    """A structured array with one row per step, of type `INDEX_DTYPE`."""
+    return self._index
+
+  def find(self, replay_id: Hashable, player_id: int, step: int) -> int:
+    """Returns the position of a step, for use with `get` or `get_batch`."""
+    if self._positions is None:
+      self._positions = {
+          (self._replays[r], p, s): i
+          for i, (r, p, s) in enumerate(zip(
+              self._index["replay"].tolist(), self._index["player"].tolist(),
+              self._index["step"].tolist()))}
+    try:
+      return self._positions[(replay_id, player_id, step)]
+    except KeyError as e:
+      raise KeyError("Step %s of replay %s for player %s isn't in the dataset" %
+                     (step, replay_id, player_id)) from e
+
+  def get(self, position: int) -> Dict[str, np.ndarray]:
+    """Returns the observation at a position."""
+    entry = self._index[position]
+    shard, chunk, row = (int(entry[k]) for k in ("shard", "chunk", "row"))
+    return {key: self._column(shard, chunk, key)[row]
+            for key in self._shards[shard]["chunks"][chunk]["columns"]}
+
+  def get_batch(self, positions: Sequence[int]) -> Dict[str, np.ndarray]:
+    """Returns the observations at several positions, stacked into arrays."""
+    positions = np.asarray(positions)
+    entries = self._index[positions]
+    first = entries[0]
+    keys = self._shards[int(first["shard"])]["chunks"][int(
+        first["chunk"])]["columns"]
+    out = {}
+    for key in keys:
+      column = None
+      for shard, chunk in set(zip(entries["shard"].tolist(),
+                                  entries["chunk"].tolist())):
+        mask = (entries["shard"] == shard) & (entries["chunk"] == chunk)
+        data = self._column(shard, chunk, key)
+        if column is None:
+          column = np.empty((len(positions),) + data.shape[1:], data.dtype)
+        column[mask] = data[entries["row"][mask]]
+      out[key] = column
+    return out
+
+  def sample(
+      self, batch_size: int, rng: Optional[np.random.Generator] = None
+  ) -> Dict[str, np.ndarray]:
+    """Returns a minibatch of uniformly sampled steps."""
+    rng = rng or np.random.default_rng()
+    return self.get_batch(rng.integers(len(self), size=batch_size))
+
+  def _column(self, shard: int, chunk: int, key: str) -> np.ndarray:
+    """Returns a column of a chunk, decompressing it if needed."""
+    cache_key = (shard, chunk, key)
+    column = self._cache.get(cache_key)
+    if column is not None:
+      self._cache.move_to_end(cache_key)
+      return column
+    meta = self._shards[shard]["chunks"][chunk]["columns"][key]
+    buf = self._map(shard)
+    dtype = np.dtype(meta["dtype"])
+    if meta["compressed"]:
+      data = zlib.decompress(
+          buf[meta["offset"]:meta["offset"] + meta["length"]])
+      column = np.frombuffer(data, dtype).reshape(meta["shape"])
+      self._cache[cache_key] = column
+      if len(self._cache) > self._cache_chunks:
+        self._cache.popitem(last=False)
+    else:
+      # No copy, and no need to cache.
+      column = np.frombuffer(buf, dtype, count=int(np.prod(meta["shape"])),
+                             offset=meta["offset"]).reshape(meta["shape"])
+    return column
+
+  def _map(self, shard: int):
+    buf = self._maps.get(shard)
+    if buf is None:
+      f = open(os.path.join(self._path, self._shards[shard]["file"]), "rb")
+      self._files[shard] = f
+      buf = self._maps[shard] = mmap.mmap(
+          f.fileno(), 0, access=mmap.ACCESS_READ)
+    return buf
+
+  def close(self):
+    self._cache.clear()
+    self._maps.clear()  # Arrays may still reference the maps, so don't close.
+    for f in self._files.values():
+      f.close()
+    self._files.clear()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exception_type, exception_value, traceback):
+    self.close()
@@ -0,0 +1,117 @@
+# Copyright 2021 DeepMind Technologies Ltd. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for replay_dataset.py."""
+
+import os
+
+from absl.testing import absltest
+from absl.testing import parameterized
+import numpy as np
+from pysc2.lib.replay import replay_dataset
+
+
+def _observation(replay, player, step):
+  value = replay * 10000 + player * 1000 + step
+  return {
+      "game_loop": np.array([value], np.int32),
+      "mmr": np.int64(value),
+      "minimap": np.full((4, 5), value % 256, np.uint8),
+      "raw_units": np.full((3, 7), value, np.float32),
+  }
+
+
+def _episodes():
+  return [("replay_%d" % r, p, 13 + r * 5) for r in range(3) for p in (1, 2)]
+
+
+class ReplayDatasetTest(parameterized.TestCase):
+
+  def _write(self, **kwargs):
+    path = self.create_tempdir().full_path
+    with replay_dataset.ReplayDatasetWriter(
+        path, steps_per_chunk=4, chunks_per_shard=3, **kwargs) as writer:
+      for replay_id, player, length in _episodes():
+        r = int(replay_id.split("_")[1])
+        writer.add_episode(replay_id, player, (
+            _observation(r, player, s) for s in range(length)))
+    return path
+
+  def _assert_observation_equal(self, actual, expected):
+    self.assertCountEqual(actual, expected)
+    for k, v in expected.items():
+      np.testing.assert_array_equal(actual[k], v, err_msg=k)
+
+  @parameterized.parameters(1, None)
+  def testRoundTrip(self, compression_level):
+    path = self._write(compression_level=compression_level)
+    self.assertGreater(
+        len([f for f in os.listdir(path) if f.endswith(".data")]), 1)
+    with replay_dataset.ReplayDatasetReader(path, cache_chunks=2) as reader:
+      self.assertLen(reader, sum(length for _, _, length in _episodes()))
+      self.assertEqual(reader.replays, ["replay_0", "replay_1", "replay_2"])
+      for replay_id, player, length in _episodes():
+        r = int(replay_id.split("_")[1])
+        for s in range(length):
+          self._assert_observation_equal(
+              reader.get(reader.find(replay_id, player, s)),
+              _observation(r, player, s))
+
+  @parameterized.parameters(1, None)
+  def testGetBatch(self, compression_level):
+    path = self._write(compression_level=compression_level)
+    with replay_dataset.ReplayDatasetReader(path) as reader:
+      positions = [reader.find("replay_2", 2, 20), reader.find("replay_0", 1, 0),
+                   reader.find("replay_1", 1, 7), reader.find("replay_2", 2, 1)]
+      batch = reader.get_batch(positions)
+      expected = [_observation(2, 2, 20), _observation(0, 1, 0),
+                  _observation(1, 1, 7), _observation(2, 2, 1)]
+      for k in batch:
+        self.assertLen(batch[k], 4)
+        for i, e in enumerate(expected):
+          np.testing.assert_array_equal(batch[k][i], e[k], err_msg=k)
+
+  def testSample(self):
+    path = self._write()
+    with replay_dataset.ReplayDatasetReader(path) as reader:
+      batch = reader.sample(16, rng=np.random.default_rng(0))
+    self.assertEqual(batch["raw_units"].shape, (16, 3, 7))
+    self.assertEqual(batch["mmr"].shape, (16,))
+    self.assertEqual(batch["minimap"].dtype, np.uint8)
+
+  def testIndex(self):
+    path = self._write()
+    with replay_dataset.ReplayDatasetReader(path) as reader:
+      index = reader.index
+      self.assertEqual(index.dtype, replay_dataset.INDEX_DTYPE)
+      self.assertEqual(index["step"][:13].tolist(), list(range(13)))
+      self.assertEqual(set(index["player"].tolist()), {1, 2})
+      with self.assertRaises(KeyError):
+        reader.find("replay_0", 1, 13)
+
+  def testInconsistentShapes(self):
+    path = self.create_tempdir().full_path
+    writer = replay_dataset.ReplayDatasetWriter(path, steps_per_chunk=2)
+    writer.add("a", 1, 0, {"x": np.zeros(3)})
+    writer.add("a", 1, 1, {"x": np.zeros(4)})
+    with self.assertRaisesRegex(ValueError, "Inconsistent shapes"):
+      writer.close()
+
+  def testRefusesToOverwrite(self):
+    path = self._write()
+    with self.assertRaises(ValueError):
+      replay_dataset.ReplayDatasetWriter(path)
+
+
+if __name__ == "__main__":
+  absltest.main()
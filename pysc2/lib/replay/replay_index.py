@@ -0,0 +1,247 @@
+# Copyright 2021 DeepMind Technologies Ltd. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A persistent index of replay metadata, to avoid re-reading the replays.
+
+Reading a replay just to learn its version, length or map adds up to a lot of
+I/O for a large replay directory. A `ReplayIndex` stores that information in
+a sqlite database, keyed by path, and only re-reads replays whose size or mtime
+changed:
+
+  with ReplayIndex("/data/replays.index") as index:
+    index.update(run_config.replay_paths(replay_dir), parallel=16)
+    long_games = index.entries("game_duration_loops > ?", (20000,))
+"""
+
+import collections
+import json
+import multiprocessing
+import os
+import sqlite3
+from typing import Any, Iterable, List, Optional, Sequence
+
+from pysc2 import run_configs
+from pysc2.lib import gfile
+from pysc2.lib.replay import sc2_replay
+from pysc2.lib.replay import sc2_replay_utils
+
+_COLUMNS = (
+    ("path", "TEXT PRIMARY KEY"),
+    ("mtime", "REAL"),
+    ("size", "INTEGER"),
+    ("game_version", "TEXT"),
+    ("base_build", "INTEGER"),
+    ("data_version", "TEXT"),
+    ("map_name", "TEXT"),
+    ("game_duration_loops", "INTEGER"),
+    ("metadata", "TEXT"),  # json
+    ("details", "TEXT"),  # json
+    ("action_skips", "TEXT"),  # json, or NULL if not computed.
+    ("error", "TEXT"),  # Why the replay couldn't be read, or NULL.
+)
+_JSON_COLUMNS = ("metadata", "details", "action_skips")
+
+# How many replays to index between commits.
+_COMMIT_EVERY = 100
+
+
+class ReplayIndexEntry(collections.namedtuple(
+    "ReplayIndexEntry", [name for name, _ in _COLUMNS])):
+  """What is known about a single replay.
+
+  Attributes:
+    path: The path to the replay.
+    mtime: The modification time of the replay when it was indexed.
+    size: The size of the replay in bytes when it was indexed.
+    game_version: The game version, eg "4.10.0".
+    base_build: The base build, which decides which binary can run it.
+    data_version: The data version, if the replay is new enough to have one.
+    map_name: The map title, eg "Cyber Forest LE".
+    game_duration_loops: The length of the replay, in game loops.
+    metadata: The parsed `replay.gamemetadata.json`, including per player APM,
+        result and race.
+    details: A summary of `SC2Replay.details()`: the title, time and players.
+    action_skips: A dict of player id to the game loops with actions, as from
+        `sc2_replay_utils.raw_action_skips`, or None if not computed.
+    error: Why the replay couldn't be read, or None. The other fields other
+        than path, mtime and size are unset for these.
+  """
+  __slots__ = ()
+
+  @property
+  def version(self) -> run_configs.lib.Version:
+    return run_configs.lib.Version(
+        game_version=self.game_version,
+        build_version=self.base_build,
+        data_version=self.data_version,
+        binary=None)
+
+
+def _details_summary(details):
+  return {
+      "title": details["m_title"],
+      "time_utc": details["m_timeUTC"],
+      "players": [{
+          "name": p["m_name"],
+          "race": p["m_race"],
+          "result": p["m_result"],
+          "team_id": p["m_teamId"],
+      } for p in details["m_playerList"]],
+  }
+
+
+def _index_replay(args) -> ReplayIndexEntry:
+  """Read a single replay, returning its entry. Runs in a worker process."""
+  path, mtime, size, with_action_skips = args
+  try:
+    with gfile.Open(path, "rb") as f:
+      replay = sc2_replay.SC2Replay(f.read())
+    metadata = replay.metadata
+    header = replay._header  # pylint: disable=protected-access
+    action_skips = None
+    if with_action_skips:
+      action_skips = dict(sc2_replay_utils.raw_action_skips(replay))
+    return ReplayIndexEntry(
+        path=path,
+        mtime=mtime,
+        size=size,
+        game_version=".".join(metadata["GameVersion"].split(".")[:-1]),
+        base_build=int(metadata["BaseBuild"][4:]),
+        data_version=metadata.get("DataVersion"),
+        map_name=metadata["Title"],
+        game_duration_loops=header["m_elapsedGameLoops"],
+        metadata=metadata,
+        details=_details_summary(replay.details()),
+        action_skips=action_skips,
+        error=None)
+  except Exception as e:  # pylint: disable=broad-except
+    # Corrupt replays fail in many ways. Remember them so they aren't retried
+    # until they change.
+    return ReplayIndexEntry(
+        path, mtime, size, *[None] * (len(_COLUMNS) - 4), error=repr(e))
+
+
+class ReplayIndex(object):
+  """A sqlite backed index of replay metadata, updated incrementally."""
+
+  def __init__(self, path: str):
+    """Open the index, creating it if needed.
+
+    Args:
+      path: The path of the index database.
+    """
+    self._db = sqlite3.connect(path)
+    self._db.execute("CREATE TABLE IF NOT EXISTS replays (%s)" % ", ".join(
+        "%s %s" % c for c in _COLUMNS))
+    for column in ("base_build", "map_name", "game_duration_loops"):
+      self._db.execute(
+          "CREATE INDEX IF NOT EXISTS replays_%s ON replays (%s)" % (
+              column, column))
+    self._db.commit()
+
+  def update(self,
+             replay_paths: Iterable[str],
+             parallel: Optional[int] = None,
+             action_skips: bool = False,
+             prune: bool = False) -> int:
+    """Index any replays that are new or have changed since they were indexed.
+
+    Args:
+      replay_paths: The replays that should be in the index.
+      parallel: How many processes to read the replays with. Defaults to the
+          number of cpus.
+      action_skips: Whether to also compute the action skips, which needs the
+          game events to be decoded, so is much slower.
+      prune: Whether to remove the entries of replays not in `replay_paths`.
+
+    Returns:
+      The number of replays that were (re)indexed.
+    """
+    known = {path: (mtime, size, has_skips) for path, mtime, size, has_skips in
+             self._db.execute("SELECT path, mtime, size, "
+                              "action_skips IS NOT NULL OR error IS NOT NULL "
+                              "FROM replays")}
+    todo = []
+    seen = set()
+    for path in replay_paths:
+      seen.add(path)
+      stat = os.stat(path)
+      old = known.get(path)
+      if (old is None or old[:2] != (stat.st_mtime, stat.st_size) or
+          (action_skips and not old[2])):
+        todo.append((path, stat.st_mtime, stat.st_size, action_skips))
+
+    if prune:
+      self._db.executemany("DELETE FROM replays WHERE path = ?",
+                           [(p,) for p in known if p not in seen])
+
+    if todo:
+      with multiprocessing.Pool(min(parallel or os.cpu_count(),
+                                    len(todo))) as pool:
+        for i, entry in enumerate(
+            pool.imap_unordered(_index_replay, todo, chunksize=8), 1):
+          self._put(entry)
+          if i % _COMMIT_EVERY == 0:
+            self._db.commit()
+    self._db.commit()
+    return len(todo)
+
+  def _put(self, entry: ReplayIndexEntry):
+    values = [json.dumps(v) if name in _JSON_COLUMNS and v is not None else v
+              for (name, _), v in zip(_COLUMNS, entry)]
+    self._db.execute("INSERT OR REPLACE INTO replays VALUES (%s)" % ", ".join(
+        "?" * len(_COLUMNS)), values)
+
+  def _entry(self, row: Sequence[Any]) -> ReplayIndexEntry:
+    entry = ReplayIndexEntry(*[
+        json.loads(v) if name in _JSON_COLUMNS and v is not None else v
+        for (name, _), v in zip(_COLUMNS, row)])
+    if entry.action_skips:
+      # json only has string keys.
+      entry = entry._replace(action_skips={
+          int(k): v for k, v in entry.action_skips.items()})
+    return entry
+
+  def get(self, replay_path: str) -> Optional[ReplayIndexEntry]:
+    """Returns the entry for a replay, or None if it isn't indexed."""
+    row = self._db.execute("SELECT * FROM replays WHERE path = ?",
+                           (replay_path,)).fetchone()
+    return self._entry(row) if row else None
+
+  def entries(self, where: str = "",
+              params: Sequence[Any] = ()) -> List[ReplayIndexEntry]:
+    """Returns the entries, optionally filtered by an SQL WHERE clause.
+
+    For example: `entries("error IS NULL AND base_build = ?", (75689,))`.
+
+    Args:
+      where: An optional SQL condition over the columns of `ReplayIndexEntry`.
+      params: The values for any `?` placeholders in `where`.
+    """
+    query = "SELECT * FROM replays"
+    if where:
+      query += " WHERE " + where
+    return [self._entry(row)
+            for row in self._db.execute(query + " ORDER BY path", params)]
+
+  def __len__(self) -> int:
+    return self._db.execute("SELECT COUNT(*) FROM replays").fetchone()[0]
+
+  def close(self):
+    self._db.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exception_type, exception_value, traceback):
+    self.close()
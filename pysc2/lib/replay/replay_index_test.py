@@ -0,0 +1,93 @@
+# Copyright 2021 DeepMind Technologies Ltd. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for replay_index.py."""
+
+import os
+import shutil
+
+from absl.testing import absltest
+from pysc2.lib import resources
+from pysc2.lib.replay import replay_index
+
+PATH = "pysc2/lib/replay/test_data"
+
+
+class ReplayIndexTest(absltest.TestCase):
+
+  def setUp(self):
+    super(ReplayIndexTest, self).setUp()
+    self._dir = self.create_tempdir().full_path
+    self._replays = []
+    for i in (1, 2):
+      name = "replay_0%d.SC2Replay" % i
+      path = os.path.join(self._dir, name)
+      shutil.copy(resources.GetResourceFilename(os.path.join(PATH, name)), path)
+      self._replays.append(path)
+    self._index_path = os.path.join(self._dir, "replays.index")
+
+  def testIndexesReplays(self):
+    with replay_index.ReplayIndex(self._index_path) as index:
+      self.assertEqual(index.update(self._replays, parallel=2), 2)
+      entry = index.get(self._replays[0])
+    self.assertIsNone(entry.error)
+    self.assertEqual(entry.version.game_version, "4.10.0")
+    self.assertEqual(entry.version.build_version, 75689)
+    self.assertEqual(entry.map_name, "Cyber Forest LE")
+    self.assertEqual(entry.game_duration_loops, 18376)
+    self.assertEqual(entry.metadata["Players"][1]["APM"], 204)
+    self.assertLen(entry.details["players"], 2)
+    self.assertIsNone(entry.action_skips)
+
+  def testUpdatesIncrementally(self):
+    with replay_index.ReplayIndex(self._index_path) as index:
+      index.update(self._replays[:1], parallel=1)
+    with replay_index.ReplayIndex(self._index_path) as index:
+      self.assertEqual(index.update(self._replays, parallel=1), 1)
+      self.assertEqual(index.update(self._replays, parallel=1), 0)
+      self.assertLen(index, 2)
+
+      # Changed replays are read again.
+      with open(self._replays[1], "ab") as f:
+        f.write(b"garbage")
+      self.assertEqual(index.update(self._replays, parallel=1), 1)
+
+      self.assertEqual(index.update(self._replays[:1], prune=True), 0)
+      self.assertLen(index, 1)
+
+  def testActionSkips(self):
+    with replay_index.ReplayIndex(self._index_path) as index:
+      index.update(self._replays[:1], parallel=1)
+      self.assertEqual(
+          index.update(self._replays[:1], parallel=1, action_skips=True), 1)
+      skips = index.get(self._replays[0]).action_skips
+    self.assertCountEqual(skips, [1, 2])
+    self.assertNotEmpty(skips[1])
+
+  def testBadReplay(self):
+    bad = os.path.join(self._dir, "bad.SC2Replay")
+    with open(bad, "wb") as f:
+      f.write(b"not a replay")
+    with replay_index.ReplayIndex(self._index_path) as index:
+      index.update([bad] + self._replays, parallel=2)
+      self.assertIsNotNone(index.get(bad).error)
+      self.assertEqual(index.update([bad], parallel=1), 0)
+      self.assertEqual(
+          [e.path for e in index.entries("error IS NULL")], self._replays)
+      self.assertEqual(
+          [e.path for e in index.entries("game_duration_loops > ?", (18000,))],
+          self._replays[:1])
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -13,18 +13,24 @@
 # limitations under the License.
 """SC2 replays -> ResponseObservation proto streams."""
 
+from concurrent import futures
+import functools
 import io
 import json
 import time
+from typing import Optional
 
 from absl import logging
 import mpyq
 from pysc2 import run_configs
+from pysc2.lib import run_parallel
+from pysc2.lib import sc_process_pool
 
 from s2clientprotocol import sc2api_pb2 as sc_pb
 
 
-def _get_replay_version(replay_data):
+def get_replay_version(replay_data):
+  """Read the `run_configs.lib.Version` of a replay from its metadata."""
   replay_io = io.BytesIO()
   replay_io.write(replay_data)
   replay_io.seek(0)
@@ -70,7 +76,9 @@ class ReplayObservationStream(object):
                step_mul: int = 1,
                disable_fog: bool = False,
                game_steps_per_episode: int = 0,
-               add_opponent_observations: bool = False):
+               add_opponent_observations: bool = False,
+               process_pool: Optional[sc_process_pool.ProcessPool] = None,
+               prefetch: bool = False):
     """Constructs the replay stream object.
 
     Args:
@@ -82,11 +90,21 @@ class ReplayObservationStream(object):
           observations in addition to the observing player. Note that this will
           start two SC2 processes simultaneously if set to True. By default is
           False and returns observations from one player's perspective.
+      process_pool: Optional pool to get the SC2 processes from, and to return
+          them to when done, rather than launching and killing them.
+      prefetch: Bool, True to step and observe the next frame in a background
+          thread while the caller handles the current one. The controllers are
+          then busy while iterating, so don't use them (ie `game_info`) until
+          `observations` is done. Off by default.
     """
     self._step_mul = step_mul
     self._disable_fog = disable_fog
     self._game_steps_per_episode = game_steps_per_episode
     self._add_opponent_observations = add_opponent_observations
+    self._process_pool = process_pool
+    self._prefetch = prefetch
+    self._parallel = run_parallel.RunParallel()
+    self._prefetcher = None
 
     self._packet_count = 0
     self._info = None
@@ -108,9 +126,11 @@ class ReplayObservationStream(object):
       # Close current process and create a new one.
       self._close()
       self._run_config = run_configs.get(version=version)
-      self._sc2_procs = [self._run_config.start(want_rgb=self._want_rgb)]
+      start = (self._process_pool.start if self._process_pool
+               else lambda run_config, **kwargs: run_config.start(**kwargs))
+      self._sc2_procs = [start(self._run_config, want_rgb=self._want_rgb)]
       if self._add_opponent_observations:
-        self._sc2_procs.append(self._run_config.start(want_rgb=self._want_rgb))
+        self._sc2_procs.append(start(self._run_config, want_rgb=self._want_rgb))
 
       self._controllers = [
           proc.controller for proc in self._sc2_procs
@@ -120,6 +140,12 @@ class ReplayObservationStream(object):
 
   def _close(self):
     self._run_config = None
+    if self._process_pool:
+      for proc in self._sc2_procs:
+        if proc:
+          self._process_pool.release(proc)
+      self._sc2_procs = []
+      self._controllers = []
     for controller in self._controllers:
       if controller:
         controller.quit()
@@ -134,7 +160,7 @@ class ReplayObservationStream(object):
     self._player_id = player_id
 
     try:
-      version = _get_replay_version(replay_data)
+      version = get_replay_version(replay_data)
     except (ValueError, AttributeError) as err:
       logging.exception("Error getting replay version from data: %s", err)
       raise ReplayError(err)
@@ -193,44 +219,66 @@ class ReplayObservationStream(object):
     period = 1000  # log packet rate every 1000 packets
     logging.info("Begin iterating over frames...")
 
-    while True:
-      obs = [controller.observe() for controller in self._controllers]
-      if self._packet_count == 0:
-        logging.info("The first packet has been read")
-      self._packet_count += 1
-      if len(obs) == 1:
-        yield obs[0]
-      else:
-        yield obs
-
-      if (obs[0].player_result or
-          (step_sequence and self._packet_count > len(step_sequence))):
-        # End of game.
-        break
-
-      if self._game_steps_per_episode > 0:
-        if obs[0].observation.game_loop >= self._game_steps_per_episode - 1:
-          break
-
-      for controller in self._controllers:
-        if step_sequence and self._packet_count <= len(step_sequence):
-          step_mul = step_sequence[self._packet_count - 1]
+    if self._prefetch and not self._prefetcher:
+      self._prefetcher = futures.ThreadPoolExecutor(1)
+    pending = None  # The next frame, if it's being prefetched.
+    try:
+      obs = self._parallel.run(c.observe for c in self._controllers)
+      while True:
+        if self._packet_count == 0:
+          logging.info("The first packet has been read")
+        self._packet_count += 1
+
+        done = bool(
+            obs[0].player_result or
+            (step_sequence and self._packet_count > len(step_sequence)) or
+            (self._game_steps_per_episode > 0 and
+             obs[0].observation.game_loop >= self._game_steps_per_episode - 1))
+        if not done:
+          if step_sequence and self._packet_count <= len(step_sequence):
+            step_mul = step_sequence[self._packet_count - 1]
+          else:
+            step_mul = self._step_mul
+          # Step and observe in one round trip, with all players in parallel.
+          step_observe = [
+              functools.partial(c.actions_step_observe, None, count=step_mul)
+              for c in self._controllers]
+          if self._prefetch:
+            pending = self._prefetcher.submit(self._parallel.run, step_observe)
+
+        if len(obs) == 1:
+          yield obs[0]
         else:
-          step_mul = self._step_mul
+          yield obs
 
-        controller.step(step_mul)
+        if done:
+          break
 
-      if self._packet_count % period == 0:
-        time_taken = time.time() - period_start
-        period_start = time.time()
-        logging.info(
-            "Frame: %d, packets per sec: %.1f",
-            obs[0].observation.game_loop, period / time_taken)
+        if pending:
+          obs = pending.result()
+          pending = None
+        else:
+          obs = self._parallel.run(step_observe)
+
+        if self._packet_count % period == 0:
+          time_taken = time.time() - period_start
+          period_start = time.time()
+          logging.info(
+              "Frame: %d, packets per sec: %.1f",
+              obs[0].observation.game_loop, period / time_taken)
+    finally:
+      if pending:
+        # The caller stopped early, so let the controllers finish.
+        futures.wait([pending])
 
   def close(self):
     """Close the replay process connection."""
     logging.info("Quitting...")
     self._close()
+    if self._prefetcher:
+      self._prefetcher.shutdown()
+      self._prefetcher = None
+    self._parallel.shutdown()
 
   def __enter__(self):
     return self
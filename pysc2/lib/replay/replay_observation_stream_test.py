@@ -0,0 +1,106 @@
+# Copyright 2021 DeepMind Technologies Ltd. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for replay_observation_stream.py against a fake SC2."""
+
+from unittest import mock
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from pysc2 import run_configs
+from pysc2.lib import fake_sc2_server
+from pysc2.lib import remote_controller
+from pysc2.lib.replay import replay_observation_stream
+
+from s2clientprotocol import sc2api_pb2 as sc_pb
+
+
+class _FakeProcess(object):
+  """Looks enough like a StarcraftProcess, but connects to a fake server."""
+
+  def __init__(self, server):
+    self.controller = remote_controller.RemoteController(
+        server.host, server.port, timeout_seconds=5)
+
+  def close(self):
+    self.controller.quit()
+
+
+class _FakeRunConfig(object):
+
+  def __init__(self, server):
+    self._server = server
+
+  def start(self, want_rgb=True):
+    del want_rgb  # Unused.
+    return _FakeProcess(self._server)
+
+
+class ReplayObservationStreamTest(parameterized.TestCase):
+
+  def setUp(self):
+    super(ReplayObservationStreamTest, self).setUp()
+    self._server = fake_sc2_server.FakeSC2Server(
+        status=sc_pb.launched, step_latency=0.0001).start()
+    self.addCleanup(self._server.close)
+    for patcher in (
+        mock.patch.object(replay_observation_stream, "get_replay_version",
+                          lambda replay_data: "4.10.0"),
+        mock.patch.object(run_configs, "get",
+                          lambda version: _FakeRunConfig(self._server))):
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  @parameterized.product(add_opponent_observations=(False, True),
+                         prefetch=(False, True))
+  def testObservations(self, add_opponent_observations, prefetch):
+    with replay_observation_stream.ReplayObservationStream(
+        sc_pb.InterfaceOptions(raw=True), step_mul=8,
+        game_steps_per_episode=40,
+        add_opponent_observations=add_opponent_observations,
+        prefetch=prefetch) as stream:
+      stream.start_replay_from_data(b"replay", player_id=1)
+      game_loops = []
+      for obs in stream.observations():
+        if add_opponent_observations:
+          self.assertLen(obs, 2)
+          self.assertEqual(obs[0].observation.game_loop,
+                           obs[1].observation.game_loop)
+          obs = obs[0]
+        game_loops.append(obs.observation.game_loop)
+    self.assertEqual(game_loops, [0, 8, 16, 24, 32, 40])
+
+  def testStepSequence(self):
+    with replay_observation_stream.ReplayObservationStream(
+        sc_pb.InterfaceOptions(raw=True),
+        add_opponent_observations=True) as stream:
+      stream.start_replay_from_data(b"replay", player_id=2)
+      game_loops = [obs[0].observation.game_loop
+                    for obs in stream.observations(step_sequence=[1, 2, 3])]
+    self.assertEqual(game_loops, [0, 1, 3, 6])
+
+  def testStopEarly(self):
+    with replay_observation_stream.ReplayObservationStream(
+        sc_pb.InterfaceOptions(raw=True),
+        add_opponent_observations=True,
+        prefetch=True) as stream:
+      stream.start_replay_from_data(b"replay", player_id=1)
+      for obs in stream.observations():
+        if obs[0].observation.game_loop == 5:
+          break
+      # The prefetched step has finished, so the controllers are free again.
+      self.assertEqual(stream.game_info().ListFields(), [])
+
+
+if __name__ == "__main__":
+  absltest.main()
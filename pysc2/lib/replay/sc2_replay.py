@@ -13,11 +13,13 @@
 # limitations under the License.
 """Utility functions for loading replay data using the s2protocol library."""
 
+import collections
 import io
 import json
 import types
 
 import mpyq
+from s2protocol import decoders as s2decoders
 from s2protocol import versions as s2versions
 import tree
 
@@ -31,37 +33,46 @@ def _convert_to_str(s):
 
 def _convert_all_to_str(structure):
   if isinstance(structure, types.GeneratorType):
-    return tree.map_structure(_convert_to_str, list(structure))
+    # Convert each event as it's decoded, rather than decoding them all first.
+    return (tree.map_structure(_convert_to_str, s) for s in structure)
   else:
     return tree.map_structure(_convert_to_str, structure)
 
 
+# The fields of a game event needed to know who acted when.
+GameEventHeader = collections.namedtuple(
+    "GameEventHeader", ["game_loop", "user_id", "event_type"])
+
+
 class SC2Replay(object):
   """Helper class for loading and extracting data using s2protocol library."""
 
   def __init__(self, replay_data):
     """Construct SC2Replay helper for extracting data from a replay."""
-    (self._header, self._metadata, self._extracted,
+    (self._header, self._metadata, self._archive,
      self._protocol) = _extract(replay_data)
 
+  def _read_file(self, name):
+    """Extract a single file from the archive."""
+    return self._archive.read_file(name)
+
   def details(self):
-    details_key = b"replay.details"
-    if details_key not in self._extracted:
-      details_key = b"replay.details.backup"
+    details = self._read_file("replay.details")
+    if details is None:
+      details = self._read_file("replay.details.backup")
 
-    return _convert_all_to_str(
-        self._protocol.decode_replay_details(self._extracted[details_key]))
+    return _convert_all_to_str(self._protocol.decode_replay_details(details))
 
   def init_data(self):
     return _convert_all_to_str(
         self._protocol.decode_replay_initdata(
-            self._extracted[b"replay.initData"]))
+            self._read_file("replay.initData")))
 
   def tracker_events(self, filter_fn=None):
     """Yield tracker events from the replay in s2protocol format."""
     for event in _convert_all_to_str(
         self._protocol.decode_replay_tracker_events(
-            self._extracted[b"replay.tracker.events"])):
+            self._read_file("replay.tracker.events"))):
       if not filter_fn or filter_fn(event):
         yield event
 
@@ -69,15 +80,44 @@ class SC2Replay(object):
     """Yield game events from the replay in s2protocol format."""
     for event in _convert_all_to_str(
         self._protocol.decode_replay_game_events(
-            self._extracted[b"replay.game.events"])):
+            self._read_file("replay.game.events"))):
       if not filter_fn or filter_fn(event):
         yield event
 
+  def game_event_headers(self):
+    """Yield a `GameEventHeader` for each game event.
+
+    The events still need to be decoded to find where the next one starts, but
+    this skips building and converting the full s2protocol event dicts, so is
+    much faster than `game_events` if only the timing is needed.
+    """
+    protocol = self._protocol
+    decoder = s2decoders.BitPackedDecoder(
+        self._read_file("replay.game.events"), protocol.typeinfos)
+    svaruint32_typeid = protocol.svaruint32_typeid
+    replay_userid_typeid = protocol.replay_userid_typeid
+    eventid_typeid = protocol.game_eventid_typeid
+    event_types = protocol.game_event_types
+    game_loop = 0
+    while not decoder.done():
+      # The game loop delta is a single valued choice of differently sized ints.
+      game_loop += next(iter(
+          decoder.instance(svaruint32_typeid).values()), 0)
+      user_id = decoder.instance(replay_userid_typeid)["m_userId"]
+      event_id = decoder.instance(eventid_typeid)
+      typeid, typename = event_types.get(event_id, (None, None))
+      if typeid is None:
+        raise s2decoders.CorruptedError(
+            "eventid({}) at {}".format(event_id, decoder))
+      decoder.instance(typeid)  # Skip over the event.
+      decoder.byte_align()
+      yield GameEventHeader(game_loop, user_id, typename)
+
   def message_events(self, filter_fn=None):
     """Yield message events from the replay in s2protocol format."""
     for event in _convert_all_to_str(
         self._protocol.decode_replay_message_events(
-            self._extracted[b"replay.message.events"])):
+            self._read_file("replay.message.events"))):
       if not filter_fn or filter_fn(event):
         yield event
 
@@ -85,7 +125,7 @@ class SC2Replay(object):
     """Yield attribute events from the replay in s2protocol format."""
     for event in _convert_all_to_str(
         self._protocol.decode_replay_attributes_events(
-            self._extracted[b"replay.attributes.events"])):
+            self._read_file("replay.attributes.events"))):
       if not filter_fn or filter_fn(event):
         yield event
 
@@ -104,13 +144,12 @@ def _extract(contents):
   replay_io.write(contents)
   replay_io.seek(0)
   archive = mpyq.MPQArchive(replay_io)
-  extracted = archive.extract()
   metadata = json.loads(
-      bytes.decode(extracted[b"replay.gamemetadata.json"], "utf-8"))
+      bytes.decode(archive.read_file("replay.gamemetadata.json"), "utf-8"))
   contents = archive.header["user_data_header"]["content"]
   header = s2versions.latest().decode_replay_header(contents)
   base_build = header["m_version"]["m_baseBuild"]
   protocol = s2versions.build(base_build)
   if protocol is None:
     raise ValueError("Could not load protocol {} for replay".format(base_build))
-  return header, metadata, extracted, protocol
+  return header, metadata, archive, protocol
@@ -116,6 +116,19 @@ class Sc2ReplayTest(absltest.TestCase):
          "NNet.Game.SUserFinishedLoadingSyncEvent",
          "NNet.Game.SUserOptionsEvent"})
 
+  def testGameEventsAreStreamed(self):
+    events = self._replay.game_events()
+    self.assertNotIsInstance(events, list)
+    self.assertEqual(next(events)["_gameloop"], 0)
+
+  def testGameEventHeaders(self):
+    headers = list(self._replay.game_event_headers())
+    self.assertEqual(
+        headers,
+        [(e["_gameloop"], e["_userid"]["m_userId"], e["_event"])
+         for e in self._replay.game_events()])
+    self.assertEqual(headers[-1].game_loop, 18371)
+
   def testMessageEvents(self):
     events = list(self._replay.message_events())
     event_types = set(s["_event"] for s in events)
@@ -60,17 +60,19 @@ def raw_action_skips(replay: sc2_replay.SC2Replay) -> Mapping[int, List[int]]:
   """
   action_frames = collections.defaultdict(list)
   last_game_loop = None
+  readable_event_types = {}
   # Extract per-user events of interest.
-  for event in replay.game_events():
-    event_type = _readable_event_type(event["_event"])
+  for game_loop, user_id, full_event_type in replay.game_event_headers():
+    event_type = readable_event_types.get(full_event_type)
+    if event_type is None:
+      event_type = readable_event_types[full_event_type] = (
+          _readable_event_type(full_event_type))
     if event_type not in _EVENT_TYPES_TO_FILTER_OUT:
-      game_loop = event["_gameloop"]
       last_game_loop = game_loop
       # As soon as anyone leaves, we stop tracking events.
       if event_type == "GameUserLeave":
         break
 
-      user_id = event["_userid"]["m_userId"]
       player_id = user_id + 1
       if player_id < 1 or player_id > 2:
         raise ValueError(f"Unexpected player_id: {player_id}")
@@ -216,6 +216,44 @@ class StarcraftProcess(object):
   def pid(self):
     return self._proc.pid if self.running else None
 
+  @property
+  def listening(self):
+    """Whether SC2 is listening on its port, ie is ready for a connection."""
+    if FLAGS.sc2_port:
+      return True
+    if not self.running:
+      return False
+    listening = _is_listening(self._port)
+    return True if listening is None else listening  # Unknown, so just try.
+
+
+def _is_listening(port):
+  """Whether something is listening on this TCP port, or None if unknown.
+
+  This reads the kernel's socket tables rather than connecting, so it's cheap
+  and doesn't disturb the process that's starting up. It only works on Linux.
+
+  Args:
+    port: The TCP port to check.
+
+  Returns:
+    True or False, or None if it can't tell on this platform.
+  """
+  known = False
+  for path in ("/proc/net/tcp", "/proc/net/tcp6"):
+    try:
+      with open(path) as f:
+        lines = f.readlines()[1:]  # Skip the header.
+    except OSError:
+      continue
+    known = True
+    for line in lines:
+      parts = line.split()
+      local_address, state = parts[1], parts[3]
+      if state == "0A" and int(local_address.rsplit(":", 1)[1], 16) == port:
+        return True  # 0A is TCP_LISTEN.
+  return False if known else None
+
 
 def _shutdown_proc(p, timeout):
   """Wait for a proc to shut down, then terminate or kill it after `timeout`."""
@@ -0,0 +1,211 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A pool of launched and connected SC2 processes to reuse across games.
+
+Launching SC2 and connecting to it takes 10s of seconds, which dominates the
+creation time of short lived environments. A `ProcessPool` keeps processes
+around after an environment is done with them, and hands them to the next
+environment that asks for the same version:
+
+  pool = sc_process_pool.ProcessPool()
+  for params in sweep:
+    with sc2_env.SC2Env(..., process_pool=pool) as env:
+      ...
+  pool.close()
+"""
+
+import collections
+import threading
+import time
+
+from absl import logging
+from pysc2.lib import protocol
+from pysc2.lib import remote_controller
+from pysc2.lib import stopwatch
+
+sw = stopwatch.sw
+
+Status = protocol.Status  # pylint: disable=invalid-name
+
+
+class PoolStats(collections.namedtuple("PoolStats", [
+    "hits", "misses", "recycled", "discarded", "launch_time",
+    "launch_time_saved"])):
+  """Counters for how well the pool is working.
+
+  Attributes:
+    hits: How many `start` calls were served by an idle process.
+    misses: How many `start` calls needed to launch a new process.
+    recycled: How many processes were returned to the pool by `release`.
+    discarded: How many processes were closed as unhealthy or surplus.
+    launch_time: Total seconds spent launching new processes.
+    launch_time_saved: Estimated seconds saved, based on the mean launch time.
+  """
+  __slots__ = ()
+
+  @property
+  def hit_rate(self):
+    total = self.hits + self.misses
+    return self.hits / total if total else 0
+
+
+class ProcessPool(object):
+  """Keeps launched and connected `StarcraftProcess`es around for reuse.
+
+  Processes are keyed by the run config's version, whether they render rgb and
+  any other launch arguments. They are health checked with a `ping` before
+  being handed out, and are taken out of any game they're in when released.
+  This is thread safe.
+  """
+
+  def __init__(self, max_idle_per_key=None):
+    """Create the pool.
+
+    Args:
+      max_idle_per_key: How many idle processes to keep per key. Extra
+          processes are closed when released. None means no limit.
+    """
+    self._max_idle_per_key = max_idle_per_key
+    self._idle = collections.defaultdict(list)
+    self._keys = {}  # id(proc) -> key, for the processes handed out.
+    self._lock = threading.Lock()
+    self._hits = 0
+    self._misses = 0
+    self._recycled = 0
+    self._discarded = 0
+    self._launch_time = 0
+
+  @staticmethod
+  def _key(run_config, want_rgb, kwargs):
+    # The multiplayer ports are sent with the join request, so don't affect
+    # which process can be used.
+    kwargs = {k: v for k, v in kwargs.items() if k != "extra_ports"}
+    return (type(run_config), run_config.version, want_rgb,
+            repr(sorted(kwargs.items())))
+
+  @sw.decorate("process_pool_start")
+  def start(self, run_config, want_rgb=True, need_launched=False, **kwargs):
+    """Get a process, either an idle one or by launching a new one.
+
+    Args:
+      run_config: The `run_configs.lib.RunConfig` to launch with.
+      want_rgb: Whether the process must support rgb rendering.
+      need_launched: Whether the process must not be in a game, ie because it
+          is going to join a game rather than create one. Processes that are
+          still in a game can create a new game or start a replay.
+      **kwargs: Passed to `run_config.start` when launching a new process.
+
+    Returns:
+      A `StarcraftProcess` with a connected controller. Return it with
+      `release` rather than closing it.
+    """
+    key = self._key(run_config, want_rgb, kwargs)
+    while True:
+      with self._lock:
+        procs = self._idle[key]
+        for i, proc in enumerate(procs):
+          if not need_launched or proc.controller.status == Status.launched:
+            del procs[i]
+            break
+        else:
+          break
+      if self._healthy(proc):
+        with self._lock:
+          self._hits += 1
+          self._keys[id(proc)] = key
+        return proc
+      self._discard(proc)
+
+    start_time = time.time()
+    proc = run_config.start(want_rgb=want_rgb, **kwargs)
+    with self._lock:
+      self._misses += 1
+      self._launch_time += time.time() - start_time
+      self._keys[id(proc)] = key
+    return proc
+
+  @sw.decorate("process_pool_release")
+  def release(self, proc):
+    """Return a process to the pool, or close it if it's unusable."""
+    with self._lock:
+      key = self._keys.pop(id(proc), None)
+    if key is None:
+      raise ValueError("Process wasn't started by this pool.")
+    controller = proc.controller
+    if controller and controller.status in (Status.in_game, Status.ended):
+      try:
+        controller.leave()
+      except (protocol.ProtocolError, remote_controller.RequestError):
+        # Single player games can't be left, but creating a new game or
+        # starting a replay still works from here.
+        pass
+      except protocol.ConnectionError:
+        pass  # The health check will discard it.
+    if not self._healthy(proc):
+      self._discard(proc)
+      return
+    with self._lock:
+      procs = self._idle[key]
+      if (self._max_idle_per_key is None or
+          len(procs) < self._max_idle_per_key):
+        procs.append(proc)
+        self._recycled += 1
+        return
+    self._discard(proc)
+
+  def _healthy(self, proc):
+    """Whether the process is running and responds to a ping."""
+    if not proc.running or not proc.controller:
+      return False
+    if proc.controller.status == Status.quit:
+      return False
+    try:
+      proc.controller.ping()
+    except (protocol.ConnectionError, protocol.ProtocolError):
+      logging.warning("Discarding an unresponsive SC2 process.")
+      return False
+    return True
+
+  def _discard(self, proc):
+    with self._lock:
+      self._discarded += 1
+    proc.close()
+
+  @property
+  def stats(self):
+    with self._lock:
+      mean_launch_time = (self._launch_time / self._misses
+                          if self._misses else 0)
+      return PoolStats(
+          hits=self._hits,
+          misses=self._misses,
+          recycled=self._recycled,
+          discarded=self._discarded,
+          launch_time=self._launch_time,
+          launch_time_saved=self._hits * mean_launch_time)
+
+  def close(self):
+    """Close all the idle processes. Processes in use are left alone."""
+    with self._lock:
+      procs = [p for procs in self._idle.values() for p in procs]
+      self._idle.clear()
+    for proc in procs:
+      proc.close()
+    logging.info("Process pool closed: %s", self.stats)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, unused_exception_type, unused_exc_value, unused_traceback):
+    self.close()
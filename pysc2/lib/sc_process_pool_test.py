@@ -0,0 +1,128 @@
+#!/usr/bin/python
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for sc_process_pool.py."""
+
+from absl.testing import absltest
+from pysc2.lib import fake_sc2_server
+from pysc2.lib import protocol
+from pysc2.lib import remote_controller
+from pysc2.lib import sc_process_pool
+
+
+class _FakeProcess(object):
+  """Looks enough like a StarcraftProcess, but connects to a fake server."""
+
+  def __init__(self, server):
+    self.controller = remote_controller.RemoteController(
+        server.host, server.port, timeout_seconds=5)
+    self.running = True
+    self.closed = False
+
+  def close(self):
+    self.controller.quit()
+    self.running = False
+    self.closed = True
+
+
+class _FakeRunConfig(object):
+
+  def __init__(self, server, version="4.10.0"):
+    self._server = server
+    self.version = version
+    self.launched = []
+
+  def start(self, want_rgb=True, **kwargs):
+    del want_rgb, kwargs  # Unused.
+    proc = _FakeProcess(self._server)
+    self.launched.append(proc)
+    return proc
+
+
+class ProcessPoolTest(absltest.TestCase):
+
+  def setUp(self):
+    super(ProcessPoolTest, self).setUp()
+    self._server = fake_sc2_server.FakeSC2Server().start()
+    self._run_config = _FakeRunConfig(self._server)
+    self._pool = sc_process_pool.ProcessPool()
+
+  def tearDown(self):
+    self._pool.close()
+    self._server.close()
+    super(ProcessPoolTest, self).tearDown()
+
+  def testReusesReleasedProcesses(self):
+    proc = self._pool.start(self._run_config, want_rgb=False)
+    self._pool.release(proc)
+    self.assertIs(self._pool.start(self._run_config, want_rgb=False), proc)
+    self.assertLen(self._run_config.launched, 1)
+    stats = self._pool.stats
+    self.assertEqual((stats.hits, stats.misses, stats.recycled), (1, 1, 1))
+    self.assertEqual(stats.hit_rate, 0.5)
+
+  def testReleaseLeavesTheGame(self):
+    proc = self._pool.start(self._run_config)
+    self.assertEqual(proc.controller.status, protocol.Status.in_game)
+    self._pool.release(proc)
+    self.assertEqual(proc.controller.status, protocol.Status.launched)
+
+  def testKeyedByVersionAndRgb(self):
+    proc = self._pool.start(self._run_config, want_rgb=False)
+    self._pool.release(proc)
+    self.assertIsNot(self._pool.start(self._run_config, want_rgb=True), proc)
+    other_version = _FakeRunConfig(self._server, version="4.11.0")
+    self.assertIsNot(self._pool.start(other_version, want_rgb=False), proc)
+    self.assertEqual(self._pool.stats.misses, 3)
+
+  def testIgnoresExtraPorts(self):
+    proc = self._pool.start(self._run_config, extra_ports=[1, 2])
+    self._pool.release(proc)
+    self.assertIs(self._pool.start(self._run_config, extra_ports=[3, 4]), proc)
+
+  def testDiscardsDeadProcesses(self):
+    proc = self._pool.start(self._run_config)
+    self._pool.release(proc)
+    proc.running = False
+    self.assertIsNot(self._pool.start(self._run_config), proc)
+    self.assertTrue(proc.closed)
+    self.assertEqual(self._pool.stats.discarded, 1)
+
+  def testNeedLaunched(self):
+    with fake_sc2_server.FakeSC2Server(
+        errors={"leave_game": "Can't leave a single player game"}) as server:
+      run_config = _FakeRunConfig(server)
+      proc = self._pool.start(run_config)
+      self._pool.release(proc)
+      self.assertEqual(proc.controller.status, protocol.Status.in_game)
+      self.assertIsNot(self._pool.start(run_config, need_launched=True), proc)
+      self.assertIs(self._pool.start(run_config), proc)
+
+  def testMaxIdlePerKey(self):
+    pool = sc_process_pool.ProcessPool(max_idle_per_key=1)
+    procs = [pool.start(self._run_config) for _ in range(2)]
+    for proc in procs:
+      pool.release(proc)
+    self.assertFalse(procs[0].closed)
+    self.assertTrue(procs[1].closed)
+    pool.close()
+    self.assertTrue(procs[0].closed)
+
+  def testReleaseUnknownProcess(self):
+    with self.assertRaises(ValueError):
+      self._pool.release(_FakeProcess(self._server))
+
+
+if __name__ == "__main__":
+  absltest.main()
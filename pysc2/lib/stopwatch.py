@@ -15,6 +15,7 @@
 
 import collections
 import functools
+import json
 import math
 import os
 import sys
@@ -119,6 +120,36 @@ class TracingStopWatchContext(StopWatchContext):
     print(s, file=sys.stderr)
 
 
+class TimelineStopWatchContext(StopWatchContext):
+  """Time an individual call, and record it in the timeline."""
+  __slots__ = ()
+
+  def __exit__(self, unused_exception_type, unused_exc_value, unused_traceback):
+    end = time.time()
+    name = self._sw.pop()
+    self._sw.add(name, end - self._start)
+    self._sw.add_event(name, self._start, end - self._start)
+
+
+class SkipStopWatchContext(object):
+  """Track the stack for an unsampled call, but only count it.
+
+  Nested sampled calls still get the right name. It has no per-call state, so
+  a single instance per name is reused.
+  """
+  __slots__ = ("_sw", "_name")
+
+  def __init__(self, stopwatch, name):
+    self._sw = stopwatch
+    self._name = name
+
+  def __enter__(self):
+    self._sw.push(self._name)
+
+  def __exit__(self, unused_exception_type, unused_exc_value, unused_traceback):
+    self._sw.skip(self._sw.pop())
+
+
 class FakeStopWatchContext(object):
   """A fake stopwatch context for when the stopwatch is too slow or unneeded."""
   __slots__ = ()
@@ -147,12 +178,31 @@ class StopWatch(object):
         pass
       func()
       print(sw)
+
+  To keep it on in production, time only some of the calls:
+      sw.sample(every=100)
+      sw.start_export("/tmp/stopwatch.prom", interval=60, fmt="prometheus")
+
+  To see a per thread timeline of the latest calls:
+      sw.timeline(max_events=100000)
+      ...
+      sw.dump_timeline("/tmp/trace.json")
   """
-  __slots__ = ("_times", "_local", "_factory")
+  __slots__ = ("_times", "_skipped", "_local", "_factory", "_keys",
+               "_exporter", "_stop_export", "_thread_names", "events")
 
   def __init__(self, enabled=True, trace=False):
     self._times = collections.defaultdict(Stat)
+    self._skipped = collections.defaultdict(int)  # Unsampled calls per name.
     self._local = threading.local()
+    self._keys = {}  # (parent key, name) -> key, so keys are built once.
+    self._exporter = None
+    self._stop_export = None
+    # (name, thread id, start, duration) of the latest calls, for `timeline`.
+    self.events = collections.deque(maxlen=0)
+    # Thread id -> name, recorded with each thread's first event, as threads
+    # that have exited by `dump_timeline` can't be looked up any more.
+    self._thread_names = {}
     if trace:
       self.trace()
     elif enabled:
@@ -169,6 +219,89 @@ class StopWatch(object):
   def trace(self):
     self._factory = lambda name: TracingStopWatchContext(self, name)
 
+  def timeline(self, max_events=100000):
+    """Time every call, and keep the latest in a buffer for `dump_timeline`.
+
+    The buffer is bounded so this can be left on for a while in a live run.
+
+    Args:
+      max_events: How many of the most recent calls to keep.
+    """
+    if self.events.maxlen != max_events:
+      self.events = collections.deque(self.events, maxlen=max_events)
+    self._factory = lambda name: TimelineStopWatchContext(self, name)
+
+  def dump_timeline(self, path):
+    """Write the recorded calls in the Chrome trace event format.
+
+    Load it in chrome://tracing or https://ui.perfetto.dev to see a per thread
+    timeline of the calls.
+
+    Args:
+      path: The json file to write.
+    """
+    pid = os.getpid()
+    events = list(self.events)
+    thread_names = dict(self._thread_names)
+    trace = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+              "args": {"name": thread_names.get(tid, str(tid))}}
+             for tid in sorted({tid for _, tid, _, _ in events})]
+    for name, tid, start, duration in events:
+      trace.append({
+          "name": name.rsplit(".", 1)[-1],
+          "cat": "stopwatch",
+          "ph": "X",  # A complete event, ie both begin and end.
+          "pid": pid,
+          "tid": tid,
+          "ts": start * 1e6,
+          "dur": duration * 1e6,
+          "args": {"stack": name},
+      })
+    with open(path, "w") as f:
+      json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+  def sample(self, every=100, interval=None):
+    """Only time some of the calls, to keep the overhead low.
+
+    The stats are of the sampled calls only, so `num` and `sum` are lower than
+    when timing every call, but the averages and relative times still hold.
+    The unsampled calls are counted though, and `to_json` and `to_prometheus`
+    scale `num` and `sum` up to all the calls, so rates stay right.
+
+    Args:
+      every: Time 1 in `every` calls of each name.
+      interval: If set, instead time a call to each name at most once every
+          `interval` seconds.
+    """
+    skips = {}
+    if interval is None:
+      counts = collections.Counter()
+
+      def factory(name):
+        # Races between threads only change which calls are sampled.
+        counts[name] += 1
+        if counts[name] % every == 0:
+          return StopWatchContext(self, name)
+        try:
+          return skips[name]
+        except KeyError:
+          skip = skips[name] = SkipStopWatchContext(self, name)
+          return skip
+    else:
+      next_sample = {}
+
+      def factory(name):
+        now = time.time()
+        if now >= next_sample.get(name, 0):
+          next_sample[name] = now + interval
+          return StopWatchContext(self, name)
+        try:
+          return skips[name]
+        except KeyError:
+          skip = skips[name] = SkipStopWatchContext(self, name)
+          return skip
+    self._factory = factory
+
   def custom(self, factory):
     self._factory = factory
 
@@ -210,27 +343,50 @@ class StopWatch(object):
       return lambda func: decorator(name_or_func, func)
 
   def push(self, name):
+    """Push a name, keeping the full dotted key of the stack."""
     try:
-      self._local.stack.append(name)
+      stack = self._local.stack
     except AttributeError:
       # Using an exception is faster than using hasattr.
-      self._local.stack = [name]
+      stack = self._local.stack = []
+    parent = stack[-1] if stack else None
+    try:
+      key = self._keys[(parent, name)]
+    except KeyError:
+      key = self._keys[(parent, name)] = (
+          name if parent is None else parent + "." + name)
+    stack.append(key)
 
   def pop(self):
-    stack = self._local.stack
-    ret = ".".join(stack)
-    stack.pop()
-    return ret
+    return self._local.stack.pop()
 
   def cur_stack(self):
-    return ".".join(self._local.stack)
+    stack = getattr(self._local, "stack", None)
+    return stack[-1] if stack else ""
 
   def clear(self):
     self._times.clear()
+    self._skipped.clear()
 
   def add(self, name, duration):
     self._times[name].add(duration)
 
+  def add_event(self, name, start, duration):
+    """Record a call in the timeline."""
+    tid = threading.get_ident()
+    try:
+      self._local.named
+    except AttributeError:
+      # The first event from this thread. Thread ids can be reused once a
+      # thread exits, so this is per thread rather than per id.
+      self._local.named = True
+      self._thread_names[tid] = threading.current_thread().name
+    self.events.append((name, tid, start, duration))
+
+  def skip(self, name):
+    """Count a call that wasn't timed, ie wasn't sampled."""
+    self._skipped[name] += 1
+
   def __getitem__(self, name):
     return self._times[name]
 
@@ -241,6 +397,98 @@ class StopWatch(object):
   def merge(self, other):
     for k, v in other.times.items():
       self._times[k].merge(v)
+    for k, v in other._skipped.items():  # pylint: disable=protected-access
+      self._skipped[k] += v
+
+  def _all_calls(self):
+    """The timed stats by name, with `num` and `sum` scaled to all calls."""
+    skipped = dict(self._skipped)
+    out = []
+    for k, v in sorted(dict(self._times).items()):
+      if not v.num:
+        continue
+      if skipped.get(k):
+        scale = (v.num + skipped[k]) / v.num
+        stat = Stat()
+        stat.merge(v)
+        stat.num += skipped[k]
+        stat.sum *= scale
+        stat.sum_sq *= scale
+        v = stat
+      out.append((k, v))
+    return out
+
+  def to_json(self):
+    """Return the timings as a json string."""
+    return json.dumps({
+        k: {"sum": v.sum, "avg": v.avg, "dev": v.dev, "min": v.min,
+            "max": v.max, "num": v.num}
+        for k, v in self._all_calls()})
+
+  def to_prometheus(self, metric="pysc2_stopwatch_seconds"):
+    """Return the timings in the Prometheus text exposition format.
+
+    Each metric family's samples are grouped after its TYPE line, as the format
+    requires: a summary of the sum and count, then gauges of the min and max.
+
+    Args:
+      metric: The name of the summary, and prefix of the gauges.
+    """
+    times = [(k.replace("\\", "\\\\").replace('"', '\\"'), v)
+             for k, v in self._all_calls()]
+    lines = ["# TYPE %s summary" % metric]
+    for k, v in times:
+      lines.append('%s_sum{name="%s"} %r' % (metric, k, v.sum))
+      lines.append('%s_count{name="%s"} %d' % (metric, k, v.num))
+    for suffix in ("min", "max"):
+      lines.append("# TYPE %s_%s gauge" % (metric, suffix))
+      for k, v in times:
+        lines.append('%s_%s{name="%s"} %r' % (metric, suffix, k,
+                                             getattr(v, suffix)))
+    return "\n".join(lines) + "\n"
+
+  def export(self, path, fmt="json"):
+    """Write the timings to `path`, atomically replacing the previous ones.
+
+    Args:
+      path: The file to write.
+      fmt: "json", "prometheus" or "text".
+    """
+    if fmt == "json":
+      out = self.to_json()
+    elif fmt == "prometheus":
+      out = self.to_prometheus()
+    elif fmt == "text":
+      out = self.str()
+    else:
+      raise ValueError("Unknown stopwatch export format: %s" % fmt)
+    tmp_path = "%s.%s.tmp" % (path, os.getpid())
+    with open(tmp_path, "w") as f:
+      f.write(out)
+    os.replace(tmp_path, path)
+
+  def start_export(self, path, interval=60, fmt="json"):
+    """Export the timings every `interval` seconds in a background thread."""
+    self.stop_export()
+    stop = threading.Event()
+
+    def run():
+      while not stop.wait(interval):
+        self.export(path, fmt)
+      self.export(path, fmt)
+
+    self._stop_export = stop
+    self._exporter = threading.Thread(target=run, name="stopwatch_export",
+                                      daemon=True)
+    self._exporter.start()
+
+  def stop_export(self):
+    """Stop the periodic export, after writing the latest timings."""
+    if self._exporter:
+      self._stop_export.set()
+      self._exporter.join()
+      self._exporter = None
+      self._stop_export = None
 
   @staticmethod
   def parse(s):
@@ -14,7 +14,10 @@
 # limitations under the License.
 """Tests for stopwatch."""
 
+import json
 import os
+import tempfile
+import threading
 
 from absl.testing import absltest
 
@@ -112,6 +115,138 @@ class StopwatchTest(absltest.TestCase):
     self.assertNotEqual(round, sw.decorate(round))
     self.assertNotEqual(round, sw.decorate("name")(round))
 
+  def testSample(self):
+    sw = stopwatch.StopWatch()
+    sw.sample(every=10)
+    for _ in range(100):
+      with sw("outer"):
+        with sw("inner"):
+          pass
+    self.assertEqual(sw["outer"].num, 10)
+    self.assertEqual(sw["outer.inner"].num, 10)
+    self.assertNotIn("inner", sw.times)
+    self.assertEqual(sw.cur_stack(), "")
+
+  @mock.patch("time.time")
+  def testSampleInterval(self, mock_time):
+    mock_time.return_value = 0
+    sw = stopwatch.StopWatch()
+    sw.sample(interval=1)
+    for _ in range(20):
+      mock_time.return_value += 0.25
+      with sw("name"):
+        pass
+    self.assertEqual(sw["name"].num, 5)
+
+  @mock.patch("time.time")
+  def testSampleExportsAllCalls(self, mock_time):
+    mock_time.return_value = 0
+    sw = stopwatch.StopWatch()
+    sw.sample(every=10)
+    for _ in range(100):
+      with sw("name"):
+        mock_time.return_value += 2
+    self.assertEqual(sw["name"].num, 10)  # Only the sampled calls are timed.
+
+    timings = json.loads(sw.to_json())["name"]
+    self.assertEqual(timings["num"], 100)
+    self.assertEqual(timings["sum"], 200)
+    self.assertEqual(timings["avg"], 2)
+    self.assertEqual(timings["dev"], 0)
+    prom = sw.to_prometheus("t")
+    self.assertIn('t_sum{name="name"} 200.0\n', prom)
+    self.assertIn('t_count{name="name"} 100\n', prom)
+
+  def testPrometheusGroupsFamilies(self):
+    sw = stopwatch.StopWatch()
+    sw.add("a", 1)
+    sw.add("a", 3)
+    sw.add('b"', 2)
+    self.assertEqual(sw.to_prometheus("t"), "\n".join([
+        "# TYPE t summary",
+        't_sum{name="a"} 4',
+        't_count{name="a"} 2',
+        't_sum{name="b\\""} 2',
+        't_count{name="b\\""} 1',
+        "# TYPE t_min gauge",
+        't_min{name="a"} 1',
+        't_min{name="b\\""} 2',
+        "# TYPE t_max gauge",
+        't_max{name="a"} 3',
+        't_max{name="b\\""} 2',
+    ]) + "\n")
+
+  def testExport(self):
+    sw = stopwatch.StopWatch()
+    with sw("a"):
+      with sw("b"):
+        pass
+    path = os.path.join(tempfile.mkdtemp(), "stopwatch")
+
+    sw.export(path, "json")
+    with open(path) as f:
+      timings = json.load(f)
+    self.assertCountEqual(timings, ["a", "a.b"])
+    self.assertEqual(timings["a.b"]["num"], 1)
+
+    sw.export(path, "prometheus")
+    with open(path) as f:
+      prom = f.read()
+    self.assertIn('pysc2_stopwatch_seconds_count{name="a.b"} 1\n', prom)
+
+    sw.export(path, "text")
+    with open(path) as f:
+      self.assertEqual(f.read(), sw.str())
+
+    with self.assertRaises(ValueError):
+      sw.export(path, "xml")
+
+  def testPeriodicExport(self):
+    sw = stopwatch.StopWatch()
+    path = os.path.join(tempfile.mkdtemp(), "stopwatch.json")
+    sw.start_export(path, interval=1000)
+    with sw("name"):
+      pass
+    sw.stop_export()  # Writes the latest timings.
+    with open(path) as f:
+      self.assertEqual(json.load(f)["name"]["num"], 1)
+
+  @mock.patch("time.time")
+  def testTimeline(self, mock_time):
+    mock_time.return_value = 0
+    sw = stopwatch.StopWatch()
+    sw.timeline(max_events=3)
+
+    def run():
+      for _ in range(2):
+        with sw("outer"):
+          mock_time.return_value += 1
+          with sw("inner"):
+            mock_time.return_value += 2
+
+    thread = threading.Thread(target=run, name="worker")
+    thread.start()
+    thread.join()
+    self.assertLen(sw.events, 3)  # The oldest is dropped.
+    self.assertEqual(sw["outer"].num, 2)
+
+    path = os.path.join(tempfile.mkdtemp(), "trace.json")
+    sw.dump_timeline(path)
+    with open(path) as f:
+      events = json.load(f)["traceEvents"]
+    calls = [e for e in events if e["ph"] == "X"]
+    self.assertEqual([e["name"] for e in calls], ["outer", "inner", "outer"])
+    self.assertEqual(calls[0]["args"]["stack"], "outer")
+    self.assertEqual(calls[1]["args"]["stack"], "outer.inner")
+    self.assertEqual(calls[0]["ts"], 0)
+    self.assertEqual(calls[0]["dur"], 3e6)
+    self.assertEqual(calls[1]["ts"], 4e6)
+    self.assertEqual(calls[2]["ts"], 3e6)
+    self.assertEqual({e["tid"] for e in calls}, {thread.ident})
+    # The name is kept even though the thread finished before the dump.
+    self.assertEqual(
+        [e["args"]["name"] for e in events if e["ph"] == "M"], ["worker"])
+
   def testSpeed(self):
     count = 100
 
@@ -130,6 +265,15 @@ class StopwatchTest(absltest.TestCase):
       with sw("trace"):
         run()
 
+      sw.enable()  # Time every "sample", but only some of the calls in it.
+      with sw("sample"):
+        sw.sample(every=10)
+        run()
+
+      sw.timeline()
+      with sw("timeline"):
+        run()
+
       sw.enable()  # To catch "disabled".
       with sw("disabled"):
         sw.disable()
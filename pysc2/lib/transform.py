@@ -25,6 +25,7 @@ transform to create `a_to_c`.
 
 import numbers
 
+import numpy as np
 from pysc2.lib import point
 
 
@@ -43,6 +44,14 @@ class Transform(object):
   def back_pt(self, pt):
     raise NotImplementedError()
 
+  def fwd_pts(self, pts):
+    """Like `fwd_pt`, but for an (n, 2) numpy array of x,y points."""
+    raise NotImplementedError()
+
+  def back_pts(self, pts):
+    """Like `back_pt`, but for an (n, 2) numpy array of x,y points."""
+    raise NotImplementedError()
+
 
 class Linear(Transform):
   """A linear transform with a scale and offset."""
@@ -69,6 +78,12 @@ class Linear(Transform):
   def back_pt(self, pt):
     return (pt - self.offset) / self.scale
 
+  def fwd_pts(self, pts):
+    return pts * np.array(self.scale) + np.array(self.offset)
+
+  def back_pts(self, pts):
+    return (pts - np.array(self.offset)) / np.array(self.scale)
+
   def __str__(self):
     return "Linear(scale=%s, offset=%s)" % (self.scale, self.offset)
 
@@ -99,6 +114,16 @@ class Chain(Transform):
       pt = transform.back_pt(pt)
     return pt
 
+  def fwd_pts(self, pts):
+    for transform in self.transforms:
+      pts = transform.fwd_pts(pts)
+    return pts
+
+  def back_pts(self, pts):
+    for transform in reversed(self.transforms):
+      pts = transform.back_pts(pts)
+    return pts
+
   def __str__(self):
     return "Chain(%s)" % (self.transforms,)
 
@@ -118,6 +143,12 @@ class PixelToCoord(Transform):
   def back_pt(self, pt):
     return pt.floor() + 0.5
 
+  def fwd_pts(self, pts):
+    return np.floor(pts).astype(np.int64)
+
+  def back_pts(self, pts):
+    return np.floor(pts) + 0.5
+
   def __str__(self):
     return "PixelToCoord()"
 
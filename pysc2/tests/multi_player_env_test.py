@@ -74,6 +74,21 @@ class TestMultiplayerEnv(parameterized.TestCase, utils.TestCase):
       ]
       run_loop.run_loop(agents, env, steps)
 
+  def test_multi_player_env_pipelined(self):
+    steps = 100
+    step_mul = 16
+    with sc2_env.SC2Env(
+        map_name="Simple64",
+        players=[sc2_env.Agent(sc2_env.Race.random, "random"),
+                 sc2_env.Agent(sc2_env.Race.random, "random")],
+        step_mul=step_mul,
+        game_steps_per_episode=steps * step_mul // 2,
+        agent_interface_format=sc2_env.AgentInterfaceFormat(
+            feature_dimensions=sc2_env.Dimensions(screen=84, minimap=64)),
+        pipelined_step=True) as env:
+      agents = [random_agent.RandomAgent(), random_agent.RandomAgent()]
+      run_loop.run_loop(agents, env, steps)
+
 
 if __name__ == "__main__":
   absltest.main()